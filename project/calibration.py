@@ -0,0 +1,117 @@
+#! pylint: disable=line-too-long
+
+"""
+Persistent calibration results.
+
+The results of the interactive calibrations are stored in a JSON file together with when they were measured and which
+truck, device and port they belong to, so the robot can restore them at startup instead of asking for calibration again.
+A stored result is only used while it is fresh, belongs to the same device and passes a quick sanity check.
+
+The EV3 has no real time clock. Without a network to set the time from, ev3dev starts the clock at the time the brick was
+last shut down, so the age of a result only counts the time the brick was running and a result measured before the
+brick was switched off overnight still looks fresh. Freshness is a bound on the running time, not on the time of day:
+the sanity checks, which measure the devices again, are what catches a result that no longer holds.
+"""
+
+import json
+import os
+import time
+
+CALIBRATION_FILE = "calibration.json"
+"""default path of the calibration store"""
+
+MAX_AGE = 12 * 60 * 60
+"""seconds a calibration result stays valid, a shift of running time as the brick has no real time clock"""
+
+LIFT_RANGE = (20, 400)
+"""plausible range of lift_max_angle in degrees"""
+
+AMBIENT_TOLERANCE = 10
+"""largest difference in % between the stored and the current ambient light"""
+
+def _check_lift(robot, value):
+    """returns True if the lift angle is plausible"""
+    # pylint: disable=unused-argument
+    return LIFT_RANGE[0] <= value <= LIFT_RANGE[1]
+
+def _check_ambient(robot, value):
+    """returns True if the ambient light has not changed much since it was calibrated"""
+    robot.sensors.invalidate("ambient")
+    return abs(robot.sensors.read("ambient") - value) <= AMBIENT_TOLERANCE
+
+CHECKS = {
+    "lift_max_angle": ("lift_motor", _check_lift),
+    "AMBIENT_LIGHT": ("light_sensor", _check_ambient),
+}
+"""device and sanity check of every calibrated robot attribute"""
+
+def host_name():
+    """returns the host name of the brick, telling the trucks apart"""
+    try:
+        return os.uname()[1]
+    except AttributeError:
+        return "unknown"
+
+class CalibrationStore:
+    """
+    calibration results by robot attribute, each a dict with the value, the time it was measured and the device identity
+    """
+    def __init__(self, path=CALIBRATION_FILE, max_age=MAX_AGE, clock=time.time):
+        """
+        Paramaters:
+        path: JSON file the results are kept in
+        max_age: seconds a result stays valid
+        clock: function returning the current time in seconds, see the module docstring for what it measures on the brick
+        """
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """reads the stored results, a missing or damaged file holds none"""
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            entries = {}
+        self.entries = entries if isinstance(entries, dict) else {}
+
+    def save(self):
+        """writes the results to the file"""
+        with open(self.path, "w") as file:
+            json.dump(self.entries, file)
+
+    def identity(self, robot, attribute):
+        """returns what a result of an attribute belongs to: the truck, the device and its port"""
+        device = CHECKS[attribute][0]
+        return {"host": host_name(), "device": device, "port": robot.PORTS[device]}
+
+    def put(self, robot, attribute, value):
+        """records a calibration result measured now"""
+        entry = {"value": value, "time": self.clock()}
+        entry.update(self.identity(robot, attribute))
+        self.entries[attribute] = entry
+
+    def problem(self, robot, attribute):
+        """returns why the stored result of an attribute can not be used, None if it can"""
+        entry = self.entries.get(attribute)
+        if not isinstance(entry, dict) or entry.get("value") is None:
+            return "missing"
+        for key, value in self.identity(robot, attribute).items():
+            if entry.get(key) != value:
+                return "different " + key
+        age = self.clock() - entry.get("time", 0)
+        if age < 0 or age > self.max_age:
+            return "stale"
+        if not CHECKS[attribute][1](robot, entry["value"]):
+            return "sanity check failed"
+        return None
+
+    def restore(self, robot, attribute):
+        """sets the attribute of the robot to the stored result if it can be used, returns the problem otherwise"""
+        problem = self.problem(robot, attribute)
+        if problem is None:
+            setattr(robot, attribute, self.entries[attribute]["value"])
+        return problem
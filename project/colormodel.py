@@ -0,0 +1,196 @@
+#! pylint: disable=line-too-long
+
+"""
+Adaptive color model.
+
+Every enviroment color is a centroid with a spread per channel, starting at the constants in enviroment.py.
+Readouts that are classified with high confidence move the centroid of their color, so the model follows changes in
+lighting and sensor height. The statistics are running means and variances that forget old samples at a fixed rate,
+so the memory they need does not grow, and they are saved between runs.
+Classification gives the posterior probability of the winning color, so commands can act on a confident readout
+right away and wait for more readouts when the colors are close.
+"""
+
+import json
+import math
+
+import enviroment as env
+
+INITIAL_SPREAD = 4.0
+"""standard deviation in % of every channel before any samples are seen"""
+MIN_VARIANCE = 1.0
+"""smallest variance of a channel, keeps a color that always reads the same from becoming infinitely narrow"""
+MEMORY = 200
+"""number of recent samples the statistics of a color are effectively made of"""
+PRIOR_SAMPLES = 10
+"""weight of the reference constants in samples, the first readouts can not move a centroid far"""
+LEARN_CONFIDENCE = 0.95
+"""confidence a readout needs to update the model"""
+GATE = 16.0
+"""largest squared normalized distance from the centroid of a sample that updates it, rejects outliers"""
+
+class ColorModel:
+    """
+    per color running mean and variance of sensor readouts with a fixed number of dimensions
+    """
+    def __init__(self, references, names=env.color_names, spread=INITIAL_SPREAD, memory=MEMORY):
+        """
+        Paramaters:
+        references: reference readout of every color, tuples of equal length
+        names: name of every color
+        spread: initial standard deviation of every channel
+        memory: number of recent samples the statistics are made of
+        """
+        self.names = tuple(names)
+        self.dims = len(references[0])
+        self.memory = memory
+        self.mean = [float(value) for reference in references for value in reference]
+        self.variance = [float(spread * spread)] * len(self.mean)
+        self.count = [PRIOR_SAMPLES] * len(self.names)
+        self._log_spread = [0.0] * len(self.names)
+        for i in range(len(self.names)):
+            self._update_log_spread(i)
+
+    def _update_log_spread(self, index):
+        """caches half the log of the product of a color's variances"""
+        start = index * self.dims
+        self._log_spread[index] = 0.5 * sum(math.log(variance) for variance in self.variance[start:start + self.dims])
+
+    def _distances(self, sample):
+        """returns the squared normalized distance of a sample from every centroid"""
+        dims = self.dims
+        mean = self.mean
+        variance = self.variance
+        distances = []
+        for i in range(len(self.names)):
+            distance = 0.0
+            start = i * dims
+            for d in range(dims):
+                delta = sample[d] - mean[start + d]
+                distance += delta * delta / variance[start + d]
+            distances.append(distance)
+        return distances
+
+    def classify(self, sample):
+        """returns the index of the most likely color of a readout and its probability"""
+        return self._posterior(self._distances(sample))
+
+    def _posterior(self, distances):
+        """returns the index of the most likely color and its probability given the distances of a readout"""
+        scores = [-0.5 * distance - log_spread for distance, log_spread in zip(distances, self._log_spread)]
+        best = 0
+        for i in range(1, len(scores)):
+            if scores[i] > scores[best]:
+                best = i
+        total = 0.0
+        for score in scores:
+            total += math.exp(score - scores[best])
+        return best, 1 / total
+
+    def name(self, sample):
+        """returns the name of the most likely color of a readout"""
+        return self.names[self.classify(sample)[0]]
+
+    def learn(self, index, sample):
+        """moves the statistics of a color towards a sample"""
+        count = min(self.count[index] + 1, self.memory)
+        self.count[index] = count
+        weight = 1 / count
+        start = index * self.dims
+        for d in range(self.dims):
+            delta = sample[d] - self.mean[start + d]
+            self.mean[start + d] += weight * delta
+            self.variance[start + d] = max(MIN_VARIANCE, (1 - weight) * (self.variance[start + d] + weight * delta * delta))
+        self._update_log_spread(index)
+
+    def update(self, sample, min_confidence=LEARN_CONFIDENCE):
+        """classifies a readout and learns from it if it is confident and no outlier, returns the index and confidence"""
+        distances = self._distances(sample)
+        index, confidence = self._posterior(distances)
+        if confidence >= min_confidence and distances[index] <= GATE:
+            self.learn(index, sample)
+        return index, confidence
+
+    def centroid(self, index):
+        """returns the mean readout of a color"""
+        start = index * self.dims
+        return tuple(self.mean[start:start + self.dims])
+
+    def spread(self, index):
+        """returns the standard deviation of every channel of a color"""
+        start = index * self.dims
+        return tuple(math.sqrt(variance) for variance in self.variance[start:start + self.dims])
+
+    def to_dict(self):
+        """returns the model as a JSON serializable dict"""
+        return {"names": list(self.names), "dims": self.dims, "mean": self.mean, "variance": self.variance, "count": self.count}
+
+    def from_dict(self, data):
+        """takes over the statistics of a dict from to_dict, returns False and keeps the current ones if they do not fit"""
+        size = len(self.names) * self.dims
+        if not isinstance(data, dict) or data.get("names") != list(self.names) or data.get("dims") != self.dims:
+            return False
+        mean, variance, count = data.get("mean"), data.get("variance"), data.get("count")
+        if not (isinstance(mean, list) and isinstance(variance, list) and isinstance(count, list)) or len(mean) != size or len(variance) != size or len(count) != len(self.names):
+            return False
+        self.mean = [float(value) for value in mean]
+        self.variance = [max(MIN_VARIANCE, float(value)) for value in variance]
+        self.count = [min(int(value), self.memory) for value in count]
+        for i in range(len(self.names)):
+            self._update_log_spread(i)
+        return True
+
+    def save(self, path):
+        """writes the model to a JSON file"""
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    def load(self, path):
+        """reads the model from a JSON file, returns False and keeps the current statistics if it is missing or does not fit"""
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return self.from_dict(data)
+
+def rgb_model(**kwargs):
+    """returns a model of the rgb readouts of the enviroment colors"""
+    return ColorModel(env.rgb_list, **kwargs)
+
+def reflection_model(**kwargs):
+    """returns a model of the reflection readouts of the enviroment colors, samples are 1-tuples"""
+    return ColorModel([(value,) for value in env.reflection_list], **kwargs)
+
+class ColorChange:
+    """
+    detects when the color under the sensor changes from a starting color,
+    summing the confidence of consecutive readouts of another color until it reaches the evidence needed
+    """
+    def __init__(self, model, start, evidence=0.9, learn=True):
+        """
+        Paramaters:
+        model: ColorModel the readouts are classified with
+        start: readout of the starting color
+        evidence: summed confidence needed, one readout this confident is enough, unsure readouts need company
+        learn: update the model with confident readouts
+        """
+        self.model = model
+        self.start = model.classify(start)[0]
+        self.evidence = evidence
+        self.learn = learn
+        self.seen = 0.0
+        self.color = None
+        """index of the color changed to, None until the change is detected"""
+
+    def update(self, sample):
+        """feeds a readout, returns True once the color has changed"""
+        index, confidence = self.model.update(sample) if self.learn else self.model.classify(sample)
+        if index == self.start:
+            self.seen = 0.0
+            return False
+        self.seen += confidence
+        if self.seen >= self.evidence:
+            self.color = index
+            return True
+        return False
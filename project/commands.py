@@ -5,13 +5,75 @@
 """Collection of commands for the robot."""
 
 from collections import deque
+import json
 
 from pybricks.parameters import Stop, Button
-from pybricks.tools import wait
+from pybricks.tools import wait, StopWatch
 
 from robot import Robot
+from timing import FixedRateLoop, SKIP
+from colormodel import ColorChange
+from filters import Debounce
+from tracker import ObstacleTracker
 import enviroment as env
 
+PARAMETERS = {}
+"""tuned parameters by command class name, filled by load_parameters and used by Base.tuned"""
+
+def load_parameters(path):
+    """loads tuned parameters written by tuning.py, commands created with tuned() use them"""
+    with open(path) as file:
+        PARAMETERS.update(json.load(file))
+
+class Hook:
+    """
+    receives the start, ticks and end of every command run through a queue, group or run(),
+    subclass it and register it with add_hook
+    """
+    def command_started(self, command, parent):
+        """called when a command starts, parent is the queue or command running it, None at the top"""
+
+    def command_ticked(self, command, parent):
+        """called every time a command finishes a step"""
+
+    def command_finished(self, command, parent):
+        """called when a command ends, also when it is stopped or raises"""
+
+HOOKS = []
+"""registered Hook objects"""
+
+def add_hook(hook):
+    """subscribe a Hook to the command events"""
+    HOOKS.append(hook)
+    return hook
+
+def remove_hook(hook):
+    """unsubscribe a Hook"""
+    HOOKS.remove(hook)
+
+def steps_of(command, robot, parent=None):
+    """
+    returns the steps of a command, reporting them to the hooks if there are any,
+    queues, groups and commands that run other commands use it so the hooks see the whole tree
+    """
+    if not HOOKS:
+        return command.steps(robot)
+    return _hooked_steps(command, robot, parent)
+
+def _hooked_steps(command, robot, parent):
+    """the steps of a command with the hooks called around them"""
+    hooks = list(HOOKS)
+    for hook in hooks:
+        hook.command_started(command, parent)
+    try:
+        for _ in command.steps(robot):
+            for hook in hooks:
+                hook.command_ticked(command, parent)
+            yield
+    finally:
+        for hook in hooks:
+            hook.command_finished(command, parent)
+
 class Base:
     """
     A unifying interface for all commands
@@ -20,13 +82,54 @@ class Base:
         self.name = name
 
     def run(self, robot: Robot):
-        """run the command"""
-        raise NotImplementedError
+        """run the command, commands override either run or steps"""
+        for _ in steps_of(self, robot):
+            pass
+
+    def steps(self, robot: Robot):
+        """
+        generator that runs the command one tick per step so it can share the robot with other commands,
+        commands that only override run block for their whole duration in a single step
+        """
+        if type(self).run is Base.run:
+            raise NotImplementedError(type(self).__name__ + " must override run or steps")
+        self.run(robot)
+        yield from ()
+
+    def stop(self, robot: Robot):
+        """called when the command is cancelled before it finished, stops the motors it started"""
+
+    @classmethod
+    def tuned(cls, *args, **kwargs):
+        """creates the command with the loaded tuned parameters, explicit arguments take precedence"""
+        parameters = dict(PARAMETERS.get(cls.__name__, {}))
+        parameters.update(kwargs)
+        return cls(*args, **parameters)
 
     def __str__(self):
         """return the name of the command"""
         return self.name
 
+def _advance(step):
+    """runs one tick of a command's steps, returns False when the command has finished"""
+    try:
+        next(step)
+    except StopIteration:
+        return False
+    return True
+
+def _reader(source, default):
+    """
+    returns the function a command reads its sensor with: the source if there is one, reset so no state carries over
+    from an earlier command using it, otherwise the default sensor method
+    """
+    if source is None:
+        return default
+    reset = getattr(source, "reset", None)
+    if reset is not None:
+        reset()
+    return source
+
 class Queue(deque):
     """
     A first-in first-out queue of commands
@@ -34,11 +137,31 @@ class Queue(deque):
     def __init__(self, name="Command_Queue"):
         super().__init__()
         self.name = name
+        self.current = None
+        """the command that is running"""
+
+    def __str__(self):
+        """return the name of the queue"""
+        return self.name
 
     def run(self, robot: Robot):
-        """Runs the commands in order removing them from the queue"""
+        """Runs the commands in order removing them from the queue, then writes the pending log records"""
+        for _ in steps_of(self, robot):
+            pass
+        robot.log.flush()
+
+    def steps(self, robot: Robot):
+        """Runs the commands in order one tick at a time removing them from the queue"""
         while len(self) > 0:
-            self.popleft().run(robot)
+            self.current = self.popleft()
+            yield from steps_of(self.current, robot, self)
+            robot.log.poll()
+        self.current = None
+
+    def stop(self, robot: Robot):
+        """stops the command that is running when the queue is cancelled"""
+        if self.current is not None:
+            self.current.stop(robot)
 
     def tree(self, indent=0):
         """prints the command queue as a tree"""
@@ -51,13 +174,115 @@ class Queue(deque):
 
     def tree_str(self, indent=0):
         """returns the command queue as a tree"""
-        output = "\t" * (indent) + self.name + ": \n"
+        lines = []
+        self._tree_lines(indent, lines)
+        return "\n".join(lines) + "\n"
+
+    def _tree_lines(self, indent, lines):
+        """appends the lines of the tree to lines"""
+        lines.append("\t" * (indent) + self.name + ": ")
         for command in self:
             if isinstance(command, Queue):
-                output += command.tree_str(indent=indent+1)
+                command._tree_lines(indent + 1, lines)  # pylint: disable=protected-access
             else:
-                output += "\t" * (indent + 1) + str(command) + "\n"
-        return output
+                lines.append("\t" * (indent + 1) + str(command))
+
+class Parallel(Queue):
+    """
+    A group of commands that run at the same time, one tick each in turn, until all of them have finished
+    """
+    def __init__(self, name="Command_Parallel", rate=None):
+        """
+        Paramaters:
+        name: name of the group
+        rate: tick rate of the group in Hz, None runs as fast as possible
+        """
+        super().__init__(name=name)
+        self.loop = FixedRateLoop(rate)
+        self.running = []
+        """(command, steps) of the commands that have not finished"""
+
+    def steps(self, robot: Robot):
+        """Runs one tick of every unfinished command per step"""
+        self.running = []
+        while len(self) > 0:
+            command = self.popleft()
+            self.running.append((command, steps_of(command, robot, self)))
+        self.loop.start()
+        while self.running:
+            self.loop.tick()
+            self.running = [(command, step) for command, step in self.running if _advance(step)]
+            yield
+
+    def stop(self, robot: Robot):
+        """stops the commands that are running when the group is cancelled"""
+        for command, _ in self.running:
+            command.stop(robot)
+
+class Race(Parallel):
+    """
+    A group of commands that run at the same time until the first of them finishes, the others are then stopped
+    """
+    def __init__(self, name="Command_Race", rate=None):
+        super().__init__(name=name, rate=rate)
+
+    def steps(self, robot: Robot):
+        """Runs one tick of every command per step until one of them finishes"""
+        self.running = []
+        while len(self) > 0:
+            command = self.popleft()
+            self.running.append((command, steps_of(command, robot, self)))
+        self.loop.start()
+        while self.running:
+            self.loop.tick()
+            for i, (_, step) in enumerate(self.running):
+                if not _advance(step):
+                    del self.running[i]
+                    for other, other_step in self.running:
+                        other_step.close()
+                        other.stop(robot)
+                    self.running = []
+                    return
+            yield
+
+class Wait(Base):
+    """
+    waits for a duration without blocking the other commands in a group
+    """
+    def __init__(self, duration, name="Wait"):
+        """
+        Paramaters:
+        duration: time to wait in ms
+        """
+        super().__init__(name=name)
+        self.duration = duration
+
+    def steps(self, robot: Robot):
+        watch = StopWatch()
+        while watch.time() < self.duration:
+            yield
+
+class MoveLift(Base):
+    """
+    moves the lift to an angle without blocking, so the lift can move while the robot drives
+    """
+    def __init__(self, angle, name="Move Lift", speed=50):
+        """
+        Paramaters:
+        angle: target angle of the lift motor in degrees
+        speed: speed of the lift motor in deg/s
+        """
+        super().__init__(name=name)
+        self.angle = angle
+        self.speed = speed
+
+    def stop(self, robot: Robot):
+        robot.lift_motor.stop()
+
+    def steps(self, robot: Robot):
+        robot.lift_motor.run_target(self.speed, self.angle, then=Stop.HOLD, wait=False)
+        while not robot.lift_motor.control.done():
+            yield
 
 class Halt(Base):
     """
@@ -69,6 +294,21 @@ class Halt(Base):
     def run(self, robot: Robot):
         robot.drivebase.stop()
 
+class Turn(Base):
+    """
+    turns the robot in place
+    """
+    def __init__(self, angle, name="Turn"):
+        """
+        Paramaters:
+        angle: angle to turn in degrees, positive turns clockwise
+        """
+        super().__init__(name=name)
+        self.angle = angle
+
+    def run(self, robot: Robot):
+        robot.drivebase.turn(self.angle)
+
 class Lambda(Base):
     """
     A command that runs a lambda function
@@ -81,35 +321,118 @@ class Lambda(Base):
     def run(self, robot: Robot):
         self.fn(robot)
 
+STEPPED = "stepped"
+"""Lift approach: drive up to the pallet in blocking 10 mm moves"""
+CONTINUOUS = "continuous"
+"""Lift approach: creep up to the pallet polling the touch sensor while the lift moves into position"""
+
 class Lift(Base):
     """drives up to and lifts a pallet"""
-    def __init__(self, name="Lift", speed = 50, duty_limit = 100):
+    def __init__(self, name="Lift", speed = 50, duty_limit = 100, approach=STEPPED, creep_speed=60, max_approach=120, preposition_angle=33, stop_distance=2, rate=100):
+        """
+        Paramaters:
+        speed: speed of the lift motor in deg/s
+        duty_limit: duty cycle limit of the lift motor when raising a pallet in %
+        approach: STEPPED or CONTINUOUS
+        creep_speed: driving speed of the continuous approach in mm/s
+        max_approach: farthest the approach drives looking for the pallet in mm
+        preposition_angle: lift angle in degrees the forks are moved to before they reach the pallet
+        stop_distance: farthest in mm the continuous approach may drive between two polls of the touch sensor
+        rate: touch sensor polling rate of the continuous approach in Hz
+        """
         super().__init__(name=name)
+        if approach not in (STEPPED, CONTINUOUS):
+            raise ValueError("unknown approach " + str(approach))
+        if approach == CONTINUOUS and creep_speed > stop_distance * rate:
+            raise ValueError("creep_speed drives more than stop_distance between two polls")
         self.speed = speed
         self.duty_limit = duty_limit
+        self.approach = approach
+        self.creep_speed = creep_speed
+        self.max_approach = max_approach
+        self.preposition_angle = preposition_angle
+        self.stop_distance = stop_distance
+        self.rate = rate
+        self.loop = FixedRateLoop(rate)
+        self.success = None
+        """whether the last run picked up a pallet, None before the first run"""
+        self.duration = 0
+        """ms the last run took"""
+        self.approached = 0
+        """mm the last run drove up to the pallet"""
 
-    def run(self, robot: Robot):
+    def stop(self, robot: Robot):
+        robot.drivebase.stop()
+        robot.lift_motor.stop()
+
+    def steps(self, robot: Robot):
+        watch = StopWatch()
+        if robot.sensors.read("pressed"):
+            self.approached = 0
+            self.success = True
+        elif self.approach == CONTINUOUS:
+            self.success = yield from self._creep(robot)
+        else:
+            self.success = self._step(robot)
+        if self.success:
+            self._pick_up(robot)
+        else:
+            robot.print("Fail to pick up an elevated item")
+        self.duration = watch.time()
+        robot.log.info("pick up", ms=self.duration, success=self.success, mm=self.approached)
+
+    def _step(self, robot: Robot):
+        """the stepped approach, returns True if the pallet was reached"""
         loops = 0
-        if robot.touch_sensor.pressed():
-            robot.lift_motor.run_until_stalled(self.speed, then=Stop.HOLD, duty_limit=self.duty_limit)
-            wait(100)
+        robot.lift_motor.run_target(self.speed, self.preposition_angle, then=Stop.HOLD, wait = True)
+        while not robot.sensors.read("pressed") and loops < self.max_approach // 10:
+            robot.drivebase.straight(10)
+            loops += 1
+        robot.drivebase.stop()
+        self.approached = loops * 10
+        return robot.sensors.read("pressed")
+
+    def _creep(self, robot: Robot):
+        """the continuous approach, returns True if the pallet was reached"""
+        robot.lift_motor.run_target(self.speed, self.preposition_angle, then=Stop.HOLD, wait=False)
+        start = robot.drivebase.distance()
+        speed = self.creep_speed
+        robot.drivebase.drive(speed, 0)
+        pressed = False
+        position = start
+        self.loop.start()
+        while position - start < self.max_approach:
+            self.loop.tick()
+            pressed = robot.sensors.read("pressed")
+            if pressed:
+                break
+            yield
+            moved = robot.drivebase.distance()
+            if moved - position > self.stop_distance:
+                # a late poll let the truck drive farther than stop_distance, slow down so the next ones stay within it
+                speed *= self.stop_distance / (moved - position)
+                robot.drivebase.drive(speed, 0)
+            position = moved
+        robot.drivebase.stop()
+        self.approached = robot.drivebase.distance() - start
+        # the forks have to be in position before they go under the pallet
+        while not robot.lift_motor.control.done():
+            yield
+        return pressed
+
+    def _pick_up(self, robot: Robot):
+        """raises the pallet and backs away with it"""
+        robot.lift_motor.run_until_stalled(self.speed, then=Stop.HOLD, duty_limit=self.duty_limit)
+        wait(100)
+        if self.approach == CONTINUOUS:
+            # lower the lift to its carrying angle while backing away
+            robot.lift_motor.run_target(-1*self.speed, 50, then=Stop.HOLD, wait=False)
             robot.drivebase.straight(-200)
-            robot.lift_motor.run_target(-1*self.speed, 50, then=Stop.HOLD, wait=True)
-            # robot.drivebase.straight(100)
-            # robot.lift_motor.run_until_stalled(-1*self.speed, then=Stop.HOLD, duty_limit=self.duty_limit)
+            while not robot.lift_motor.control.done():
+                wait(10)
         else:
-            robot.lift_motor.run_target(self.speed, 33, then=Stop.HOLD, wait = True)
-            while not robot.touch_sensor.pressed() and loops < 12:
-                robot.drivebase.straight(10)
-                loops += 1
-            robot.drivebase.stop()
-            if robot.touch_sensor.pressed():
-                robot.lift_motor.run_until_stalled(self.speed, then=Stop.HOLD, duty_limit=self.duty_limit)
-                wait(100)
-                robot.drivebase.straight(-200)
-                robot.lift_motor.run_target(-1*self.speed, 50, then=Stop.HOLD, wait=True)
-            else:
-                robot.print("Fail to pick up an elevated item")
+            robot.drivebase.straight(-200)
+            robot.lift_motor.run_target(-1*self.speed, 50, then=Stop.HOLD, wait=True)
 
 class CalibrateLiftAngle(Base):
     """
@@ -122,7 +445,7 @@ class CalibrateLiftAngle(Base):
     def run(self, robot: Robot):
         robot.lift_motor.stop()
         robot.print("Lower the lift to the lowest position and press center button")
-        robot.wait_for_buttons(Button.CENTER)
+        robot.wait_for_button(Button.CENTER)
         wait(100)
         robot.lift_motor.reset_angle(0)
         # robot.print("Raise the lift to the highest position and press center button")
@@ -132,6 +455,16 @@ class CalibrateLiftAngle(Base):
         robot.lift_max_angle = robot.lift_motor.angle()
         #robot.print(f"Calibration complete with {robot.lift_max_angle} degrees")
 
+    @staticmethod
+    def home(robot: Robot):
+        """
+        lowers the lift until it stalls and makes that angle 0 again,
+        so a restored lift_max_angle is measured from the same position as when it was calibrated
+        """
+        robot.lift_motor.run_until_stalled(-50, then=Stop.HOLD, duty_limit=100)
+        wait(100)
+        robot.lift_motor.reset_angle(0)
+
 
 class CalibrateAmbientLight(Base):
     """
@@ -143,15 +476,54 @@ class CalibrateAmbientLight(Base):
 
     def run(self, robot: Robot):
         robot.print("Place the light sensor on white and press center button")
-        robot.wait_for_buttons(Button.CENTER)
-        robot.AMBIENT_LIGHT = robot.light_sensor.ambient()
+        robot.wait_for_button(Button.CENTER)
+        robot.sensors.invalidate("ambient")
+        robot.AMBIENT_LIGHT = robot.sensors.read("ambient")
         #robot.print(f"Calibration complete with {robot.AMBIENT_LIGHT}%")
 
+class Calibrate(Base):
+    """
+    restores the calibration results from a calibration.CalibrationStore,
+    running the interactive calibration only for results that are missing, stale or fail their sanity check
+    """
+    CALIBRATIONS = {
+        "lift_max_angle": CalibrateLiftAngle,
+        "AMBIENT_LIGHT": CalibrateAmbientLight,
+    }
+    """calibration command of every calibrated robot attribute"""
+
+    def __init__(self, store, force=False, name="Calibrate"):
+        """
+        Paramaters:
+        store: calibration.CalibrationStore the results are loaded from and saved to
+        force: run every calibration even if the stored results are valid
+        """
+        super().__init__(name=name)
+        self.store = store
+        self.force = force
+
+    def run(self, robot: Robot):
+        calibrated = False
+        for attribute in sorted(self.CALIBRATIONS):
+            reason = "forced" if self.force else self.store.restore(robot, attribute)
+            if reason is None:
+                # the result still holds but the device may have been moved since, bring it back to where it was measured from
+                home = getattr(self.CALIBRATIONS[attribute], "home", None)
+                if home is not None:
+                    home(robot)
+                continue
+            robot.log.info("calibrate", value=attribute, reason=reason)
+            self.CALIBRATIONS[attribute]().run(robot)
+            self.store.put(robot, attribute, getattr(robot, attribute))
+            calibrated = True
+        if calibrated:
+            self.store.save()
+
 class FollowLine(Base):
     """
     follows a line of specified color
     """
-    def __init__(self, end_fn, name="Line Follow", inside=9, outside=85, speed=100, gain=0.7):
+    def __init__(self, end_fn, name="Line Follow", inside=9, outside=85, speed=100, gain=0.7, rate=None, overrun_policy=SKIP, source=None):
         """
         Paramaters:
         end_fn: function that returns True if the command should end
@@ -160,6 +532,9 @@ class FollowLine(Base):
         outside: % of luminosity outside the line
         speed: driving speed of the robot in mm/s
         gain: gain of the line following controller in degrees per % of deviation from the threshold
+        rate: control loop rate in Hz, None runs as fast as possible
+        overrun_policy: timing.SKIP or timing.CATCH_UP
+        source: function returning the reflection, e.g. a filters.Source, None reads the light sensor
         """
         super().__init__(name=name)
         self.end_fn = end_fn
@@ -167,50 +542,199 @@ class FollowLine(Base):
         self.outside = outside
         self.speed = speed
         self.gain = gain
+        self.loop = FixedRateLoop(rate, policy=overrun_policy)
+        self.source = source
 
-    def run(self, robot: Robot):
+    def stop(self, robot: Robot):
+        robot.drivebase.stop()
+
+    def steps(self, robot: Robot):
         # Calculate the light threshold. Choose values based on your measurements.
         threshold = (self.inside + self.outside) / 2
+        read = _reader(self.source, lambda: robot.sensors.read("reflection"))
 
         # Start following the line until the end_fn returns True.
+        self.loop.start()
         while not self.end_fn():
+            self.loop.tick()
 
             # Calculate the deviation from the threshold.
-            deviation = robot.light_sensor.reflection() - threshold
+            reflection = read()
+            deviation = reflection - threshold
 
             # Calculate the turn rate.
             turn_rate = self.gain * deviation
 
             # Set the drive base speed and turn rate.
             robot.drivebase.drive(self.speed, turn_rate)
+            if robot.telemetry is not None:
+                robot.telemetry.record(self.name, reflection=reflection, speed=self.speed, turn_rate=turn_rate)
+            yield
 
 class CollisionAvoidance(Base):
     """Avoids a collision with another truck by temporarily steering of the line for some amount of time."""
+    speed_factor = 1.0
+    """share of their speed the line followers running the command should drive at"""
+
     def __init__(self, wait_time=7000, avoidance_distance=300, name="Avoid Collision"):
         super().__init__(name)
         self.wait_time = wait_time
         self.avoidance_distance = avoidance_distance
+        self.avoidances = 0
+        """number of times the command got out of the way"""
+        self.time_lost = 0
+        """ms spent getting out of the way and back"""
+        self.distance = None
+        """latest ultrasonic reading, recorded in the telemetry row of the follower running the command"""
 
     def run(self, robot: Robot):
-        if robot.ultrasonic_sensor.distance() < self.avoidance_distance:
+        distance = robot.sensors.read("distance")
+        self.distance = distance
+        if distance < self.avoidance_distance:
+            watch = StopWatch()
             #stop
             robot.drivebase.stop()
-            #turn 90 deg left
-            robot.drivebase.turn(90*2)
-            #reverse out of the way
-            robot.drivebase.straight(-300)
-            #wait
-            wait(self.wait_time)
-            #return to the line
-            robot.drivebase.straight(300)
-            #turn 90 deg right
-            robot.drivebase.turn(-90*2)
+            self.step_aside(robot, self.wait_time)
+            self.avoidances += 1
+            self.time_lost += watch.time()
+
+    def step_aside(self, robot: Robot, wait_time):
+        """leaves the line, waits for wait_time ms and returns to the line"""
+        #turn 90 deg left
+        robot.drivebase.turn(90*2)
+        #reverse out of the way
+        robot.drivebase.straight(-300)
+        #wait
+        wait(wait_time)
+        #return to the line
+        robot.drivebase.straight(300)
+        #turn 90 deg right
+        robot.drivebase.turn(-90*2)
+
+class PredictiveCollisionAvoidance(CollisionAvoidance):
+    """
+    avoids collisions by tracking the obstacle in front, run every tick by a line follower:
+    slows the follower down while the time to collision shrinks, stops while it is short and drives on as soon as the
+    obstacle is gone or moving away, only stepping aside if the obstacle keeps coming at the stopped truck,
+    time_lost counts the time stopped and stepped aside
+    """
+    def __init__(self, wait_time=7000, avoidance_distance=250, name="Predictive Collision Avoidance", slow_distance=600, resume_distance=350,
+                 slow_ttc=4000, stop_ttc=1500, min_speed_factor=0.3, approach_speed=40, approach_time=1000, stand_time=4000, pass_length=400, tracker=None):
+        """
+        Paramaters:
+        wait_time: longest time in ms to stay stopped or stepped aside before looking again
+        avoidance_distance: distance in mm below which the truck stops
+        slow_distance: distance in mm below which the truck slows down
+        resume_distance: distance in mm a stopped truck drives on from once the obstacle is not coming closer
+        slow_ttc: time to collision in ms below which the truck slows down
+        stop_ttc: time to collision in ms below which the truck stops
+        min_speed_factor: share of its speed the truck slows down to before it stops
+        approach_speed: closing speed in mm/s of an obstacle towards the stopped truck from which it steps aside
+        approach_time: ms the obstacle has to keep closing in before the truck steps aside, one crossing the beam seems to for a moment
+        stand_time: ms the obstacle has to stand in the way before the truck steps aside, longer than one crossing the beam takes to clear it
+        pass_length: distance in mm an oncoming obstacle has to travel past the truck, sizes the time stepped aside
+        tracker: tracker.ObstacleTracker, None makes one with the default settings
+        """
+        super().__init__(wait_time=wait_time, avoidance_distance=avoidance_distance, name=name)
+        if slow_distance <= avoidance_distance or slow_ttc <= stop_ttc:
+            raise ValueError("the slow down thresholds must be above the stop thresholds")
+        self.slow_distance = slow_distance
+        self.resume_distance = resume_distance
+        self.slow_ttc = slow_ttc
+        self.stop_ttc = stop_ttc
+        self.min_speed_factor = min_speed_factor
+        self.approach_speed = approach_speed
+        self.approach_time = approach_time
+        self.stand_time = stand_time
+        self.pass_length = pass_length
+        self.tracker = tracker if tracker is not None else ObstacleTracker()
+        self.speed_factor = 1.0
+        self.stamp = None
+        """time of the latest reading the tracker got"""
+
+    def run(self, robot: Robot):
+        """runs the steps on their own, not the blocking maneuver of CollisionAvoidance.run"""
+        for _ in steps_of(self, robot):
+            pass
+
+    def _track(self, robot: Robot):
+        """feeds a new ultrasonic reading to the tracker, returns the distance and the closing speed"""
+        distance = robot.sensors.read("distance")
+        stamp = robot.sensors.latest("distance")[1]
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.tracker.add(stamp, distance)
+        self.distance = distance
+        return distance, self.tracker.closing_speed()
+
+    def steps(self, robot: Robot):
+        distance, closing = self._track(robot)
+        ttc = self.tracker.time_to_collision(closing)
+        if distance >= self.slow_distance and (ttc is None or ttc >= self.slow_ttc):
+            self.speed_factor = 1.0
+            return
+        if distance >= self.avoidance_distance and (ttc is None or ttc >= self.stop_ttc):
+            # slow down in proportion to the distance or the time to collision, whichever is closer to stopping
+            by_distance = (distance - self.avoidance_distance) / (self.slow_distance - self.avoidance_distance)
+            by_time = 1.0 if ttc is None else (ttc - self.stop_ttc) / (self.slow_ttc - self.stop_ttc)
+            self.speed_factor = max(self.min_speed_factor, min(1.0, by_distance, by_time))
+            return
+        yield from self._hold(robot)
+
+    def _hold(self, robot: Robot):
+        """stops until the path is clear, stepping aside if the obstacle keeps coming or stays in the way"""
+        watch = StopWatch()
+        robot.drivebase.stop()
+        self.speed_factor = 0.0
+        self.avoidances += 1
+        # the closing speed measured while driving includes the truck's own speed, start over standing still
+        self.tracker.reset()
+        self.stamp = None
+        approaching = None
+        standing = None
+        while watch.time() < self.wait_time:
+            yield
+            distance, closing = self._track(robot)
+            if not self.tracker.present():
+                break
+            if self.tracker.readings() < 3:
+                continue
+            if distance >= self.resume_distance and closing <= 0:
+                break
+            now = watch.time()
+            if closing >= self.approach_speed:
+                standing = None
+                if approaching is None:
+                    approaching = now
+                elif now - approaching >= self.approach_time:
+                    # the obstacle is driving at the truck, get out of its way until it has passed
+                    passing = (distance + self.pass_length) / closing * 1000
+                    self.step_aside(robot, min(passing, self.wait_time))
+                    break
+            elif closing > -self.approach_speed:
+                approaching = None
+                if standing is None:
+                    standing = now
+                elif now - standing >= self.stand_time:
+                    # the obstacle stands in the way, get out of it like CollisionAvoidance for the rest of wait_time
+                    self.step_aside(robot, self.wait_time - now)
+                    break
+            else:
+                # the obstacle is moving away, wait for it to clear
+                approaching = None
+                standing = None
+        else:
+            # wait_time is up without the obstacle clearing, it has been waited for already
+            self.step_aside(robot, 0)
+        self.tracker.reset()
+        self.speed_factor = 1.0
+        self.time_lost += watch.time()
 
 class FollowLineWhileAvoidingCollision(Base):
     """
     follows a line of specified color
     """
-    def __init__(self, end_fn, name="Line Follow", inside=9, outside=85, speed=100, gain=0.7, avoidance_subcommand=CollisionAvoidance()):
+    def __init__(self, end_fn, name="Line Follow", inside=9, outside=85, speed=100, gain=0.7, avoidance_subcommand=None, rate=None, overrun_policy=SKIP, source=None):
         """
         Paramaters:
         end_fn: function that returns True if the command should end
@@ -219,6 +743,10 @@ class FollowLineWhileAvoidingCollision(Base):
         outside: % of luminosity outside the line
         speed: driving speed of the robot in mm/s
         gain: gain of the line following controller in degrees per % of deviation from the threshold
+        avoidance_subcommand: command run every tick before steering, its speed_factor scales the speed if it has one, None creates a CollisionAvoidance of its own
+        rate: control loop rate in Hz, None runs as fast as possible
+        overrun_policy: timing.SKIP or timing.CATCH_UP
+        source: function returning the reflection, e.g. a filters.Source, None reads the light sensor
         """
         super().__init__(name=name)
         self.end_fn = end_fn
@@ -226,65 +754,223 @@ class FollowLineWhileAvoidingCollision(Base):
         self.outside = outside
         self.speed = speed
         self.gain = gain
-        self.avoidance_subcommand = avoidance_subcommand
+        self.avoidance_subcommand = avoidance_subcommand if avoidance_subcommand is not None else CollisionAvoidance()
+        self.loop = FixedRateLoop(rate, policy=overrun_policy)
+        self.source = source
 
-    def run(self, robot: Robot):
+    def stop(self, robot: Robot):
+        robot.drivebase.stop()
+
+    def steps(self, robot: Robot):
         # Calculate the light threshold. Choose values based on your measurements.
         threshold = (self.inside + self.outside) / 2
+        read = _reader(self.source, lambda: robot.sensors.read("reflection"))
         # Start following the line until the end_fn returns True.
+        self.loop.start()
         while not self.end_fn():
+            self.loop.tick()
             # check for collision distance
-            self.avoidance_subcommand.run(robot)
+            yield from steps_of(self.avoidance_subcommand, robot, self)
             # Calculate the deviation from the threshold.
-            deviation = robot.light_sensor.reflection() - threshold
+            reflection = read()
+            deviation = reflection - threshold
             # Calculate the turn rate.
             turn_rate = self.gain * deviation
-            # Set the drive base speed and turn rate.
-            robot.drivebase.drive(self.speed, turn_rate)
+            # Set the drive base speed and turn rate, slowed down by the avoidance.
+            speed = self.speed * getattr(self.avoidance_subcommand, "speed_factor", 1.0)
+            robot.drivebase.drive(speed, turn_rate)
+            if robot.telemetry is not None:
+                robot.telemetry.record(self.name, reflection=reflection, distance=getattr(self.avoidance_subcommand, "distance", None), speed=speed, turn_rate=turn_rate)
+            yield
+
+class PIDFollowLine(Base):
+    """
+    follows a line of specified color with a PID controller,
+    driving fast on straights and slowing down into curves
+    """
+    def __init__(self, end_fn, name="PID Line Follow", inside=9, outside=85, min_speed=80, max_speed=250, kp=1.2, ki=0.0, kd=0.08,
+                 derivative_filter=0.3, integral_limit=200, curve_window=100, curve_gain=4, acceleration=300, avoidance_subcommand=None, rate=None, overrun_policy=SKIP, source=None):
+        """
+        Paramaters:
+        end_fn: function that returns True if the command should end
+        name: name of the command
+        inside: % of luminosity inside the line
+        outside: % of luminosity outside the line
+        min_speed: driving speed in the tightest curves in mm/s
+        max_speed: driving speed on straight lines in mm/s
+        kp: proportional gain in degrees/s per % of deviation from the threshold
+        ki: integral gain in degrees/s per %s of accumulated deviation
+        kd: derivative gain in degrees/s per %/s of deviation change
+        derivative_filter: weight of the newest sample in the low-pass filter of the derivative, 1 disables the filter
+        integral_limit: bound of the accumulated deviation in %s
+        curve_window: distance in mm the curvature is estimated over, from the change of the drive base heading along it
+        curve_gain: speed reduction per deg/mm of estimated curvature, the speed is max_speed / (1 + curve_gain * curvature)
+        acceleration: largest speed increase in mm/s per second, slowing down is immediate
+        avoidance_subcommand: command run every tick before steering, e.g. CollisionAvoidance(), its speed_factor scales the speed if it has one, None to skip it
+        rate: control loop rate in Hz, None runs as fast as possible
+        overrun_policy: timing.SKIP or timing.CATCH_UP
+        source: function returning the reflection, e.g. a filters.Source, None reads the light sensor
+        """
+        super().__init__(name=name)
+        self.end_fn = end_fn
+        self.inside = inside
+        self.outside = outside
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.derivative_filter = derivative_filter
+        self.integral_limit = integral_limit
+        self.curve_window = curve_window
+        self.curve_gain = curve_gain
+        self.acceleration = acceleration
+        self.curvature = 0.0
+        """latest estimate of the curvature of the line in deg/mm, 0 until the first curve_window mm are driven"""
+        self.avoidance_subcommand = avoidance_subcommand
+        self.loop = FixedRateLoop(rate, policy=overrun_policy)
+        self.source = source
+
+    def stop(self, robot: Robot):
+        robot.drivebase.stop()
+
+    def steps(self, robot: Robot):
+        threshold = (self.inside + self.outside) / 2
+        read = _reader(self.source, lambda: robot.sensors.read("reflection"))
+        # ring buffer of the drive base heading at every mm of the last curve_window mm driven
+        window = self.curve_window
+        distance, _, angle, _ = robot.drivebase.state()
+        headings = [angle] * window
+        travelled = distance
+        # from this distance on the ring holds the heading of curve_window mm ago, before it the curve is not known yet
+        full = distance + window
+        self.curvature = 0.0
+        integral = 0.0
+        derivative = 0.0
+        previous = None
+        speed = self.min_speed
+        watch = StopWatch()
+        last_time = watch.time()
+        self.loop.start()
+        while not self.end_fn():
+            self.loop.tick()
+            if self.avoidance_subcommand is not None:
+                yield from steps_of(self.avoidance_subcommand, robot, self)
+            now = watch.time()
+            dt = max(now - last_time, 1) / 1000
+            last_time = now
+
+            reflection = read()
+            deviation = reflection - threshold
+            integral = max(-self.integral_limit, min(self.integral_limit, integral + deviation * dt))
+            if previous is not None:
+                derivative += self.derivative_filter * ((deviation - previous) / dt - derivative)
+            previous = deviation
+            turn_rate = self.kp * deviation + self.ki * integral + self.kd * derivative
+
+            # estimate the curvature of the line from how far the heading turned over the last curve_window mm and
+            # schedule the speed, zig-zagging along a straight edge leaves the heading where it was while a curve turns it
+            # the estimate only changes when the truck has driven on to the next mm and keeps its value in between
+            distance, _, angle, _ = robot.drivebase.state()
+            while travelled < distance:
+                travelled += 1
+                slot = travelled % window
+                if travelled >= full:
+                    self.curvature = abs(angle - headings[slot]) / window
+                headings[slot] = angle
+            target = self.max_speed / (1 + self.curve_gain * self.curvature)
+            target = max(self.min_speed, target)
+            speed = target if target < speed else min(target, speed + self.acceleration * dt)
+
+            drive_speed = speed * getattr(self.avoidance_subcommand, "speed_factor", 1.0)
+            robot.drivebase.drive(drive_speed, turn_rate)
+            if robot.telemetry is not None:
+                robot.telemetry.record(self.name, reflection=reflection, distance=getattr(self.avoidance_subcommand, "distance", None), speed=drive_speed, turn_rate=turn_rate)
+            yield
 
 class ExitSpecifiedArea(Base):
     """Leaves the current area by driving straight forward until the color changes."""
-    def __init__(self, name="Exit specified area"):
+    def __init__(self, name="Exit specified area", source=None, confirm=1):
+        """
+        Paramaters:
+        name: name of the command
+        source: function returning the rgb readout, e.g. a filters.Source, None reads the light sensor
+        confirm: number of changed readouts in a row needed to leave the area
+        """
         super().__init__(name)
+        self.source = source
+        self.confirm = confirm
 
-    def run(self, robot):
+    def stop(self, robot: Robot):
+        robot.drivebase.stop()
+
+    def steps(self, robot):
+        read = _reader(self.source, lambda: robot.sensors.read("rgb"))
+        debounce = Debounce(self.confirm, False)
         #save current rgb values as refrence
-        ref = robot.light_sensor.rgb()
+        ref = read()
+        change = ColorChange(robot.colors, ref) if robot.colors is not None else None
         robot.drivebase.drive(100, 0)
         # keep driving until the color changes from ref
         while True:
-            if env.rgb_likeness(ref, robot.light_sensor.rgb()) > 15:
+            rgb = read()
+            if robot.telemetry is not None:
+                robot.telemetry.record(self.name, rgb=rgb, speed=100)
+            if debounce(change.update(rgb) if change is not None else env.rgb_likeness(ref, rgb) > 15):
                 break
+            yield
         robot.drivebase.stop()
         robot.print("the truck has left the specified area")
 
 class ExitSpecifiedAreaInASafeManner(Base):
     """Leaves the current area by driving straight forward until the color changes and avoiding collisions while doing so."""
-    def __init__(self, name="Exit specified area"):
+    def __init__(self, name="Exit specified area", max_dist=400, min_dist=250, turn_dist=350, source=None, confirm=1):
+        """
+        Paramaters:
+        name: name of the command
+        max_dist: distance to an obstacle in mm from which the robot slows down
+        min_dist: distance in mm below which the robot does not slow down further
+        turn_dist: distance in mm below which the robot turns away from the obstacle
+        source: function returning the rgb readout, e.g. a filters.Source, None reads the light sensor
+        confirm: number of changed readouts in a row needed to leave the area
+        """
         super().__init__(name)
-        self.max_dist = 400
-        self.min_dist = 250
-        self.turn_dist = 350
+        self.max_dist = max_dist
+        self.min_dist = min_dist
+        self.turn_dist = turn_dist
+        self.source = source
+        self.confirm = confirm
+
+    def stop(self, robot: Robot):
+        robot.drivebase.stop()
 
-    def run(self, robot):
+    def steps(self, robot):
+        read = _reader(self.source, lambda: robot.sensors.read("rgb"))
+        debounce = Debounce(self.confirm, False)
         #save current rgb values as refrence
-        ref = robot.light_sensor.rgb()
+        ref = read()
+        change = ColorChange(robot.colors, ref) if robot.colors is not None else None
         # keep driving until the color changes from ref
         while True:
             #get distance from obstacle (if any)
-            dist = robot.ultrasonic_sensor.distance()
+            dist = robot.sensors.read("distance")
             #claculate speed factor
             speed_factor = max(self.min_dist, min(self.max_dist, dist)) / self.max_dist
             # turn_factor = max(1 - (speed_factor), 0)
             #turn when obstacle is too close
             if dist < self.turn_dist:
                 robot.drivebase.turn(-90)
-            robot.print("----------\n" + str(speed_factor) +"\n"+ str(dist))
+            if robot.log.debug_enabled:
+                robot.log.debug("exit area", speed_factor=speed_factor, dist=dist)
             #drive
             robot.drivebase.drive(100*speed_factor, 0)
             # exit when color changes
-            if env.rgb_likeness(ref, robot.light_sensor.rgb()) > 15:
+            rgb = read()
+            if robot.telemetry is not None:
+                robot.telemetry.record(self.name, rgb=rgb, distance=dist, speed=100*speed_factor)
+            if debounce(change.update(rgb) if change is not None else env.rgb_likeness(ref, rgb) > 15):
                 break
+            yield
         robot.drivebase.stop()
         robot.print("the truck has left the specified area")
 
@@ -32,6 +32,8 @@ color_dict = {
 """Enumeration of the colors in the environment"""
 rgb_list = [PINK, PURPLE, BROWN, BLUE, GREEN, WHITE, BLACK]
 reflection_list = [REFLECT_PINK, REFLECT_PURPLE, REFLECT_BROWN, REFLECT_BLUE, REFLECT_GREEN, REFLECT_WHITE, REFLECT_BLACK]
+color_names = ("PINK", "PURLE", "BROWN", "BLUE", "GREEN", "WHITE", "BLACK")
+"""names of the colors, indexed like rgb_list and reflection_list (MicroPython dicts do not keep insertion order)"""
 
 def get_rgb(self):
     """
@@ -69,7 +71,7 @@ def from_hsv(color):
         if distance < minimum:
             minimum = distance
             min_index = i
-    return color_dict.keys()[min_index]
+    return color_names[min_index]
 
 def rgb_likeness(this, other):
     """
@@ -77,18 +79,185 @@ def rgb_likeness(this, other):
     """
     return (abs(this[0] - other[0]) + abs(this[1] - other[1]) + abs(this[2] - other[2])) / 3
 
-# def from_rgb(color):
-#     """
-#     returns the identity of color by the smallest distance from enviroment colors
-#     """
-#     # pylint: disable=invalid-name
-#     minimum = float("inf")
-#     min_index = None
-#     for i, other in enumerate(rgb_list):
-#         distance = rgb_likeness(color, other)
-#         if distance < minimum:
-#             minimum = distance
-#             min_index = i
-#     return color_dict.keys()[min_index].copy()
+# Classification lookup tables
+# rgb channels are quantized to LUT_LEVELS levels and packed into one index. Every cell holds the index in color_names
+# of the enviroment color closest (by rgb_likeness) to all the readouts in the cell. Readouts of a cell that lies on
+# the border between colors are compared with the few colors they can be closest to, so the result is always exact.
+
+LUT_LEVELS = 32
+"""number of quantization levels per rgb channel"""
+_LUT_SHIFT = 5
+"""bits per quantized channel, LUT_LEVELS == 1 << _LUT_SHIFT"""
+AMBIGUOUS = 128
+"""rgb table entries from AMBIGUOUS on are cells on a border, AMBIGUOUS plus the index of their colors in _candidates"""
+
+_quantize = {value: value * LUT_LEVELS // 101 for value in range(101)}
+"""
+maps a channel value in % to its quantization level, values that are not whole numbers from 0 to 100 are missing and
+raise KeyError, the classification then rounds and clamps them
+"""
+_rgb_lut = None
+"""bytearray mapping packed quantized rgb values to color indices, built on first use"""
+_candidates = []
+"""tuples of the (index, rgb) of the colors the readouts of a border cell can be closest to"""
+_reflection_lut = None
+"""bytearray mapping reflections in % (0-255) to color indices, built on first use"""
+
+def _closest(value, references, likeness):
+    """returns the index of the reference with the smallest distance to value"""
+    minimum = float("inf")
+    min_index = 0
+    for i, other in enumerate(references):
+        distance = likeness(value, other)
+        if distance < minimum:
+            minimum = distance
+            min_index = i
+    return min_index
+
+def _clamp(color):
+    """returns an rgb readout with every channel rounded to a whole % and limited to 0-100"""
+    return tuple(0 if channel < 0 else 100 if channel > 100 else int(channel + 0.5) for channel in color)
+
+def _level_distances(level, references):
+    """returns the smallest and the largest distance of the channel values in a quantization level from every reference"""
+    values = [value for value in range(101) if _quantize[value] == level]
+    low, high = values[0], values[-1]
+    near = [0 if low <= reference <= high else min(abs(low - reference), abs(high - reference)) for reference in references]
+    far = [max(abs(low - reference), abs(high - reference)) for reference in references]
+    return near, far
+
+def _cell_colors(near, far):
+    """
+    returns the indices of the colors the readouts of a cell can be closest to from the smallest and largest distance
+    of the cell from each color, ties go to the first color like in _closest
+    """
+    winner = 0
+    for i in range(1, len(far)):
+        if far[i] < far[winner]:
+            winner = i
+    # every readout of the cell is at least as close to the winner as to a color whose smallest distance is larger
+    colors = tuple(i for i, distance in enumerate(near) if i != winner and (distance < far[winner] or (distance == far[winner] and i < winner)))
+    return colors + (winner,) if colors else (winner,)
+
+def _nearest_candidate(color, candidates):
+    """returns the index of the closest of the (index, rgb) candidates to an rgb readout with channels from 0 to 100"""
+    red, green, blue = color
+    minimum = 1000
+    nearest = 0
+    for index, reference in candidates:
+        distance = abs(red - reference[0]) + abs(green - reference[1]) + abs(blue - reference[2])
+        if distance < minimum:
+            minimum = distance
+            nearest = index
+    return nearest
+
+def build_tables():
+    """
+    builds the rgb and reflection lookup tables, called automatically on first classification
+    """
+    # pylint: disable=global-statement
+    global _rgb_lut, _reflection_lut, _candidates
+    candidates = {}
+    count = len(rgb_list)
+    channels = [[_level_distances(level, [color[channel] for color in rgb_list]) for level in range(LUT_LEVELS)] for channel in range(3)]
+    rgb_lut = bytearray(LUT_LEVELS ** 3)
+    for red in range(LUT_LEVELS):
+        red_near, red_far = channels[0][red]
+        for green in range(LUT_LEVELS):
+            green_near, green_far = channels[1][green]
+            red_green_near = [red_near[i] + green_near[i] for i in range(count)]
+            red_green_far = [red_far[i] + green_far[i] for i in range(count)]
+            for blue in range(LUT_LEVELS):
+                blue_near, blue_far = channels[2][blue]
+                colors = _cell_colors([red_green_near[i] + blue_near[i] for i in range(count)], [red_green_far[i] + blue_far[i] for i in range(count)])
+                if len(colors) == 1:
+                    entry = colors[0]
+                else:
+                    colors = tuple(sorted(colors))
+                    if colors not in candidates:
+                        candidates[colors] = len(candidates)
+                    entry = AMBIGUOUS + candidates[colors]
+                rgb_lut[(red << _LUT_SHIFT | green) << _LUT_SHIFT | blue] = entry
+    reflection_lut = bytearray(256)
+    for value in range(256):
+        reflection_lut[value] = _closest(value, reflection_list, lambda this, other: abs(this - other))
+    _candidates = [None] * len(candidates)
+    for colors, i in candidates.items():
+        _candidates[i] = tuple((index, rgb_list[index]) for index in colors)
+    _rgb_lut = rgb_lut
+    _reflection_lut = reflection_lut
+
+def classify_rgb(color):
+    """
+    returns the index in color_names of the enviroment color closest to an rgb readout,
+    channels are rounded to a whole % and limited to 0-100 first, so filtered (float) readouts can be classified too
+    """
+    if _rgb_lut is None:
+        build_tables()
+    quantize = _quantize
+    try:
+        index = _rgb_lut[(quantize[color[0]] << _LUT_SHIFT | quantize[color[1]]) << _LUT_SHIFT | quantize[color[2]]]
+    except KeyError:
+        # fractional or out of range channels
+        return classify_rgb(_clamp(color))
+    if index < AMBIGUOUS:
+        return index
+    return _nearest_candidate(color, _candidates[index - AMBIGUOUS])
+
+def classify_reflection(value):
+    """
+    returns the index in color_names of the enviroment color closest to a reflection readout
+    """
+    if _reflection_lut is None:
+        build_tables()
+    return _reflection_lut[value]
+
+def from_rgb(color):
+    """
+    returns the identity of color by the smallest distance from enviroment colors,
+    channels are rounded to a whole % and limited to 0-100 first
+    """
+    return color_names[classify_rgb(color)]
+
+def from_reflection(value):
+    """
+    returns the identity of a reflection readout by the smallest distance from enviroment reflections
+    """
+    return color_names[classify_reflection(value)]
+
+def classify_rgb_batch(samples):
+    """
+    returns a bytearray with the color index of every rgb readout in samples
+    """
+    if _rgb_lut is None:
+        build_tables()
+    samples = list(samples)
+    lut = _rgb_lut
+    quantize = _quantize
+    try:
+        indices = bytearray(lut[(quantize[r] << _LUT_SHIFT | quantize[g]) << _LUT_SHIFT | quantize[b]] for r, g, b in samples)
+    except KeyError:
+        return bytearray(classify_rgb(sample) for sample in samples)
+    for i, index in enumerate(indices):
+        if index >= AMBIGUOUS:
+            indices[i] = _nearest_candidate(samples[i], _candidates[index - AMBIGUOUS])
+    return indices
+
+def classify_reflection_batch(values):
+    """
+    returns a bytearray with the color index of every reflection readout in values
+    """
+    if _reflection_lut is None:
+        build_tables()
+    return bytearray(_reflection_lut[value] for value in values)
+
+def count_colors(indices):
+    """
+    returns a dict with the number of occurrences of each color name in a batch of color indices
+    """
+    counts = [0] * len(color_names)
+    for index in indices:
+        counts[index] += 1
+    return {name: counts[i] for i, name in enumerate(color_names)}
 
 OUTSIDE_COLORS = ["WHITE", "BLACK"]
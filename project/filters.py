@@ -0,0 +1,230 @@
+#! pylint: disable=line-too-long
+
+"""
+Streaming filters for sensor signals.
+
+Every stage is called with one sample and returns its output, keeping its state in buffers allocated up front so a
+step costs a few arithmetic operations and no allocations on the brick. Stages are chained into a Pipeline and
+attached to a sensor read function with filtered(), which gives a source commands can read instead of the sensor:
+
+    reflection = filtered(lambda: robot.sensors.read("reflection"), Median(3), EMA(0.5))
+    command.FollowLine(end_fn, source=reflection)
+
+Stages that smooth values (EMA, Median) take a number of channels so they can filter rgb tuples as well.
+The first sample primes a stage, so its output starts at the signal instead of at zero.
+"""
+
+from pybricks.tools import StopWatch
+
+class EMA:
+    """
+    exponential moving average, alpha is the weight of the newest sample
+    """
+    def __init__(self, alpha, channels=1):
+        self.alpha = alpha
+        self.channels = channels
+        self.state = [0.0] * channels
+        self.primed = False
+
+    def reset(self):
+        """forget the signal"""
+        self.primed = False
+
+    def __call__(self, value):
+        state = self.state
+        if self.channels == 1:
+            if not self.primed:
+                state[0] = value
+                self.primed = True
+            else:
+                state[0] += self.alpha * (value - state[0])
+            return state[0]
+        if not self.primed:
+            for i in range(self.channels):
+                state[i] = value[i]
+            self.primed = True
+        else:
+            alpha = self.alpha
+            for i in range(self.channels):
+                state[i] += alpha * (value[i] - state[i])
+        return tuple(state)
+
+class Median:
+    """
+    median of the last size samples, removes single sample spikes, size should be odd
+    """
+    def __init__(self, size=3, channels=1):
+        self.size = size
+        self.channels = channels
+        self.window = [[0] * size for _ in range(channels)]
+        self.scratch = [0] * size
+        self.index = 0
+        self.primed = False
+
+    def reset(self):
+        """forget the signal"""
+        self.primed = False
+
+    def _median(self, samples):
+        """returns the median of a window using the preallocated scratch list"""
+        scratch = self.scratch
+        for i in range(self.size):
+            scratch[i] = samples[i]
+        scratch.sort()
+        return scratch[self.size // 2]
+
+    def __call__(self, value):
+        values = (value,) if self.channels == 1 else value
+        if not self.primed:
+            for channel in range(self.channels):
+                window = self.window[channel]
+                for i in range(self.size):
+                    window[i] = values[channel]
+            self.primed = True
+        for channel in range(self.channels):
+            self.window[channel][self.index] = values[channel]
+        self.index = (self.index + 1) % self.size
+        if self.channels == 1:
+            return self._median(self.window[0])
+        return tuple(self._median(window) for window in self.window)
+
+class Hysteresis:
+    """
+    turns a signal into True above high and False below low, keeping the previous state in between
+    """
+    def __init__(self, low, high, initial=False):
+        if low > high:
+            raise ValueError("low must not be above high")
+        self.low = low
+        self.high = high
+        self.initial = initial
+        self.state = initial
+
+    def reset(self):
+        """return to the initial state"""
+        self.state = self.initial
+
+    def __call__(self, value):
+        if self.state:
+            if value < self.low:
+                self.state = False
+        elif value > self.high:
+            self.state = True
+        return self.state
+
+class Debounce:
+    """
+    passes a new value on only after it has been seen count times in a row, until then repeats the previous value
+    """
+    def __init__(self, count, initial=None):
+        self.count = count
+        self.initial = initial
+        self.value = initial
+        self.candidate = None
+        self.seen = 0
+
+    def reset(self):
+        """forget the signal, the next sample is passed on right away"""
+        self.value = self.initial
+        self.candidate = None
+        self.seen = 0
+
+    def __call__(self, value):
+        if self.value is None:
+            self.value = value
+        if value == self.value:
+            self.seen = 0
+            return self.value
+        if value == self.candidate:
+            self.seen += 1
+        else:
+            self.candidate = value
+            self.seen = 1
+        if self.seen >= self.count:
+            self.value = value
+            self.seen = 0
+        return self.value
+
+class RateOfChange:
+    """
+    change of a signal per second, 0 for the first sample
+    interval: ms between samples, None measures it with a stopwatch
+    """
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.watch = StopWatch() if interval is None else None
+        self.previous = None
+        self.previous_time = 0
+
+    def reset(self):
+        """forget the signal"""
+        self.previous = None
+
+    def __call__(self, value):
+        now = self.watch.time() if self.watch is not None else self.previous_time + self.interval
+        if self.previous is None:
+            rate = 0.0
+        else:
+            elapsed = now - self.previous_time
+            rate = (value - self.previous) * 1000 / elapsed if elapsed > 0 else 0.0
+        self.previous = value
+        self.previous_time = now
+        return rate
+
+class Map:
+    """
+    applies a function to every sample, e.g. to classify it or to compare it with a reference
+    """
+    def __init__(self, fn):
+        # pylint: disable=invalid-name
+        self.fn = fn
+
+    def reset(self):
+        """nothing to forget"""
+
+    def __call__(self, value):
+        return self.fn(value)
+
+class Pipeline:
+    """
+    stages applied one after the other
+    """
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def reset(self):
+        """reset every stage"""
+        for stage in self.stages:
+            stage.reset()
+
+    def __call__(self, value):
+        for stage in self.stages:
+            value = stage(value)
+        return value
+
+    def stream(self, samples):
+        """generator filtering an iterable of samples"""
+        for sample in samples:
+            yield self(sample)
+
+class Source:
+    """
+    a sensor read function followed by a pipeline, called without arguments like the sensor method it replaces
+    """
+    def __init__(self, read_fn, pipeline):
+        self.read_fn = read_fn
+        self.pipeline = pipeline
+        self.value = None
+        """the latest output"""
+
+    def reset(self):
+        """reset the pipeline, e.g. before a command starts using the source"""
+        self.pipeline.reset()
+
+    def __call__(self):
+        self.value = self.pipeline(self.read_fn())
+        return self.value
+
+def filtered(read_fn, *stages):
+    """returns a Source reading read_fn through the stages"""
+    return Source(read_fn, Pipeline(*stages))
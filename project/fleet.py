@@ -0,0 +1,311 @@
+#! pylint: disable=line-too-long
+
+"""
+Simulation of a fleet of trucks sharing a warehouse.
+
+Every truck is a SimRobot in one FleetSimulation running its own command.Queue, built again by a mission factory every
+time the previous one completes; each completed queue counts as one delivered pallet. The trucks see each other with
+their ultrasonic and touch sensors. Each truck's commands run in a thread of their own but only one thread runs at a
+time: a truck runs until its next device call would take it a quantum past the virtual time of another truck, which then takes
+over, so the trucks are stepped in lockstep on one clock and a run is deterministic.
+Fleet sizes and seeds are independent, so a sweep over them runs across a process pool.
+
+Usage: python fleet.py [--sizes 1 2 4 8] [--seeds 0] [--duration ms] [--mission module:function] [--processes N]
+"""
+
+import argparse
+import math
+import multiprocessing
+import threading
+
+from simulation import Simulation, SimRobot, SimulationTimeout
+import commands as command
+from replay import resolve_factory
+from tuning import stadium, LAP
+
+SPEEDS = (100, 120, 80, 110)
+"""line following speed of every truck of the default mission in mm/s, repeated for larger fleets"""
+
+STUCK_WINDOW = 10000
+"""virtual ms a truck has to move in to not count as stuck"""
+STUCK_DISTANCE = 50
+"""distance in mm a truck has to move within STUCK_WINDOW"""
+DEADLOCK_RANGE = 600
+"""distance in mm within which stuck trucks are blocking each other"""
+PROBE_INTERVAL = 500
+"""virtual ms between progress checks"""
+
+
+class FleetStopped(SimulationTimeout):
+    """raised in the threads of the trucks when the fleet run ends"""
+
+
+class _Truck:
+    """a robot of the fleet and the thread its missions run in"""
+    def __init__(self, sim, index, robot, mission):
+        self.sim = sim
+        self.index = index
+        self.robot = robot
+        self.mission = mission
+        self.wake = sim.now
+        """virtual time the truck's current device call ends at"""
+        self.resume = threading.Event()
+        self.done = False
+        self.error = None
+        self.pallets = 0
+        self.avoiders = []
+        """every CollisionAvoidance the truck's missions used"""
+        self.history = []
+        """(time, x, y) of the recent progress checks"""
+        self.thread = threading.Thread(target=self.main, daemon=True)
+
+    def main(self):
+        """thread entry point, runs missions until the fleet stops"""
+        self.resume.wait()
+        self.resume.clear()
+        try:
+            while not self.sim.stopping:
+                queue = self.mission(self.robot, self.index)
+                if queue is None:
+                    break
+                for avoider in _avoiders(queue):
+                    if avoider not in self.avoiders:
+                        self.avoiders.append(avoider)
+                queue.run(self.robot)
+                self.pallets += 1
+        except FleetStopped:
+            pass
+        except Exception as error:  # pylint: disable=broad-except
+            self.error = error
+        finally:
+            self.done = True
+            self.sim.yielded.set()
+
+
+def _avoiders(cmd):
+    """returns the CollisionAvoidance commands in a command tree"""
+    found = []
+    if isinstance(cmd, command.CollisionAvoidance):
+        found.append(cmd)
+    if isinstance(cmd, command.Queue):
+        for child in cmd:
+            found.extend(_avoiders(child))
+    subcommand = getattr(cmd, "avoidance_subcommand", None)
+    if subcommand is not None:
+        found.extend(_avoiders(subcommand))
+    return found
+
+
+class FleetSimulation(Simulation):
+    """
+    a Simulation whose trucks each run their own missions, stepped in lockstep on the shared clock
+    """
+    def __init__(self, *args, quantum=None, **kwargs):
+        """
+        Paramaters:
+        quantum: virtual ms a truck may run ahead of the others before it hands over, defaults to the integration step
+        the other parameters are those of Simulation
+        """
+        super().__init__(*args, **kwargs)
+        self.quantum = quantum if quantum is not None else self.step_ms
+        self.trucks = []
+        self.current = None
+        """the truck whose thread is running, None while the scheduler runs"""
+        self.horizon = 0.0
+        """virtual time the current truck may run to before another truck is due"""
+        self.stopping = False
+        self.yielded = threading.Event()
+        self.deadlocks = 0
+        self.deadlock_ms = 0.0
+        self._deadlocked = False
+
+    def add_truck(self, mission, x=0.0, y=0.0, heading=0.0):
+        """add a truck that runs the queues returned by mission(robot, index) until the fleet stops"""
+        robot = SimRobot(self, x, y, heading)
+        truck = _Truck(self, len(self.trucks), robot, mission)
+        self.trucks.append(truck)
+        return truck
+
+    def advance(self, duration):
+        truck = self.current
+        target = self.now + duration
+        if truck is None or target <= self.horizon:
+            super().advance(duration)
+            return
+        # let the trucks that are due earlier catch up first
+        truck.wake = target
+        self.current = None
+        self.yielded.set()
+        truck.resume.wait()
+        truck.resume.clear()
+        if self.stopping:
+            raise FleetStopped("the fleet run ended")
+
+    def _probe(self, sim):
+        """checks which trucks are stuck and whether stuck trucks block each other"""
+        stuck = []
+        for truck in self.trucks:
+            body = truck.robot.body
+            truck.history.append((self.now, body.x, body.y))
+            while truck.history and truck.history[0][0] < self.now - STUCK_WINDOW:
+                truck.history.pop(0)
+            start = truck.history[0]
+            if self.now - start[0] >= STUCK_WINDOW - PROBE_INTERVAL and math.hypot(body.x - start[1], body.y - start[2]) < STUCK_DISTANCE:
+                stuck.append(body)
+        deadlocked = any(math.hypot(a.x - b.x, a.y - b.y) < DEADLOCK_RANGE for i, a in enumerate(stuck) for b in stuck[i + 1:])
+        if deadlocked:
+            self.deadlock_ms += PROBE_INTERVAL
+            if not self._deadlocked:
+                self.deadlocks += 1
+        self._deadlocked = deadlocked
+        self.at(self.now + PROBE_INTERVAL, self._probe)
+
+    def run_fleet(self, duration):
+        """runs the trucks' missions for duration ms of virtual time and returns a FleetReport"""
+        start = self.now
+        end = start + duration
+        self.at(self.now + PROBE_INTERVAL, self._probe)
+        for truck in self.trucks:
+            truck.thread.start()
+        try:
+            while True:
+                alive = [truck for truck in self.trucks if not truck.done]
+                if not alive:
+                    break
+                truck = min(alive, key=lambda truck: (truck.wake, truck.index))
+                if truck.wake > end:
+                    break
+                if truck.wake > self.now:
+                    Simulation.advance(self, truck.wake - self.now)
+                self.horizon = min([other.wake + self.quantum for other in alive if other is not truck] + [end])
+                self.current = truck
+                self.yielded.clear()
+                truck.resume.set()
+                self.yielded.wait()
+        finally:
+            self.current = None
+            self.stopping = True
+            for truck in self.trucks:
+                truck.resume.set()
+                truck.thread.join()
+        errors = [truck.error for truck in self.trucks if truck.error is not None]
+        if errors:
+            raise errors[0]
+        return FleetReport(
+            len(self.trucks), self.now - start,
+            [truck.pallets for truck in self.trucks],
+            sum(avoider.avoidances for truck in self.trucks for avoider in truck.avoiders),
+            sum(avoider.time_lost for truck in self.trucks for avoider in truck.avoiders),
+            self.deadlocks, self.deadlock_ms)
+
+
+class FleetReport:
+    """throughput of a fleet run"""
+    def __init__(self, size, duration_ms, pallets, avoidances, avoidance_ms, deadlocks, deadlock_ms, seed=None):
+        self.size = size
+        self.duration_ms = duration_ms
+        self.pallets = pallets
+        """pallets delivered by every truck"""
+        self.avoidances = avoidances
+        self.avoidance_ms = avoidance_ms
+        self.deadlocks = deadlocks
+        self.deadlock_ms = deadlock_ms
+        self.seed = seed
+
+    @property
+    def pallets_per_hour(self):
+        """pallets the whole fleet delivers per hour"""
+        return sum(self.pallets) * 3600000 / self.duration_ms if self.duration_ms else 0.0
+
+    @property
+    def avoidance_share(self):
+        """share of the trucks' time spent getting out of each other's way"""
+        return self.avoidance_ms / (self.duration_ms * self.size) if self.duration_ms and self.size else 0.0
+
+    def __str__(self):
+        return "{} trucks: {:.1f} pallets/h ({:.1f} per truck), {} avoidances losing {:.0%} of the time, {} deadlocks for {:.0f} s".format(
+            self.size, self.pallets_per_hour, self.pallets_per_hour / self.size if self.size else 0.0,
+            self.avoidances, self.avoidance_share, self.deadlocks, self.deadlock_ms / 1000)
+
+
+def stadium_pose(position):
+    """returns the x, y and heading of the point of the stadium track a distance in mm along it, counter-clockwise from the origin"""
+    straight = LAP / 2 - math.pi * 250
+    radius = 250
+    position %= LAP
+    if position < straight:
+        return position, 0.0, 0.0
+    position -= straight
+    if position < math.pi * radius:
+        angle = position / radius - math.pi / 2
+        return straight + radius * math.cos(angle), radius + radius * math.sin(angle), math.degrees(angle) + 90
+    position -= math.pi * radius
+    if position < straight:
+        return straight - position, 2 * radius, 180.0
+    position -= straight
+    angle = position / radius + math.pi / 2
+    return radius * math.cos(angle), radius + radius * math.sin(angle), math.degrees(angle) + 90
+
+
+def lap_mission(robot, index):
+    """the default mission: one lap of the stadium track while avoiding the other trucks"""
+    start = robot.drivebase.distance()
+    queue = command.Queue("Lap of truck " + str(index))
+    queue.append(command.FollowLineWhileAvoidingCollision(
+        lambda: robot.drivebase.distance() >= start + LAP,
+        inside=0, outside=79, speed=SPEEDS[index % len(SPEEDS)],
+        avoidance_subcommand=command.PredictiveCollisionAvoidance()))
+    return queue
+
+
+def run(size, duration=300000, seed=0, mission=lap_mission):
+    """
+    runs a fleet of trucks spread evenly over the stadium track
+    mission: function of the robot and truck index returning the next queue, or "module:function" naming one
+    returns a FleetReport
+    """
+    sim = FleetSimulation(floor=stadium(), noise=1.0, seed=seed)
+    mission = resolve_factory(mission)
+    for i in range(size):
+        x, y, heading = stadium_pose(200 + i * LAP / size)
+        sim.add_truck(mission, x, y, heading)
+    report = sim.run_fleet(duration)
+    report.seed = seed
+    return report
+
+
+def _run_job(job):
+    """process pool entry point"""
+    size, seed, duration, mission = job
+    return run(size, duration, seed, mission)
+
+
+def sweep(sizes, seeds=(0,), duration=300000, mission=lap_mission, processes=None):
+    """
+    runs every fleet size with every seed across a process pool
+    mission: "module:function" or a picklable function returning the next queue of a truck
+    returns a list of FleetReport in the order of sizes and seeds
+    """
+    jobs = [(size, seed, duration, mission) for size in sizes for seed in seeds]
+    if processes == 1 or len(jobs) <= 1:
+        return [_run_job(job) for job in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_run_job, jobs, chunksize=1)
+
+
+def main():
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="simulate fleets of trucks and report their throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8], help="fleet sizes")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="seeds of the sensor noise")
+    parser.add_argument("--duration", type=int, default=300000, help="virtual ms every fleet runs for")
+    parser.add_argument("--mission", default="fleet:lap_mission", help="module:function returning the next queue of a truck")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, defaults to the number of cores")
+    args = parser.parse_args()
+    for report in sweep(args.sizes, args.seeds, args.duration, args.mission, args.processes):
+        print("seed {}: {}".format(report.seed, report))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,123 @@
+#! pylint: disable=line-too-long
+
+"""Rate-limited logging to an in-memory ring buffer."""
+
+from pybricks.tools import StopWatch
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+def format_record(record):
+    """returns a log record as a line of text"""
+    timestamp, level, message, fields = record
+    text = str(timestamp) + " " + LEVEL_NAMES.get(level, str(level)) + " " + message
+    if fields:
+        for key in sorted(fields):
+            text += " " + key + "=" + str(fields[key])
+    return text
+
+class Logger:
+    """
+    keeps log records in a fixed size ring buffer and writes the newest of them to the screen at a capped rate
+    records logged within the refresh interval of the last write wait for the next log call, poll() or flush()
+    records below the level are dropped, hot loops should check debug_enabled before building a message:
+        if robot.log.debug_enabled:
+            robot.log.debug("exit", dist=dist)
+    """
+    def __init__(self, sink, level=INFO, capacity=64, refresh_interval=250, screen_lines=4, echo=False):
+        """
+        Paramaters:
+        sink: function that writes text to the screen
+        level: lowest level that is recorded
+        capacity: number of records kept in the ring buffer
+        refresh_interval: shortest time between two writes to the screen in ms
+        screen_lines: most records written to the screen per refresh
+        echo: also print the records to the terminal when they are written to the screen
+        """
+        self.sink = sink
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.screen_lines = screen_lines
+        self.echo = echo
+        self.buffer = [None] * capacity
+        self.head = 0
+        self.count = 0
+        self.pending = 0
+        self.dropped = 0
+        self.watch = StopWatch()
+        self.last_flush = -refresh_interval
+        self.level = OFF
+        self.debug_enabled = False
+        self.info_enabled = False
+        self.set_level(level)
+
+    def set_level(self, level):
+        """change the lowest level that is recorded"""
+        self.level = level
+        self.debug_enabled = level <= DEBUG
+        self.info_enabled = level <= INFO
+
+    def log(self, level, message, fields=None):
+        """record a message with optional key/value fields"""
+        if level < self.level:
+            return
+        now = self.watch.time()
+        self.buffer[self.head] = (now, level, message, fields)
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        if self.pending < self.capacity:
+            self.pending += 1
+        else:
+            self.dropped += 1
+        if now - self.last_flush >= self.refresh_interval:
+            self.flush()
+
+    def debug(self, message, **fields):
+        """record a debug message"""
+        if self.debug_enabled:
+            self.log(DEBUG, message, fields)
+
+    def info(self, message, **fields):
+        """record an info message"""
+        if self.info_enabled:
+            self.log(INFO, message, fields)
+
+    def warning(self, message, **fields):
+        """record a warning"""
+        self.log(WARNING, message, fields)
+
+    def error(self, message, **fields):
+        """record an error"""
+        self.log(ERROR, message, fields)
+
+    def records(self, last=None):
+        """returns the buffered records, oldest first, optionally only the last ones"""
+        count = self.count if last is None else min(last, self.count)
+        start = (self.head - count) % self.capacity
+        return [self.buffer[(start + i) % self.capacity] for i in range(count)]
+
+    def lines(self, last=None):
+        """returns the buffered records as lines of text, oldest first"""
+        return [format_record(record) for record in self.records(last)]
+
+    def poll(self):
+        """write the pending records if the refresh interval has passed, call it regularly so the last records show up"""
+        if self.pending and self.watch.time() - self.last_flush >= self.refresh_interval:
+            self.flush()
+
+    def flush(self):
+        """write the newest pending records to the screen"""
+        self.last_flush = self.watch.time()
+        if self.pending == 0:
+            return
+        if self.echo:
+            for line in self.lines(self.pending):
+                print(line)
+        self.sink("\n".join(self.lines(min(self.pending, self.screen_lines))))
+        self.pending = 0
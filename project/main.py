@@ -3,14 +3,37 @@
 
 """The robot's main program."""
 
+# pylint: disable=wrong-import-position
 import sys
+from startup import StartupTimer
+STARTUP = StartupTimer()
+"""times the imports and device initialization, reported when PROFILE_STARTUP is set"""
 import commands as command
+STARTUP.mark("import commands")
 import enviroment as env
 from robot import Robot
+from telemetry import Recorder
+from calibration import CalibrationStore
+import colormodel
 from pybricks.tools import wait
+STARTUP.mark("import the rest")
 
 CALIBRATE = False
-"""should the robot execute the calibration commands?"""
+"""should the robot restore its calibration, running the calibration commands for results that are missing or stale?"""
+CALIBRATION_FILE = "calibration.json"
+"""path the calibration results are kept in between runs"""
+TELEMETRY_FILE = None
+"""path the telemetry of the mission is saved to, None to record nothing"""
+PROFILE_STARTUP = False
+"""should the robot print how long the imports and device initialization took?"""
+PROFILE_COMMANDS = False
+"""should the robot print how long every command took?"""
+PARAMETERS_FILE = None
+"""path of the parameters file written by tuning.py, None to use the built-in defaults"""
+COLOR_MODEL_FILE = None
+"""path of the adaptive color model, loaded before and saved after the mission, None to use the fixed enviroment colors"""
+MISSION_FILE = None
+"""path of a mission file run instead of the command queue below, None to run the queue"""
 
 # pylint: disable=missing-docstring
 def test_fn(robot: Robot):
@@ -19,29 +42,61 @@ def test_fn(robot: Robot):
     robot.print("end")
 
 def main():
-    robot = Robot()
+    robot = Robot(STARTUP if PROFILE_STARTUP else None)
+    if PARAMETERS_FILE is not None:
+        command.load_parameters(PARAMETERS_FILE)
+    if COLOR_MODEL_FILE is not None:
+        robot.colors = colormodel.rgb_model()
+        robot.colors.load(COLOR_MODEL_FILE)
+    if TELEMETRY_FILE is not None:
+        robot.telemetry = Recorder()
     command_queue = command.Queue("Main Command Queue")
     # initialize command queue
     if CALIBRATE:
-        calibration_queue = command.Queue("Calibrate the motors and sensors")
-        calibration_queue.append(command.CalibrateLiftAngle())
-        calibration_queue.append(command.CalibrateAmbientLight())
-        command_queue.append(calibration_queue)
-
-    # command_queue.append(command.Lambda(test_fn, name="Test the from_rgb function untill the touch sensor is pressed"))
-    # command_queue.append(command.Lambda(lambda: robot.print("this is an example lambda command"), name="Print example text."))
-    # command_queue.append(command.Lambda(test_fn, name="test"))
-    command_queue.append(command.ExitSpecifiedAreaInASafeManner())
-    # command_queue.append(command.FollowLineWhileAvoidingCollision(lambda: robot.touch_sensor.pressed(), "Follow standard line until the front touch sensor is pressed."))
-    # command_queue.append(command.Halt())
-    # command_queue.append(command.Lift())
-
-    # print the command queue as a tree
+        command_queue.append(command.Calibrate(CalibrationStore(CALIBRATION_FILE), name="Calibrate the motors and sensors"))
+
+    program = None
+    if MISSION_FILE is not None:
+        # imported only when used, it is not needed for the built-in queue and costs startup time
+        import mission  # pylint: disable=import-outside-toplevel
+        program = mission.load(MISSION_FILE, robot)
+        command_queue.append(program)
+    else:
+        # command_queue.append(command.Lambda(test_fn, name="Test the from_rgb function untill the touch sensor is pressed"))
+        # command_queue.append(command.Lambda(lambda: robot.print("this is an example lambda command"), name="Print example text."))
+        # command_queue.append(command.Lambda(test_fn, name="test"))
+        command_queue.append(command.ExitSpecifiedAreaInASafeManner.tuned())
+        # command_queue.append(command.FollowLineWhileAvoidingCollision(lambda: robot.touch_sensor.pressed(), "Follow standard line until the front touch sensor is pressed."))
+        # command_queue.append(command.Halt())
+        # command_queue.append(command.Lift())
+
+    # print the command queue as a tree, followed by the listing of the mission program
     robot.print(command_queue.tree_str())
+    if program is not None:
+        robot.print(program.tree_str())
+
+    STARTUP.finish("build the command queue")
+
+    if PROFILE_COMMANDS:
+        from profiler import Profiler  # pylint: disable=import-outside-toplevel
+        profile = command.add_hook(Profiler())
 
     # run the command queue
     command_queue.run(robot)
 
+    if PROFILE_COMMANDS:
+        robot.print(profile.report())
+
+    if PROFILE_STARTUP:
+        robot.print(STARTUP.report())
+
+    if robot.telemetry is not None:
+        robot.telemetry.save(TELEMETRY_FILE)
+
+    if robot.colors is not None:
+        robot.colors.save(COLOR_MODEL_FILE)
+
+    robot.log.flush()
     return 0
 
 if __name__ == '__main__':
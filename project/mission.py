@@ -0,0 +1,348 @@
+#! pylint: disable=line-too-long
+
+"""
+Declarative mission files compiled into flat programs.
+
+A mission is a JSON document describing a command tree:
+    {"name": "Deliver", "commands": [
+        {"type": "FollowLine", "until": {"pressed": true}, "speed": 120},
+        {"type": "Repeat", "times": 2, "commands": [{"type": "Turn", "angle": 90}]},
+        {"type": "If", "condition": {"color": "BLUE"}, "commands": [{"type": "Lift"}]},
+        {"type": "Parallel", "commands": [{"type": "MoveLift", "angle": 90}, {"type": "Wait", "duration": 500}]}
+    ]}
+Every command entry holds its type, an optional name and the parameters of the command.
+Commands that follow a line until something happens take an "until" condition.
+Conditions are {"pressed": true}, {"color": name}, {"distance_below": mm}, {"time_over": ms since the mission started},
+{"not": condition} or {"all": [conditions]} / {"any": [conditions]}.
+
+Missions are validated and compiled in a single pass into a Program: a flat list of instructions in which nested
+sequences are inlined and Repeat, While and If are jumps to precomputed targets, so running it is a plain loop.
+"""
+
+import json
+
+from pybricks.tools import StopWatch
+
+import commands as command
+import enviroment as env
+
+# opcodes
+RUN = "run"
+JUMP = "jump"
+JUMP_UNLESS = "jump_unless"
+SET = "set"
+LOOP = "loop"
+GROUP = "group"
+
+COMMANDS = {
+    "FollowLine": (command.FollowLine, (), ("inside", "outside", "speed", "gain", "rate"), True),
+    "FollowLineWhileAvoidingCollision": (command.FollowLineWhileAvoidingCollision, (), ("inside", "outside", "speed", "gain", "rate"), True),
+    "PIDFollowLine": (command.PIDFollowLine, (), ("inside", "outside", "min_speed", "max_speed", "kp", "ki", "kd", "derivative_filter", "integral_limit", "curve_window", "curve_gain", "acceleration", "rate"), True),
+    "CollisionAvoidance": (command.CollisionAvoidance, (), ("wait_time", "avoidance_distance"), False),
+    "PredictiveCollisionAvoidance": (command.PredictiveCollisionAvoidance, (), ("wait_time", "avoidance_distance", "slow_distance", "resume_distance", "slow_ttc", "stop_ttc", "min_speed_factor", "approach_speed", "approach_time", "stand_time", "pass_length"), False),
+    "ExitSpecifiedArea": (command.ExitSpecifiedArea, (), ("confirm",), False),
+    "ExitSpecifiedAreaInASafeManner": (command.ExitSpecifiedAreaInASafeManner, (), ("max_dist", "min_dist", "turn_dist", "confirm"), False),
+    "Lift": (command.Lift, (), ("speed", "duty_limit", "approach", "creep_speed", "max_approach", "preposition_angle", "stop_distance", "rate"), False),
+    "MoveLift": (command.MoveLift, ("angle",), ("speed",), False),
+    "Turn": (command.Turn, ("angle",), (), False),
+    "Wait": (command.Wait, ("duration",), (), False),
+    "Halt": (command.Halt, (), (), False),
+    "CalibrateLiftAngle": (command.CalibrateLiftAngle, (), (), False),
+    "CalibrateAmbientLight": (command.CalibrateAmbientLight, (), (), False),
+}
+"""command types: class, required parameters, optional parameters and whether it takes an "until" condition"""
+
+INTEGER = "integer"
+"""a parameter that only takes whole numbers, like a count or a window size"""
+POSITIVE = "positive"
+"""a parameter that only takes numbers above 0, like a rate"""
+PARAMETERS = {
+    "curve_window": INTEGER,
+    "confirm": INTEGER,
+    "rate": POSITIVE,
+    "approach": (command.STEPPED, command.CONTINUOUS),
+}
+"""parameters that are not plain numbers: INTEGER, POSITIVE or a tuple of the strings they take, every other parameter takes any number"""
+
+GROUPS = {"Parallel": command.Parallel, "Race": command.Race}
+BLOCKS = ("Sequence", "Repeat", "While", "If")
+KEYS = {
+    "Mission": ("name", "commands"),
+    "Sequence": ("type", "name", "commands"),
+    "Repeat": ("type", "name", "times", "commands"),
+    "While": ("type", "name", "condition", "commands"),
+    "If": ("type", "name", "condition", "commands"),
+    "Parallel": ("type", "name", "rate", "commands"),
+    "Race": ("type", "name", "rate", "commands"),
+}
+"""keys the mission document and every block and group entry may hold"""
+
+class MissionError(ValueError):
+    """raised when a mission does not describe a valid command tree"""
+
+class Program(command.Base):
+    """
+    a compiled mission, a flat list of (opcode, a, b) instructions
+    """
+    def __init__(self, name, instructions, counters, comments, on_start=None):
+        """
+        Paramaters:
+        name: name of the program
+        instructions: list of (opcode, a, b)
+        counters: number of loop counters the instructions use
+        comments: description of every instruction
+        on_start: function called every time the program starts
+        """
+        super().__init__(name=name)
+        self.instructions = instructions
+        self.counters = counters
+        self.comments = comments
+        self.on_start = on_start
+        self.current = None
+        """the command or group that is running"""
+
+    def steps(self, robot):
+        if self.on_start is not None:
+            self.on_start()
+        counters = [0] * self.counters
+        code = self.instructions
+        end = len(code)
+        pc = 0
+        while pc < end:
+            op, a, b = code[pc]
+            pc += 1
+            if op == RUN:
+                self.current = a
+                yield from command.steps_of(a, robot, self)
+            elif op == JUMP_UNLESS:
+                if not a():
+                    pc = b
+            elif op == JUMP:
+                pc = a
+            elif op == SET:
+                counters[a] = b
+            elif op == LOOP:
+                counters[a] -= 1
+                if counters[a] > 0:
+                    pc = b
+            elif op == GROUP:
+                group_class, name, rate = a
+                group = group_class(name, rate=rate)
+                for child in b:
+                    group.append(child)
+                self.current = group
+                yield from command.steps_of(group, robot, self)
+        self.current = None
+
+    def stop(self, robot):
+        """stops the command that is running when the program is cancelled"""
+        if self.current is not None:
+            self.current.stop(robot)
+
+    def tree_str(self, indent=0):
+        """returns the program listing"""
+        lines = ["\t" * indent + self.name + ": "]
+        for address, comment in enumerate(self.comments):
+            lines.append("\t" * (indent + 1) + str(address) + ": " + comment)
+        return "\n".join(lines) + "\n"
+
+    def tree(self, indent=0):
+        """prints the program listing"""
+        print(self.tree_str(indent), end="")
+
+class _Compiler:
+    """single pass validator and compiler of a mission"""
+    def __init__(self, robot):
+        self.robot = robot
+        self.watch = None
+        self.counters = 0
+
+    def start(self):
+        """restart the clock of the time conditions"""
+        self.watch = StopWatch()
+
+    def condition(self, spec, path):
+        """returns a function evaluating a condition and its description"""
+        if not isinstance(spec, dict) or len(spec) != 1:
+            raise MissionError(path + ": a condition is an object with one key")
+        key, value = next(iter(spec.items()))
+        robot = self.robot
+        if key == "pressed":
+            if not isinstance(value, bool):
+                raise MissionError(path + ".pressed: expected true or false")
+            return (lambda: robot.sensors.read("pressed") == value), "pressed is " + str(value)
+        if key == "color":
+            if value not in env.color_names:
+                raise MissionError(path + ".color: unknown color " + str(value))
+            return (lambda: env.from_rgb(robot.sensors.read("rgb")) == value), "color is " + value
+        if key in ("distance_below", "time_over") and not _is_number(value):
+            raise MissionError(path + "." + key + ": expected a number")
+        if key == "distance_below":
+            return (lambda: robot.sensors.read("distance") < value), "distance below " + str(value)
+        if key == "time_over":
+            return (lambda: self.watch.time() > value), "time over " + str(value)
+        if key == "not":
+            inner, text = self.condition(value, path + ".not")
+            return (lambda: not inner()), "not (" + text + ")"
+        if key in ("all", "any"):
+            if not isinstance(value, list) or not value:
+                raise MissionError(path + "." + key + ": expected a list of conditions")
+            parts = [self.condition(part, path + "." + key + "[" + str(i) + "]") for i, part in enumerate(value)]
+            fns = [fn for fn, _ in parts]
+            text = (" " + key[:3] + " ").join("(" + text + ")" for _, text in parts)
+            if key == "all":
+                return (lambda: all(fn() for fn in fns)), text
+            return (lambda: any(fn() for fn in fns)), text
+        raise MissionError(path + ": unknown condition " + key)
+
+    def command(self, spec, path):
+        """returns a command object for a command entry"""
+        kind = spec.get("type")
+        if kind in GROUPS or kind in BLOCKS:
+            code, comments = [], []
+            self.entry(spec, path, code, comments)
+            if kind in GROUPS:
+                return _Group(code[0][1], code[0][2])
+            return Program(str(spec.get("name", kind)), code, self.counters, comments)
+        if kind not in COMMANDS:
+            raise MissionError(path + ": unknown command type " + str(kind))
+        command_class, required, optional, needs_end = COMMANDS[kind]
+        kwargs = {}
+        for key, value in spec.items():
+            if key in ("type", "name", "until"):
+                continue
+            if key not in required and key not in optional:
+                raise MissionError(path + "." + key + ": unknown parameter of " + kind)
+            kwargs[key] = self.parameter(key, value, path + "." + key)
+        for key in required:
+            if key not in kwargs:
+                raise MissionError(path + ": " + kind + " requires " + key)
+        if "name" in spec:
+            kwargs["name"] = str(spec["name"])
+        if needs_end:
+            if "until" not in spec:
+                raise MissionError(path + ": " + kind + " requires an until condition")
+            kwargs["end_fn"] = self.condition(spec["until"], path + ".until")[0]
+        elif "until" in spec:
+            raise MissionError(path + ".until: " + kind + " does not take a condition")
+        return command_class.tuned(**kwargs)
+
+    def parameter(self, key, value, path):
+        """returns the value of a command parameter after checking it has the type the parameter takes"""
+        kind = PARAMETERS.get(key)
+        if kind == INTEGER:
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise MissionError(path + ": expected a positive integer")
+        elif kind == POSITIVE:
+            if not _is_number(value) or value <= 0:
+                raise MissionError(path + ": expected a positive number")
+        elif isinstance(kind, tuple):
+            if value not in kind:
+                raise MissionError(path + ": expected one of " + ", ".join(kind))
+        elif not _is_number(value):
+            raise MissionError(path + ": expected a number")
+        return value
+
+    def check_keys(self, spec, kind, path):
+        """raises MissionError if a block, group or the mission holds a key it does not take"""
+        for key in spec:
+            if key not in KEYS[kind]:
+                raise MissionError(path + "." + str(key) + ": unknown key of " + kind)
+
+    def block(self, spec, path, code, comments):
+        """compiles the commands of a block in place"""
+        children = spec.get("commands")
+        if not isinstance(children, list):
+            raise MissionError(path + ".commands: expected a list of commands")
+        for i, child in enumerate(children):
+            self.entry(child, path + ".commands[" + str(i) + "]", code, comments)
+
+    def entry(self, spec, path, code, comments):
+        """compiles one command entry, appending its instructions"""
+        if not isinstance(spec, dict):
+            raise MissionError(path + ": expected an object")
+        kind = spec.get("type")
+        if kind in BLOCKS or kind in GROUPS:
+            self.check_keys(spec, kind, path)
+        if kind == "Sequence":
+            self.block(spec, path, code, comments)
+        elif kind == "Repeat":
+            times = spec.get("times")
+            if not isinstance(times, int) or isinstance(times, bool) or times < 1:
+                raise MissionError(path + ".times: expected a positive integer")
+            slot = self.counters
+            self.counters += 1
+            code.append((SET, slot, times))
+            comments.append("repeat " + str(times) + " times")
+            start = len(code)
+            self.block(spec, path, code, comments)
+            code.append((LOOP, slot, start))
+            comments.append("loop -> " + str(start))
+        elif kind in ("While", "If"):
+            fn, text = self.condition(spec.get("condition"), path + ".condition")
+            check = len(code)
+            code.append(None)
+            comments.append(None)
+            self.block(spec, path, code, comments)
+            if kind == "While":
+                code.append((JUMP, check, None))
+                comments.append("jump -> " + str(check))
+            code[check] = (JUMP_UNLESS, fn, len(code))
+            comments[check] = ("while " if kind == "While" else "if ") + text + " else -> " + str(len(code))
+        elif kind in GROUPS:
+            children = spec.get("commands")
+            if not isinstance(children, list):
+                raise MissionError(path + ".commands: expected a list of commands")
+            members = [self.command(child, path + ".commands[" + str(i) + "]") for i, child in enumerate(children)]
+            name = str(spec.get("name", kind))
+            rate = spec.get("rate")
+            if rate is not None:
+                rate = self.parameter("rate", rate, path + ".rate")
+            code.append((GROUP, (GROUPS[kind], name, rate), members))
+            comments.append(kind.lower() + " " + name + ": " + ", ".join(str(member) for member in members))
+        else:
+            instance = self.command(spec, path)
+            code.append((RUN, instance, None))
+            comments.append("run " + str(instance))
+
+def _is_number(value):
+    """returns True if a JSON value is a number, booleans are not"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class _Group(command.Base):
+    """a Parallel or Race group nested in another group, built fresh every time it runs"""
+    def __init__(self, group, members):
+        super().__init__(name=group[1])
+        self.group = group
+        self.members = members
+
+    def steps(self, robot):
+        group_class, name, rate = self.group
+        group = group_class(name, rate=rate)
+        for member in self.members:
+            group.append(member)
+        yield from command.steps_of(group, robot, self)
+
+def compile_mission(spec, robot):
+    """validates a mission document and returns its Program"""
+    if not isinstance(spec, dict):
+        raise MissionError("mission: expected an object")
+    compiler = _Compiler(robot)
+    compiler.check_keys(spec, "Mission", "mission")
+    code, comments = [], []
+    compiler.block(spec, "mission", code, comments)
+    # time conditions count from the start of the mission
+    return Program(str(spec.get("name", "Mission")), code, compiler.counters, comments, on_start=compiler.start)
+
+def loads(text, robot):
+    """compiles a mission from a JSON string"""
+    try:
+        spec = json.loads(text)
+    except ValueError as error:
+        raise MissionError("mission: invalid JSON: " + str(error))
+    return compile_mission(spec, robot)
+
+def load(path, robot):
+    """compiles a mission from a JSON file"""
+    with open(path) as file:
+        return loads(file.read(), robot)
@@ -0,0 +1,300 @@
+#! pylint: disable=line-too-long
+
+"""
+Route planning over the warehouse line network.
+
+The warehouse is modelled as a graph whose nodes are line junctions, zones and pickup points and whose edges are
+colored line segments. Routes are found with Dijkstra (cached for all pairs) or A*, and compiled into a command.Queue
+of Turn, FollowLine and Lift commands ready to run.
+Coordinates are in mm with the y axis pointing away from the viewer of resources/environment.png, i.e. up in the image.
+"""
+
+import math
+
+try:
+    import heapq
+except ImportError:
+    import uheapq as heapq
+
+import commands as command
+import enviroment as env
+
+DISTANCE = "distance"
+"""route metric: shortest length"""
+TIME = "time"
+"""route metric: fastest at the speed of every segment"""
+
+TURN_THRESHOLD = 25
+"""smallest change of heading in degrees at a node that gets an explicit Turn, smaller ones are left to the line follower"""
+
+class Node:
+    """
+    a point of interest in the warehouse
+    kind: "junction", "zone" or "pickup"
+    marker: color the light sensor sees on arrival, None for junctions where it is the color of another line
+    """
+    def __init__(self, name, x, y, kind="junction", marker=None):
+        self.name = name
+        self.x = x
+        self.y = y
+        self.kind = kind
+        self.marker = marker
+
+class Edge:
+    """
+    a colored line between two nodes
+    points: polyline from a to b in mm, including both ends
+    speed: line following speed on the segment in mm/s
+    """
+    def __init__(self, a, b, color, points, speed=100):
+        self.a = a
+        self.b = b
+        self.color = color
+        self.points = points
+        self.speed = speed
+        self.length = sum(math.hypot(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in zip(points, points[1:]))
+
+    def other(self, node):
+        """returns the node at the other end of the edge"""
+        return self.b if node == self.a else self.a
+
+    def heading(self, node, leaving=True):
+        """returns the direction of travel in degrees counter-clockwise when leaving or arriving at a node"""
+        (x0, y0), (x1, y1) = (self.points[0], self.points[1]) if node == self.a else (self.points[-1], self.points[-2])
+        away = math.degrees(math.atan2(y1 - y0, x1 - x0))
+        return away if leaving else away + 180
+
+def _walk_back(via, start, goal):
+    """returns the edges from start to goal given the edge every node was reached by"""
+    if goal not in via:
+        raise ValueError("no route from " + start + " to " + goal)
+    edges = []
+    node = goal
+    while node != start:
+        edges.append(via[node])
+        node = via[node].other(node)
+    edges.reverse()
+    return edges
+
+def _turn_angle(heading_in, heading_out):
+    """returns the clockwise turn in degrees from one heading to another, in -180..180"""
+    return -((heading_out - heading_in + 180) % 360 - 180)
+
+class Planner:
+    """
+    the warehouse graph with cached shortest route tables
+    """
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+        """dict of node name to the list of edges at the node"""
+        self._tables = {}
+
+    def add_node(self, name, x, y, kind="junction", marker=None):
+        """add a node"""
+        self.nodes[name] = Node(name, x, y, kind, marker)
+        self.edges.setdefault(name, [])
+        self._tables = {}
+        return self.nodes[name]
+
+    def add_edge(self, a, b, color, points=None, speed=100):
+        """add a colored line between two nodes, a straight one if no points are given"""
+        if points is None:
+            points = [(self.nodes[a].x, self.nodes[a].y), (self.nodes[b].x, self.nodes[b].y)]
+        edge = Edge(a, b, color, points, speed)
+        self.edges[a].append(edge)
+        self.edges[b].append(edge)
+        self._tables = {}
+        return edge
+
+    def cost(self, edge, metric=DISTANCE):
+        """returns the cost of travelling an edge"""
+        return edge.length if metric == DISTANCE else edge.length / edge.speed
+
+    def _dijkstra(self, source, metric):
+        """returns the costs from source to every node and the edge each node is reached by"""
+        costs = {source: 0}
+        via = {source: None}
+        queue = [(0, source)]
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if cost > costs[node]:
+                continue
+            for edge in self.edges[node]:
+                other = edge.other(node)
+                new_cost = cost + self.cost(edge, metric)
+                if other not in costs or new_cost < costs[other]:
+                    costs[other] = new_cost
+                    via[other] = edge
+                    heapq.heappush(queue, (new_cost, other))
+        return costs, via
+
+    def table(self, metric=DISTANCE):
+        """returns the cached all pairs table: dict of source to (costs, edge each node is reached by)"""
+        if metric not in self._tables:
+            self._tables[metric] = {name: self._dijkstra(name, metric) for name in self.nodes}
+        return self._tables[metric]
+
+    def route(self, start, goal, metric=DISTANCE):
+        """returns the list of edges of the best route from start to goal, from the cached tables"""
+        if start not in self.nodes or goal not in self.nodes:
+            raise KeyError("unknown node: " + (goal if start in self.nodes else start))
+        return _walk_back(self.table(metric)[start][1], start, goal)
+
+    def route_cost(self, start, goal, metric=DISTANCE):
+        """returns the cost of the best route from start to goal"""
+        costs = self.table(metric)[start][0]
+        if goal not in costs:
+            raise ValueError("no route from " + start + " to " + goal)
+        return costs[goal]
+
+    def astar(self, start, goal, metric=DISTANCE):
+        """returns the list of edges of the best route from start to goal without building the tables"""
+        fastest = max([edge.speed for edges in self.edges.values() for edge in edges] or [1])
+        target = self.nodes[goal]
+
+        def estimate(name):
+            node = self.nodes[name]
+            distance = math.hypot(node.x - target.x, node.y - target.y)
+            return distance if metric == DISTANCE else distance / fastest
+
+        costs = {start: 0}
+        via = {start: None}
+        queue = [(estimate(start), 0, start)]
+        while queue:
+            _, cost, node = heapq.heappop(queue)
+            if node == goal:
+                break
+            if cost > costs[node]:
+                continue
+            for edge in self.edges[node]:
+                other = edge.other(node)
+                new_cost = cost + self.cost(edge, metric)
+                if other not in costs or new_cost < costs[other]:
+                    costs[other] = new_cost
+                    via[other] = edge
+                    heapq.heappush(queue, (new_cost + estimate(other), new_cost, other))
+        return _walk_back(via, start, goal)
+
+    def _marker(self, node, edge_in, edge_out):
+        """returns the color that tells the robot it arrived at a node"""
+        if self.nodes[node].marker is not None:
+            return self.nodes[node].marker
+        if edge_out is not None and edge_out.color != edge_in.color:
+            return edge_out.color
+        for edge in self.edges[node]:
+            if edge.color != edge_in.color:
+                return edge.color
+        raise ValueError("node " + node + " can not be told apart from the line leading to it")
+
+    def compile(self, robot, start, edges, heading=None, name=None):
+        """
+        returns a command.Queue driving the route
+        robot: the robot the end conditions read the sensors of
+        start: node the route starts at
+        edges: the route as returned by route
+        heading: direction the robot faces at the start in degrees, None if it already faces along the first edge
+        """
+        queue = command.Queue(name if name is not None else "Route from " + start)
+        node = start
+        for i, edge in enumerate(edges):
+            leaving = edge.heading(node, leaving=True)
+            if heading is not None:
+                angle = _turn_angle(heading, leaving)
+                if abs(angle) >= TURN_THRESHOLD:
+                    queue.append(command.Turn(round(angle), name="Turn " + str(round(angle)) + " at " + node))
+            target = edge.other(node)
+            marker = self._marker(target, edge, edges[i + 1] if i + 1 < len(edges) else None)
+            queue.append(command.FollowLine(
+                _arrived(robot, marker),
+                name="Follow " + edge.color + " to " + target,
+                inside=env.color_dict[edge.color][0],
+                outside=env.REFLECT_WHITE,
+                speed=edge.speed))
+            heading = edge.heading(target, leaving=False)
+            node = target
+        return queue
+
+    def mission(self, robot, stops, metric=DISTANCE, heading=None, lift=True):
+        """
+        returns a command.Queue visiting the stops in order, lifting at every pickup point on the way
+        stops: node names, the first is where the robot starts
+        heading: direction the robot faces at the start in degrees, None if it already faces along the first line
+        """
+        mission = command.Queue("Mission " + " -> ".join(stops))
+        for start, goal in zip(stops, stops[1:]):
+            edges = self.route(start, goal, metric)
+            mission.append(self.compile(robot, start, edges, heading, name="Route " + start + " -> " + goal))
+            if lift and self.nodes[goal].kind == "pickup":
+                mission.append(command.Lift(name="Lift at " + goal))
+            heading = edges[-1].heading(goal, leaving=False) if edges else heading
+        return mission
+
+def _arrived(robot, marker):
+    """
+    returns an end function that is True when the light sensor sees the marker color,
+    env.from_rgb gives the exact nearest color so the lookup table does not move the borders between markers
+    """
+    return lambda: env.from_rgb(robot.sensors.read("rgb")) == marker
+
+# The layout of resources/environment.png, measured in image pixels and scaled to mm.
+MM_PER_PX = 2.0
+"""scale of resources/environment.png"""
+_IMAGE_HEIGHT = 867
+_CIRCLE = (610, 645, 113)
+"""center and radius of the central circle in pixels"""
+_JUNCTIONS = {"junction_red": 122, "junction_blue": 48, "junction_green": -41, "junction_brown": -110}
+"""angles of the junctions on the central circle, counter-clockwise from the right"""
+
+def _mm(x, y):
+    """converts image pixel coordinates to mm"""
+    return x * MM_PER_PX, (_IMAGE_HEIGHT - y) * MM_PER_PX
+
+def _on_circle(angle):
+    """returns the point of the central circle at an angle in mm"""
+    cx, cy, radius = _CIRCLE
+    return _mm(cx + radius * math.cos(math.radians(angle)), cy - radius * math.sin(math.radians(angle)))
+
+def _arc(start, end, steps=8):
+    """returns the points of the central circle from one angle to another, counter-clockwise"""
+    end = end if end > start else end + 360
+    return [_on_circle(start + (end - start) * i / steps) for i in range(steps + 1)]
+
+def _line(pixels, junction):
+    """returns the points of a line drawn through image pixels that ends on the central circle"""
+    return [_mm(x, y) for x, y in pixels] + [_on_circle(_JUNCTIONS[junction])]
+
+def warehouse():
+    """returns a Planner of the warehouse in resources/environment.png"""
+    planner = Planner()
+    for name, angle in _JUNCTIONS.items():
+        planner.add_node(name, *_on_circle(angle))
+    planner.add_node("red_warehouse", *_mm(530, 205), kind="zone", marker="BLACK")
+    planner.add_node("blue_warehouse", *_mm(848, 205), kind="zone", marker="BLACK")
+    planner.add_node("warehouse", *_mm(320, 648), kind="pickup", marker="BLACK")
+    planner.add_node("pickup", *_mm(912, 648), kind="pickup", marker="BLACK")
+    # the central circle, followed slowly because it is tight
+    order = ["junction_blue", "junction_red", "junction_brown", "junction_green"]
+    for i, name in enumerate(order):
+        following = order[(i + 1) % len(order)]
+        planner.add_edge(name, following, "PURLE", _arc(_JUNCTIONS[name], _JUNCTIONS[following]), speed=80)
+    planner.add_edge("red_warehouse", "junction_red", "PINK", _line([
+        (530, 205), (530, 265), (510, 290), (450, 292), (425, 330), (430, 360), (480, 370), (495, 395), (495, 490)], "junction_red"))
+    planner.add_edge("blue_warehouse", "junction_blue", "BLUE", _line([
+        (848, 205), (848, 275), (755, 368), (755, 490)], "junction_blue"), speed=150)
+    planner.add_edge("warehouse", "junction_brown", "BROWN", _line([
+        (320, 648), (420, 648), (440, 680), (440, 760), (480, 800), (540, 800)], "junction_brown"))
+    planner.add_edge("pickup", "junction_green", "GREEN", _line([
+        (912, 648), (820, 648), (815, 660), (815, 770), (790, 775), (785, 625), (750, 620), (745, 745), (718, 748)], "junction_green"), speed=80)
+    return planner
+
+_warehouse = None
+"""the shared planner of the warehouse, built on first use"""
+
+def warehouse_planner():
+    """returns the shared planner of the warehouse in resources/environment.png, building it on first use"""
+    # pylint: disable=global-statement
+    global _warehouse
+    if _warehouse is None:
+        _warehouse = warehouse()
+    return _warehouse
@@ -0,0 +1,134 @@
+#! pylint: disable=line-too-long
+
+"""
+Per-command profiling.
+
+A Profiler is a commands.Hook that records for every command how often it ran, how long it took, how many steps it
+made and a histogram of the time between its steps. The records form a tree mirroring the command queues, commands
+with the same name and type under the same parent are counted together so loops add up instead of repeating.
+Recording costs one clock read and a few additions per step, so it can stay on during missions.
+
+    profiler = commands.add_hook(Profiler())
+    queue.run(robot)
+    robot.print(profiler.report())
+"""
+
+from pybricks.tools import StopWatch
+
+import commands as command
+
+PERIOD_BINS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+"""upper bounds in ms of the loop period histogram bins, longer periods go to a last bin"""
+
+class CommandProfile:
+    """
+    the timing of one command in the tree
+    """
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.time = 0
+        """ms spent in all runs"""
+        self.steps = 0
+        self.periods = [0] * (len(PERIOD_BINS) + 1)
+        """number of steps that took up to each bound of PERIOD_BINS, the last entry counts the longer ones"""
+        self.longest = 0
+        """longest time between two steps in ms"""
+        self.children = []
+        self._index = {}
+
+    def child(self, key, name):
+        """returns the profile of a child command, creating it on its first run"""
+        profile = self._index.get(key)
+        if profile is None:
+            profile = CommandProfile(name)
+            self._index[key] = profile
+            self.children.append(profile)
+        return profile
+
+    def histogram(self):
+        """returns the loop period histogram as text, only the bins that are not empty"""
+        parts = []
+        for i, count in enumerate(self.periods):
+            if count:
+                parts.append(("<=" + str(PERIOD_BINS[i]) if i < len(PERIOD_BINS) else ">" + str(PERIOD_BINS[-1])) + ":" + str(count))
+        return " ".join(parts)
+
+    def line(self):
+        """returns the profile as one line of text"""
+        text = "{}: {} run{}, {} ms, {} steps".format(self.name, self.runs, "" if self.runs == 1 else "s", self.time, self.steps)
+        if self.steps:
+            text += ", period ms " + self.histogram() + " max " + str(self.longest)
+        return text
+
+class _Running:
+    """a command that has started and not finished"""
+    def __init__(self, profile, start):
+        self.profile = profile
+        self.start = start
+        self.last = start
+
+class Profiler(command.Hook):
+    """
+    records the time, steps and loop periods of every command
+    """
+    def __init__(self, name="Profile"):
+        self.watch = StopWatch()
+        self.root = CommandProfile(name)
+        self.running = {}
+        """_Running of every command that has started, by the ids of its parent and itself,
+        one command object can run under several parents at once"""
+        self.latest = {}
+        """the last started _Running of every command that has not finished, by id, to find the profile of a parent"""
+
+    def command_started(self, cmd, parent):
+        running = self.latest.get(id(parent)) if parent is not None else None
+        parent_profile = running.profile if running is not None else self.root
+        profile = parent_profile.child((type(cmd).__name__, str(cmd)), str(cmd))
+        profile.runs += 1
+        running = _Running(profile, self.watch.time())
+        self.running[(id(parent), id(cmd))] = running
+        self.latest[id(cmd)] = running
+
+    def command_ticked(self, cmd, parent):
+        running = self.running.get((id(parent), id(cmd)))
+        if running is None:
+            return
+        now = self.watch.time()
+        period = now - running.last
+        running.last = now
+        profile = running.profile
+        profile.steps += 1
+        if period > profile.longest:
+            profile.longest = period
+        i = 0
+        for bound in PERIOD_BINS:
+            if period <= bound:
+                break
+            i += 1
+        profile.periods[i] += 1
+
+    def command_finished(self, cmd, parent):
+        running = self.running.pop((id(parent), id(cmd)), None)
+        if running is not None:
+            running.profile.time += self.watch.time() - running.start
+            if self.latest.get(id(cmd)) is running:
+                del self.latest[id(cmd)]
+
+    def reset(self):
+        """forget everything recorded so far"""
+        self.root = CommandProfile(self.root.name)
+        self.running = {}
+        self.latest = {}
+
+    def report(self, indent=0):
+        """returns the recorded profiles as a tree like commands.Queue.tree_str"""
+        lines = []
+        self._report_lines(self.root.children, indent, lines)
+        return "\n".join(lines) + "\n"
+
+    def _report_lines(self, profiles, indent, lines):
+        """appends a line for every profile and its children"""
+        for profile in profiles:
+            lines.append("\t" * indent + profile.line())
+            self._report_lines(profile.children, indent + 1, lines)
@@ -0,0 +1,309 @@
+#! pylint: disable=line-too-long
+
+"""
+Deterministic replay of recorded sensor streams through unmodified commands.
+
+A ReplayRobot answers sensor reads from a Recording at the current virtual time and logs every call the command makes
+to its actuators. Telemetry only records the reflection, rgb and distance streams, so a command reading the touch sensor or
+the ambient light, like Lift or the calibrations, can not be replayed from it and raises a ValueError instead of running
+on made up readings. Replays run on the simulation's virtual clock, so they take as long as the CPU needs rather than the
+length of the recording, and the logged outputs can be diffed against a reference to catch controller regressions.
+
+Usage: python replay.py module:factory recording.bin [recording.bin ...] [--update] [--processes N]
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+from bisect import bisect_right
+
+from simulation import Simulation, SimRobot
+import telemetry
+
+ACTUATOR_METHODS = {
+    "drive", "stop", "straight", "turn", "settings",
+    "run", "run_time", "run_angle", "run_target", "run_until_stalled", "hold", "brake", "reset_angle",
+}
+"""device methods whose calls are logged as outputs"""
+
+REFERENCE_SUFFIX = ".ref.json"
+"""suffix of the reference outputs stored next to a recording"""
+
+TICKS = "ticks"
+"""index of the mismatch of the tick count in the results of regress"""
+TIMED_OUT = "timed out"
+"""index of the mismatch of whether the recording ran out in the results of regress"""
+
+
+class Recording:
+    """
+    time series of sensor readings, every stream is a list of (time in ms, value) sorted by time
+    readings are held until the next sample
+    """
+    def __init__(self, streams, defaults=None):
+        """
+        Paramaters:
+        streams: dict of stream name ("reflection", "rgb", "distance", "pressed", "ambient") to samples
+        defaults: dict of values returned by streams without samples, reading any other stream without samples raises a ValueError
+        """
+        start = min((samples[0][0] for samples in streams.values() if samples), default=0)
+        self.streams = {}
+        for name, samples in streams.items():
+            if samples:
+                self.streams[name] = ([time - start for time, _ in samples], [value for _, value in samples])
+        self.defaults = dict(defaults) if defaults is not None else {}
+        self.duration = max((times[-1] for times, _ in self.streams.values()), default=0)
+
+    @classmethod
+    def from_telemetry(cls, recorded):
+        """builds a recording from a telemetry.Telemetry"""
+        streams = {"reflection": [], "rgb": [], "distance": []}
+        for i, time in enumerate(recorded.time):
+            if recorded.reflection[i] != telemetry.MISSING:
+                streams["reflection"].append((time, recorded.reflection[i]))
+            if recorded.red[i] != telemetry.MISSING:
+                streams["rgb"].append((time, (recorded.red[i], recorded.green[i], recorded.blue[i])))
+            if recorded.distance[i] != telemetry.MISSING:
+                streams["distance"].append((time, recorded.distance[i]))
+        return cls(streams)
+
+    @classmethod
+    def load(cls, path):
+        """loads a recording from a telemetry file"""
+        return cls.from_telemetry(telemetry.load(path))
+
+    def value_at(self, name, time):
+        """returns the latest reading of a stream at the given time"""
+        stream = self.streams.get(name)
+        if stream is None:
+            if name not in self.defaults:
+                raise ValueError("the recording has no " + name + " stream to replay")
+            return self.defaults[name]
+        times, values = stream
+        return values[max(0, bisect_right(times, time) - 1)]
+
+
+class ReplaySensor:
+    """answers the reads of every sensor from a recording at the current virtual time"""
+    def __init__(self, recording, sim):
+        self.recording = recording
+        self.sim = sim
+
+    def _read(self, name):
+        """spend the read cost and return the recorded value"""
+        self.sim.spend(name)
+        return self.recording.value_at(name, self.sim.time())
+
+    def reflection(self):
+        """returns the recorded reflection"""
+        return self._read("reflection")
+
+    def rgb(self):
+        """returns the recorded rgb readout"""
+        return self._read("rgb")
+
+    def ambient(self):
+        """returns the recorded ambient light"""
+        return self._read("ambient")
+
+    def distance(self, silent=False):
+        """returns the recorded distance"""
+        # pylint: disable=unused-argument
+        return self._read("distance")
+
+    def pressed(self):
+        """returns the recorded touch sensor state"""
+        return self._read("pressed")
+
+    def presence(self):
+        """returns False"""
+        return False
+
+
+class RecordedDevice:
+    """wraps a device and logs calls to its actuator methods"""
+    def __init__(self, device, name, outputs, sim):
+        self._device = device
+        self._name = name
+        self._outputs = outputs
+        self._sim = sim
+
+    def __getattr__(self, attr):
+        value = getattr(self._device, attr)
+        if attr not in ACTUATOR_METHODS:
+            return value
+
+        def call(*args, **kwargs):
+            self._outputs.append((round(self._sim.time(), 3), self._name, attr, list(args) + [kwargs[key] for key in sorted(kwargs)]))
+            return value(*args, **kwargs)
+        return call
+
+
+class ReplayRobot(SimRobot):
+    """
+    a Robot whose sensors replay a recording and whose drive base and lift log the commands they receive
+    """
+    def __init__(self, recording, sim=None):
+        super().__init__(sim if sim is not None else Simulation())
+        self.recording = recording
+        self.outputs = []
+        """list of (time in ms, device, method, arguments) of every actuator call"""
+        sensor = ReplaySensor(recording, self.sim)
+        self.light_sensor = sensor
+        self.ultrasonic_sensor = sensor
+        self.touch_sensor = sensor
+        self.drivebase = RecordedDevice(self.drivebase, "drivebase", self.outputs, self.sim)
+        self.lift_motor = RecordedDevice(self.lift_motor, "lift_motor", self.outputs, self.sim)
+
+
+class ReplayResult:
+    """the outputs of one replay"""
+    def __init__(self, name, outputs, report):
+        self.name = name
+        self.outputs = outputs
+        self.report = report
+
+
+def replay(recording, command, name=None):
+    """
+    runs a command against a recording until the command ends or the recording runs out
+    returns a ReplayResult
+    """
+    robot = ReplayRobot(recording)
+    report = robot.sim.run(command, robot, time_limit=recording.duration)
+    return ReplayResult(name, robot.outputs, report)
+
+
+def resolve_factory(factory):
+    """returns the command factory named by "module:function", or the factory itself if it is callable"""
+    if callable(factory):
+        return factory
+    module_name, function_name = factory.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def replay_file(path, factory):
+    """replays a telemetry file through a new command from the factory"""
+    return replay(Recording.load(path), resolve_factory(factory)(), name=path)
+
+
+def _replay_job(job):
+    """process pool entry point"""
+    path, factory = job
+    result = replay_file(path, factory)
+    # the report holds nothing that needs to go back to the parent
+    return result.name, result.outputs, result.report.virtual_ms, result.report.ticks, result.report.timed_out
+
+
+def replay_files(paths, factory, processes=None):
+    """
+    replays many telemetry files across a process pool
+    factory: "module:function" or a picklable function returning a new command
+    returns a list of (path, outputs, virtual ms, ticks, recording exhausted)
+    """
+    jobs = [(path, factory) for path in paths]
+    if processes == 1 or len(jobs) <= 1:
+        return [_replay_job(job) for job in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_replay_job, jobs, chunksize=max(1, len(jobs) // (4 * (processes or multiprocessing.cpu_count()))))
+
+
+def save_outputs(path, outputs, ticks=None, timed_out=None):
+    """stores outputs, the number of ticks and whether the recording ran out as a reference"""
+    with open(path, "w") as file:
+        json.dump({"outputs": outputs, TICKS: ticks, TIMED_OUT: timed_out}, file)
+
+
+def load_outputs(path):
+    """
+    loads a reference, returns the outputs, the number of ticks and whether the recording ran out,
+    references stored as a bare list of outputs have no ticks and timed out of None
+    """
+    with open(path) as file:
+        reference = json.load(file)
+    if isinstance(reference, list):
+        reference = {"outputs": reference}
+    return [tuple(output) for output in reference["outputs"]], reference.get(TICKS), reference.get(TIMED_OUT)
+
+
+def diff(actual, expected, time_tolerance=0.5, value_tolerance=1e-6, limit=10):
+    """
+    returns a list of (index, expected output, actual output) where the outputs differ, at most limit entries
+    outputs match when the device and method are equal and time and arguments are within tolerance
+    """
+    mismatches = []
+    for i in range(max(len(actual), len(expected))):
+        if len(mismatches) >= limit:
+            break
+        got = tuple(actual[i]) if i < len(actual) else None
+        want = tuple(expected[i]) if i < len(expected) else None
+        if got is None or want is None or not _same_output(got, want, time_tolerance, value_tolerance):
+            mismatches.append((i, want, got))
+    return mismatches
+
+
+def _same_output(got, want, time_tolerance, value_tolerance):
+    """returns True if two outputs match within tolerance"""
+    if got[1:3] != want[1:3] or abs(got[0] - want[0]) > time_tolerance or len(got[3]) != len(want[3]):
+        return False
+    for got_arg, want_arg in zip(got[3], want[3]):
+        if isinstance(got_arg, (int, float)) and isinstance(want_arg, (int, float)):
+            if abs(got_arg - want_arg) > value_tolerance:
+                return False
+        elif got_arg != want_arg:
+            return False
+    return True
+
+
+def regress(paths, factory, update=False, processes=None, **tolerances):
+    """
+    replays recordings and compares the outputs against the references stored next to them
+    update: store the outputs as the new references instead of comparing
+    returns a dict of path to the list of mismatches, empty when the outputs match,
+    a replay that ran a different number of ticks than the reference, or ran out of recording when the reference did not,
+    fails with a mismatch at index TICKS or TIMED_OUT even if every output it made matches
+    """
+    results = {}
+    for path, outputs, _, ticks, timed_out in replay_files(paths, factory, processes):
+        reference = path + REFERENCE_SUFFIX
+        # round trip through json so tuples and lists compare alike
+        outputs = [tuple(output) for output in json.loads(json.dumps(outputs))]
+        if update:
+            save_outputs(reference, outputs, ticks, timed_out)
+            results[path] = []
+            continue
+        expected, expected_ticks, expected_timed_out = load_outputs(reference)
+        mismatches = []
+        if expected_ticks is not None and ticks != expected_ticks:
+            mismatches.append((TICKS, expected_ticks, ticks))
+        if expected_timed_out is not None and timed_out != expected_timed_out:
+            mismatches.append((TIMED_OUT, expected_timed_out, timed_out))
+        results[path] = mismatches + diff(outputs, expected, **tolerances)
+    return results
+
+
+def main():
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="replay recorded sensor streams through a command and compare the outputs")
+    parser.add_argument("factory", help="module:function returning the command to replay")
+    parser.add_argument("recordings", nargs="+", help="telemetry files")
+    parser.add_argument("--update", action="store_true", help="store the outputs as the new references")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, defaults to the number of cores")
+    args = parser.parse_args()
+    results = regress(args.recordings, args.factory, update=args.update, processes=args.processes)
+    failed = 0
+    for path, mismatches in results.items():
+        if mismatches:
+            failed += 1
+            print("FAIL " + path)
+            for index, want, got in mismatches:
+                print("    #{} expected {} got {}".format(index, want, got))
+        else:
+            print("ok   " + path)
+    print("{} of {} recordings differ".format(failed, len(results)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,27 +9,110 @@ from pybricks.parameters import Direction, Port, Button
 from pybricks.robotics import DriveBase
 from pybricks.tools import wait
 
+from log import Logger
+from sensorhub import SensorHub
+
+CONTROL_TICK = 1
+"""ms of the shortest control loop tick, no tick is shorter than the reflection read it makes on the brick"""
+
+SENSOR_PERIODS = {
+    "reflection": CONTROL_TICK,
+    "rgb": CONTROL_TICK,
+    "pressed": CONTROL_TICK,
+    "distance": 50,
+    "ambient": 1000,
+}
+"""
+ms a reading of each sensor stays valid in the sensor hub, the light and touch sensors are read at most once a control tick
+so the end condition and the command reading them in the same tick share one read, the ultrasonic sensor is slow so it is read at 20 Hz and the ambient
+light is only read by the calibration
+"""
+
 #pylint: disable=too-many-instance-attributes
 class Robot:
     """
     contains the initailised components and paramaters of the robot
+    devices are constructed the first time they are used, so a mission only initializes the devices it needs
     """
-    def __init__(self):
+    DEVICES = {
+        "touch_sensor": lambda robot: TouchSensor(Port.S1),
+        "light_sensor": lambda robot: ColorSensor(Port.S3),
+        "ultrasonic_sensor": lambda robot: UltrasonicSensor(Port.S4),
+        "lift_motor": lambda robot: Motor(Port.A, positive_direction = Direction.CLOCKWISE, gears = [12, 36]),
+        "left_motor": lambda robot: Motor(Port.C, positive_direction = Direction.COUNTERCLOCKWISE, gears = [12, 20] ),
+        "right_motor": lambda robot: Motor(Port.B, positive_direction = Direction.COUNTERCLOCKWISE, gears = [12, 20]),
+        "drivebase": lambda robot: DriveBase(robot.left_motor, robot.right_motor, wheel_diameter= 47, axle_track= 128),
+        "brick": lambda robot: EV3Brick(),
+    }
+    """factories of the robot's devices by attribute name"""
+    PORTS = {
+        "touch_sensor": "S1",
+        "light_sensor": "S3",
+        "ultrasonic_sensor": "S4",
+        "lift_motor": "A",
+        "left_motor": "C",
+        "right_motor": "B",
+    }
+    """ports the devices are plugged into, stored with calibration results to tell the devices apart"""
+
+    def __init__(self, startup=None):
         """
         initialize the robots components
+        startup: startup.StartupTimer that records how long each device takes to initialize
         """
-        # devices
-        self.touch_sensor = TouchSensor(Port.S1)
-        self.light_sensor = ColorSensor(Port.S3)
-        self.ultrasonic_sensor = UltrasonicSensor(Port.S4)
-        self.lift_motor = Motor(Port.A, positive_direction = Direction.CLOCKWISE, gears = [12, 36])
-        self.left_motor = Motor(Port.C, positive_direction = Direction.COUNTERCLOCKWISE, gears = [12, 20] )
-        self.right_motor = Motor(Port.B, positive_direction = Direction.COUNTERCLOCKWISE, gears = [12, 20])
-        self.drivebase = DriveBase(self.left_motor, self.right_motor, wheel_diameter= 47, axle_track= 128)
-        self.brick = EV3Brick()
+        self.startup = startup
 
         # constants/params
         self.lift_max_angle = None
+        self.AMBIENT_LIGHT = None  # pylint: disable=invalid-name
+
+        self.sensors = self.create_sensor_hub()
+        self.log = Logger(lambda text: self.brick.screen.print(text), echo=True)
+        self.telemetry = None
+        """telemetry.Recorder the commands feed every tick, None to record nothing"""
+        self.colors = None
+        """colormodel.ColorModel of rgb readouts the commands match and refine, None to match the fixed enviroment colors"""
+
+    def __getattr__(self, name):
+        """
+        construct a device the first time it is used, later uses find it as a plain attribute
+        """
+        factory = self.DEVICES.get(name)
+        if factory is None:
+            raise AttributeError(name)
+        if self.startup is not None:
+            start = self.startup.time()
+            device = factory(self)
+            self.startup.add("device " + name, self.startup.time() - start)
+        else:
+            device = factory(self)
+        setattr(self, name, device)
+        return device
+
+    def init_devices(self, *names):
+        """
+        construct devices ahead of their first use, all of them if no names are given
+        """
+        for name in names if names else self.DEVICES:
+            getattr(self, name)
+
+    def initialized_devices(self):
+        """
+        returns the names of the devices that have been constructed
+        """
+        return [name for name in self.DEVICES if name in self.__dict__]
+
+    def create_sensor_hub(self):
+        """
+        returns a SensorHub polling the robot's sensors at the rates in SENSOR_PERIODS
+        """
+        hub = SensorHub()
+        hub.add("reflection", lambda: self.light_sensor.reflection(), SENSOR_PERIODS["reflection"])
+        hub.add("rgb", lambda: self.light_sensor.rgb(), SENSOR_PERIODS["rgb"])
+        hub.add("pressed", lambda: self.touch_sensor.pressed(), SENSOR_PERIODS["pressed"])
+        hub.add("distance", lambda: self.ultrasonic_sensor.distance(), SENSOR_PERIODS["distance"])
+        hub.add("ambient", lambda: self.light_sensor.ambient(), SENSOR_PERIODS["ambient"])
+        return hub
 
     def print(self, text):
         """
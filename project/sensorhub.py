@@ -0,0 +1,117 @@
+#! pylint: disable=line-too-long
+
+"""Multi-rate sensor polling with cached readings."""
+
+from pybricks.tools import StopWatch, wait
+
+class Channel:
+    """
+    a sensor read function with its polling period and latest reading
+    """
+    def __init__(self, read_fn, period):
+        self.read_fn = read_fn
+        self.period = period
+        self.value = None
+        self.timestamp = None
+        self.reads = 0
+        self.hits = 0
+
+    def refresh(self, now):
+        """read the sensor and cache the value"""
+        self.value = self.read_fn()
+        self.timestamp = now
+        self.reads += 1
+
+class SensorHub:
+    """
+    polls every sensor at its own rate and caches the latest value with a timestamp
+    reading a channel within its period returns the cached value without any I/O,
+    so a slow sensor does not hold back the loops that read the fast ones
+    """
+    def __init__(self):
+        self.watch = StopWatch()
+        self.channels = {}
+        self.threaded = False
+        self._stop = False
+
+    def add(self, name, read_fn, period=0):
+        """
+        register a sensor
+        name: name the value is read by
+        read_fn: function that reads the sensor
+        period: ms a reading stays valid, 0 reads the sensor every time
+        """
+        self.channels[name] = Channel(read_fn, period)
+
+    def set_period(self, name, period):
+        """change how long a reading stays valid in ms"""
+        self.channels[name].period = period
+
+    def read(self, name):
+        """
+        returns the value of a sensor, only reading it when the cached value is older than its period
+        while the polling thread runs the device is never read here, a sensor it has not polled yet is waited for
+        """
+        channel = self.channels[name]
+        if self.threaded:
+            while channel.timestamp is None and self.threaded:
+                wait(1)
+            if channel.timestamp is not None:
+                channel.hits += 1
+                return channel.value
+        now = self.watch.time()
+        if channel.timestamp is None or now - channel.timestamp >= channel.period:
+            channel.refresh(now)
+        else:
+            channel.hits += 1
+        return channel.value
+
+    def latest(self, name):
+        """returns the cached value and its timestamp in ms without reading the sensor"""
+        channel = self.channels[name]
+        return channel.value, channel.timestamp
+
+    def age(self, name):
+        """returns the age of the cached value in ms, None if the sensor was never read"""
+        timestamp = self.channels[name].timestamp
+        return None if timestamp is None else self.watch.time() - timestamp
+
+    def invalidate(self, name=None):
+        """force the next read of a sensor, or all sensors, to read the device, or to wait for the polling thread to read it"""
+        for key, channel in self.channels.items():
+            if name is None or key == name:
+                channel.timestamp = None
+
+    def poll(self):
+        """read every sensor whose cached value is older than its period"""
+        now = self.watch.time()
+        for channel in self.channels.values():
+            if channel.timestamp is None or now - channel.timestamp >= channel.period:
+                channel.refresh(now)
+                now = self.watch.time()
+
+    def start_thread(self, interval=1):
+        """
+        poll the sensors in a background thread every interval ms, reads then never touch the devices
+        only for the brick, the simulated devices are not thread safe
+        """
+        # pylint: disable=import-outside-toplevel
+        import _thread
+        self._stop = False
+        self.threaded = True
+        _thread.start_new_thread(self._poll_forever, (interval,))
+
+    def stop_thread(self):
+        """stop the background polling thread"""
+        self._stop = True
+        self.threaded = False
+
+    def _poll_forever(self, interval):
+        """body of the background polling thread"""
+        while not self._stop:
+            self.poll()
+            wait(interval)
+
+    def stats(self):
+        """returns a dict with the number of device reads and cache hits of every sensor"""
+        return {name: (channel.reads, channel.hits) for name, channel in self.channels.items()}
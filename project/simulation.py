@@ -0,0 +1,842 @@
+#! pylint: disable=line-too-long
+#! pylint: disable=too-few-public-methods
+
+"""
+Simulated pybricks backend for running commands off-robot.
+
+Importing this module registers a stand-in ``pybricks`` package in ``sys.modules`` (unless the real one is present)
+so ``robot`` and ``commands`` can be imported unmodified on a desktop machine.
+Every device reads from and acts on the active ``Simulation``, which owns a virtual clock.
+Time only passes when a command waits, moves or talks to a device, so missions run much faster than real time.
+
+Coordinates are in mm, headings in degrees counter-clockwise from the x axis and times in ms.
+"""
+
+import math
+import random
+import sys
+import time as _time
+import types
+
+import enviroment as env
+
+NO_ECHO = 2550
+"""distance reported by the ultrasonic sensor when nothing is in range (mm)"""
+
+READ_COSTS = {
+    "reflection": 1.0,
+    "rgb": 2.0,
+    "ambient": 1.0,
+    "color": 2.0,
+    "distance": 4.0,
+    "pressed": 0.2,
+    "motor": 0.1,
+    "drive": 0.3,
+    "screen": 15.0,
+    "buttons": 0.2,
+    "clock": 0.05,
+}
+"""virtual time in ms spent by each kind of device call"""
+
+
+class SimulationTimeout(Exception):
+    """raised when the virtual clock passes the simulation's time limit"""
+
+
+class Floor:
+    """
+    a flat floor made of colored shapes, later shapes are painted on top of earlier ones
+    colors are keys of enviroment.color_dict
+    """
+    def __init__(self, background="WHITE"):
+        self.background = background
+        self.shapes = []
+
+    def add_rect(self, x0, y0, x1, y1, color):
+        """paint an axis aligned rectangle"""
+        self.shapes.append(("rect", (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)), color))
+        return self
+
+    def add_line(self, x0, y0, x1, y1, color, width=20):
+        """paint a straight line segment"""
+        self.shapes.append(("line", (x0, y0, x1, y1, width / 2), color))
+        return self
+
+    def add_ring(self, cx, cy, radius, color, width=20):
+        """paint a circular line"""
+        self.shapes.append(("ring", (cx, cy, radius, width / 2), color))
+        return self
+
+    def color_at(self, x, y):
+        """returns the name of the color under the point"""
+        for kind, params, color in reversed(self.shapes):
+            if kind == "rect":
+                x0, y0, x1, y1 = params
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    return color
+            elif kind == "line":
+                x0, y0, x1, y1, half_width = params
+                if _segment_distance(x, y, x0, y0, x1, y1) <= half_width:
+                    return color
+            elif kind == "ring":
+                cx, cy, radius, half_width = params
+                if abs(math.hypot(x - cx, y - cy) - radius) <= half_width:
+                    return color
+        return self.background
+
+
+def _segment_distance(x, y, x0, y0, x1, y1):
+    """returns the distance from a point to a line segment"""
+    dx = x1 - x0
+    dy = y1 - y0
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(x - x0, y - y0)
+    t = max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / length_sq))
+    return math.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+
+def _ray_circle(x, y, dx, dy, cx, cy, radius):
+    """returns the distance along a unit ray to a circle, or None if it is missed"""
+    ox = cx - x
+    oy = cy - y
+    along = ox * dx + oy * dy
+    if along < 0:
+        return None
+    off_sq = ox * ox + oy * oy - along * along
+    if off_sq > radius * radius:
+        return None
+    return max(0.0, along - math.sqrt(radius * radius - off_sq))
+
+
+class Obstacle:
+    """a round obstacle, such as a pallet or a parked truck, that may move at a constant velocity"""
+    def __init__(self, x, y, radius=50, vx=0.0, vy=0.0):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.vx = vx
+        self.vy = vy
+
+    def step(self, dt):
+        """move the obstacle dt ms forward in time"""
+        self.x += self.vx * dt / 1000
+        self.y += self.vy * dt / 1000
+
+
+class Body:
+    """the chassis of a simulated truck, integrates the drive base velocities into a pose"""
+    def __init__(self, sim, x=0.0, y=0.0, heading=0.0, radius=90):
+        self.sim = sim
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.radius = radius
+        self.speed = 0.0
+        self.turn_rate = 0.0
+        self.travelled = 0.0
+        self.turned = 0.0
+        self.drivebase = None
+
+    def point(self, forward, left=0.0):
+        """returns the world coordinates of a point given relative to the body"""
+        rad = math.radians(self.heading)
+        cos = math.cos(rad)
+        sin = math.sin(rad)
+        return self.x + forward * cos - left * sin, self.y + forward * sin + left * cos
+
+    def step(self, dt):
+        """move the body dt ms forward in time"""
+        if self.speed == 0 and self.turn_rate == 0:
+            return
+        seconds = dt / 1000
+        # pybricks turn rates are clockwise positive
+        self.heading -= self.turn_rate * seconds
+        rad = math.radians(self.heading)
+        self.x += self.speed * seconds * math.cos(rad)
+        self.y += self.speed * seconds * math.sin(rad)
+        self.travelled += self.speed * seconds
+        self.turned += self.turn_rate * seconds
+        if self.drivebase is not None:
+            self.drivebase.sync_motors()
+
+
+class Simulation:
+    """
+    a virtual world with a clock, a floor, obstacles and the trucks driving on it
+    """
+    active = None
+    """the simulation the stand-in pybricks modules act on"""
+
+    def __init__(self, floor=None, obstacles=None, step_ms=2, noise=0.0, seed=0, costs=None, time_limit=None, walls=None):
+        """
+        Paramaters:
+        floor: Floor (or anything with color_at, like warehouse_map.RasterMap) the color sensors sample
+        obstacles: list of Obstacle seen by the ultrasonic and touch sensors
+        walls: anything with raycast(x, y, heading), like warehouse_map.RasterMap, seen by the ultrasonic and touch sensors
+        step_ms: integration step of the kinematic models in ms
+        noise: standard deviation of the sensor noise in % (reflection, rgb) and mm (distance)
+        seed: seed of the sensor noise
+        costs: overrides of READ_COSTS
+        time_limit: virtual time in ms after which SimulationTimeout is raised
+        """
+        self.floor = floor if floor is not None else Floor()
+        self.obstacles = list(obstacles) if obstacles is not None else []
+        self.walls = walls
+        self.step_ms = step_ms
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.costs = dict(READ_COSTS)
+        if costs is not None:
+            self.costs.update(costs)
+        self.time_limit = time_limit
+        self.now = 0.0
+        self.bodies = []
+        self.actors = []
+        self.events = []
+        self.pressed_buttons = set()
+        self.counts = {}
+        self.activate()
+
+    def activate(self):
+        """make this the simulation the stand-in pybricks modules act on"""
+        Simulation.active = self
+        return self
+
+    def add_body(self, x=0.0, y=0.0, heading=0.0):
+        """add a truck chassis to the world"""
+        body = Body(self, x, y, heading)
+        self.bodies.append(body)
+        return body
+
+    def default_body(self):
+        """returns the first truck, devices built without a body are mounted on it"""
+        if not self.bodies:
+            self.add_body()
+        return self.bodies[0]
+
+    def at(self, time_ms, fn):
+        """schedule fn(sim) to run when the virtual clock reaches time_ms"""
+        self.events.append((time_ms, fn))
+        self.events.sort(key=lambda event: event[0])
+
+    def time(self):
+        """returns the virtual time in ms"""
+        return self.now
+
+    def spend(self, kind):
+        """count a device call and let the virtual time it costs pass"""
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.advance(self.costs.get(kind, 0))
+
+    def advance(self, duration):
+        """let duration ms of virtual time pass, integrating every moving part"""
+        end = self.now + duration
+        while self.now < end:
+            dt = min(self.step_ms, end - self.now)
+            for body in self.bodies:
+                body.step(dt)
+            for actor in self.actors:
+                actor.step(dt)
+            for obstacle in self.obstacles:
+                obstacle.step(dt)
+            self.now += dt
+            while self.events and self.events[0][0] <= self.now:
+                self.events.pop(0)[1](self)
+            if self.time_limit is not None and self.now > self.time_limit:
+                raise SimulationTimeout("virtual time limit of {} ms exceeded".format(self.time_limit))
+
+    def wait(self, duration):
+        """stand-in for pybricks.tools.wait"""
+        self.advance(duration)
+
+    def noisy(self, value, low=None, high=None):
+        """returns value with sensor noise applied"""
+        if self.noise:
+            value += self.random.gauss(0, self.noise)
+        if low is not None:
+            value = max(low, value)
+        if high is not None:
+            value = min(high, value)
+        return value
+
+    def raycast(self, x, y, heading, ignore=None):
+        """returns the distance from a point to the nearest obstacle or truck along the heading"""
+        rad = math.radians(heading)
+        dx = math.cos(rad)
+        dy = math.sin(rad)
+        nearest = self.walls.raycast(x, y, heading) if self.walls is not None else None
+        for obstacle in self.obstacles:
+            hit = _ray_circle(x, y, dx, dy, obstacle.x, obstacle.y, obstacle.radius)
+            if hit is not None and (nearest is None or hit < nearest):
+                nearest = hit
+        for body in self.bodies:
+            if body is ignore:
+                continue
+            hit = _ray_circle(x, y, dx, dy, body.x, body.y, body.radius)
+            if hit is not None and (nearest is None or hit < nearest):
+                nearest = hit
+        return nearest
+
+    def run(self, command, robot, time_limit=None):
+        """
+        runs a command on a simulated robot and returns a report of how long it took
+        time_limit: virtual ms the command may run before it is stopped, None for no limit
+        """
+        start = self.now
+        counts = dict(self.counts)
+        previous_limit = self.time_limit
+        self.time_limit = None if time_limit is None else start + time_limit
+        timed_out = False
+        wall_start = _time.perf_counter()
+        try:
+            command.run(robot)
+        except SimulationTimeout:
+            timed_out = True
+        finally:
+            self.time_limit = previous_limit
+        return SimulationReport(
+            self.now - start,
+            _time.perf_counter() - wall_start,
+            {kind: self.counts[kind] - counts.get(kind, 0) for kind in self.counts},
+            timed_out)
+
+
+class SimulationReport:
+    """timing of a simulated command run"""
+    def __init__(self, virtual_ms, wall_s, counts, timed_out):
+        self.virtual_ms = virtual_ms
+        self.wall_s = wall_s
+        self.counts = counts
+        self.timed_out = timed_out
+
+    @property
+    def ticks(self):
+        """number of control ticks, counted as drive base commands"""
+        return self.counts.get("drive", 0)
+
+    @property
+    def ticks_per_second(self):
+        """control ticks per second of virtual time"""
+        return self.ticks * 1000 / self.virtual_ms if self.virtual_ms else 0.0
+
+    @property
+    def speedup(self):
+        """how many times faster than real time the run was"""
+        return self.virtual_ms / 1000 / self.wall_s if self.wall_s else float("inf")
+
+    def __str__(self):
+        return "{:.0f} ms mission time, {} ticks ({:.1f} Hz), {:.1f}x real time{}".format(
+            self.virtual_ms, self.ticks, self.ticks_per_second, self.speedup, ", timed out" if self.timed_out else "")
+
+
+# stand-in pybricks.parameters
+
+class Port:
+    """stand-in for pybricks.parameters.Port"""
+    A = "A"
+    B = "B"
+    C = "C"
+    D = "D"
+    S1 = "S1"
+    S2 = "S2"
+    S3 = "S3"
+    S4 = "S4"
+
+
+class Direction:
+    """stand-in for pybricks.parameters.Direction"""
+    CLOCKWISE = 1
+    COUNTERCLOCKWISE = -1
+
+
+class Stop:
+    """stand-in for pybricks.parameters.Stop"""
+    COAST = "COAST"
+    BRAKE = "BRAKE"
+    HOLD = "HOLD"
+
+
+class Button:
+    """stand-in for pybricks.parameters.Button"""
+    LEFT = "LEFT"
+    RIGHT = "RIGHT"
+    UP = "UP"
+    DOWN = "DOWN"
+    CENTER = "CENTER"
+
+
+class Color:
+    """stand-in for pybricks.parameters.Color"""
+    BLACK = "BLACK"
+    BLUE = "BLUE"
+    GREEN = "GREEN"
+    YELLOW = "YELLOW"
+    RED = "RED"
+    WHITE = "WHITE"
+    BROWN = "BROWN"
+    ORANGE = "ORANGE"
+    PURPLE = "PURPLE"
+
+
+# stand-in pybricks.tools
+
+def wait(time):
+    """stand-in for pybricks.tools.wait on the active simulation's clock"""
+    Simulation.active.wait(time)
+
+
+class StopWatch:
+    """stand-in for pybricks.tools.StopWatch on the active simulation's clock"""
+    def __init__(self):
+        self.sim = Simulation.active
+        self._start = self.sim.time()
+        self._paused_at = None
+
+    def time(self):
+        """returns the elapsed time in ms"""
+        # reading the clock takes time too, so commands polling it alone still see it move
+        self.sim.spend("clock")
+        now = self._paused_at if self._paused_at is not None else self.sim.time()
+        return int(now - self._start)
+
+    def pause(self):
+        """pause the stopwatch"""
+        if self._paused_at is None:
+            self._paused_at = self.sim.time()
+
+    def resume(self):
+        """resume the stopwatch"""
+        if self._paused_at is not None:
+            self._start += self.sim.time() - self._paused_at
+            self._paused_at = None
+
+    def reset(self):
+        """reset the elapsed time to 0"""
+        self._start = self._paused_at if self._paused_at is not None else self.sim.time()
+
+
+# stand-in pybricks.ev3devices
+
+class Motor:
+    """kinematic stand-in for pybricks.ev3devices.Motor"""
+    def __init__(self, port, positive_direction=Direction.CLOCKWISE, gears=None, body=None, min_angle=None, max_angle=None, max_speed=800):
+        """
+        min_angle, max_angle: mechanical limits in degrees where the motor stalls, None for no limit
+        max_speed: fastest the motor turns in deg/s
+        """
+        self.sim = body.sim if body is not None else Simulation.active
+        self.port = port
+        self.positive_direction = positive_direction
+        self.gears = gears
+        self.body = body
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.max_speed = max_speed
+        self._angle = 0.0
+        self._speed = 0.0
+        self._target = None
+        self._stalled = False
+        self.control = _Control(self)
+        self.sim.actors.append(self)
+
+    def _limit(self, angle):
+        """clamps an angle to the mechanical limits"""
+        if self.min_angle is not None and angle < self.min_angle:
+            self._stalled = True
+            return self.min_angle
+        if self.max_angle is not None and angle > self.max_angle:
+            self._stalled = True
+            return self.max_angle
+        return angle
+
+    def step(self, dt):
+        """turn the motor dt ms forward in time"""
+        if self._speed == 0:
+            return
+        delta = self._speed * dt / 1000
+        if self._target is not None and abs(self._target - self._angle) <= abs(delta):
+            self._angle = self._target
+            self._speed = 0.0
+            self._target = None
+            return
+        self._stalled = False
+        self._angle = self._limit(self._angle + delta)
+        if self._stalled:
+            self._speed = 0.0
+            self._target = None
+
+    def _move(self, speed, target, wait_done):
+        """start a move and optionally let the virtual time pass until it is done"""
+        self.sim.spend("motor")
+        speed = max(-self.max_speed, min(self.max_speed, speed))
+        self._stalled = False
+        self._target = target
+        self._speed = speed if target is None else math.copysign(abs(speed), target - self._angle)
+        if wait_done:
+            while self._speed != 0:
+                self.sim.advance(self.sim.step_ms)
+
+    def angle(self):
+        """returns the rotation angle in degrees"""
+        self.sim.spend("motor")
+        return int(self._angle)
+
+    def speed(self):
+        """returns the speed in deg/s"""
+        self.sim.spend("motor")
+        return int(self._speed)
+
+    def reset_angle(self, angle):
+        """sets the accumulated rotation angle"""
+        self.sim.spend("motor")
+        self._angle = float(angle)
+
+    def stop(self):
+        """stops the motor"""
+        self.sim.spend("motor")
+        self._speed = 0.0
+        self._target = None
+
+    brake = stop
+    hold = stop
+
+    def run(self, speed):
+        """keeps turning at the given speed"""
+        self._move(speed, None, False)
+
+    def run_time(self, speed, time, then=Stop.HOLD, wait=True):
+        """turns at the given speed for the given time in ms"""
+        # pylint: disable=unused-argument,redefined-outer-name
+        self._move(speed, self._angle + speed * time / 1000, wait)
+
+    def run_angle(self, speed, rotation_angle, then=Stop.HOLD, wait=True):
+        """turns the given number of degrees"""
+        # pylint: disable=unused-argument,redefined-outer-name
+        self._move(speed, self._angle + rotation_angle, wait)
+
+    def run_target(self, speed, target_angle, then=Stop.HOLD, wait=True):
+        """turns to the given angle"""
+        # pylint: disable=unused-argument,redefined-outer-name
+        self._move(speed, target_angle, wait)
+
+    def run_until_stalled(self, speed, then=Stop.COAST, duty_limit=None):
+        """turns until the motor stalls and returns the angle it stalled at"""
+        # pylint: disable=unused-argument
+        self._move(speed, None, False)
+        while not self._stalled:
+            self.sim.advance(self.sim.step_ms)
+        return int(self._angle)
+
+    def stalled(self):
+        """returns True if the motor is stalled"""
+        return self._stalled
+
+
+class _Control:
+    """stand-in for the control attribute of pybricks.ev3devices.Motor"""
+    def __init__(self, motor):
+        self.motor = motor
+
+    def done(self):
+        """returns True when the motor has finished its move"""
+        self.motor.sim.spend("motor")
+        return self.motor._speed == 0  # pylint: disable=protected-access
+
+    def stalled(self):
+        """returns True if the motor is stalled"""
+        return self.motor._stalled  # pylint: disable=protected-access
+
+
+class TouchSensor:
+    """stand-in for pybricks.ev3devices.TouchSensor, pressed when an obstacle touches the front of the truck"""
+    def __init__(self, port, body=None, offset=100, reach=5):
+        """
+        offset: distance from the axle to the bumper in mm
+        reach: how far in front of the bumper an obstacle presses the sensor in mm
+        """
+        self.sim = body.sim if body is not None else Simulation.active
+        self.port = port
+        self.body = body if body is not None else self.sim.default_body()
+        self.offset = offset
+        self.reach = reach
+
+    def pressed(self):
+        """returns True if the sensor is pressed"""
+        self.sim.spend("pressed")
+        x, y = self.body.point(self.offset)
+        hit = self.sim.raycast(x, y, self.body.heading, ignore=self.body)
+        return hit is not None and hit <= self.reach
+
+
+class ColorSensor:
+    """stand-in for pybricks.ev3devices.ColorSensor, samples the floor under the sensor"""
+    def __init__(self, port, body=None, offset=60, ambient_light=40):
+        """
+        offset: distance from the axle to the sensor in mm
+        ambient_light: value returned by ambient() in %
+        """
+        self.sim = body.sim if body is not None else Simulation.active
+        self.port = port
+        self.body = body if body is not None else self.sim.default_body()
+        self.offset = offset
+        self.ambient_light = ambient_light
+
+    def color_name(self):
+        """returns the name of the floor color under the sensor without spending time"""
+        x, y = self.body.point(self.offset)
+        return self.sim.floor.color_at(x, y)
+
+    def reflection(self):
+        """returns the reflection in %"""
+        self.sim.spend("reflection")
+        return int(self.sim.noisy(env.color_dict[self.color_name()][0], 0, 100))
+
+    def rgb(self):
+        """returns the rgb values in %"""
+        self.sim.spend("rgb")
+        return tuple(int(self.sim.noisy(channel, 0, 100)) for channel in env.color_dict[self.color_name()][1])
+
+    def ambient(self):
+        """returns the ambient light in %"""
+        self.sim.spend("ambient")
+        return int(self.sim.noisy(self.ambient_light, 0, 100))
+
+    def color(self):
+        """returns the name of the floor color"""
+        self.sim.spend("color")
+        return self.color_name()
+
+
+class UltrasonicSensor:
+    """stand-in for pybricks.ev3devices.UltrasonicSensor, measures along the heading of the truck"""
+    def __init__(self, port, body=None, offset=80):
+        """
+        offset: distance from the axle to the sensor in mm
+        """
+        self.sim = body.sim if body is not None else Simulation.active
+        self.port = port
+        self.body = body if body is not None else self.sim.default_body()
+        self.offset = offset
+
+    def distance(self, silent=False):
+        """returns the distance to the nearest obstacle in mm"""
+        # pylint: disable=unused-argument
+        self.sim.spend("distance")
+        x, y = self.body.point(self.offset)
+        hit = self.sim.raycast(x, y, self.body.heading, ignore=self.body)
+        if hit is None or hit >= NO_ECHO:
+            return NO_ECHO
+        return int(self.sim.noisy(hit, 0, NO_ECHO))
+
+    def presence(self):
+        """returns False, there are no other ultrasonic sensors in the simulation"""
+        return False
+
+
+# stand-in pybricks.robotics
+
+class DriveBase:
+    """kinematic stand-in for pybricks.robotics.DriveBase"""
+    def __init__(self, left_motor, right_motor, wheel_diameter, axle_track, body=None):
+        self.sim = left_motor.sim
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.wheel_diameter = wheel_diameter
+        self.axle_track = axle_track
+        self.body = body if body is not None else left_motor.body if left_motor.body is not None else self.sim.default_body()
+        self.body.drivebase = self
+        self._distance = 0.0
+        self._angle = 0.0
+        self.straight_speed = 200
+        self.straight_acceleration = 400
+        self.turn_rate = 180
+        self.turn_acceleration = 360
+
+    def sync_motors(self):
+        """update the wheel motor angles from the distance travelled"""
+        per_mm = 360 / (math.pi * self.wheel_diameter)
+        spin = math.radians(self.body.turned) * self.axle_track / 2
+        self.left_motor._angle = (self.body.travelled + spin) * per_mm  # pylint: disable=protected-access
+        self.right_motor._angle = (self.body.travelled - spin) * per_mm  # pylint: disable=protected-access
+
+    def drive(self, drive_speed, turn_rate):
+        """keeps driving at the given speed in mm/s and turn rate in deg/s"""
+        self.sim.spend("drive")
+        self.body.speed = drive_speed
+        self.body.turn_rate = turn_rate
+
+    def stop(self):
+        """stops the robot"""
+        self.sim.spend("drive")
+        self.body.speed = 0.0
+        self.body.turn_rate = 0.0
+
+    def straight(self, distance):
+        """drives straight for the given distance in mm and stops"""
+        self.sim.spend("drive")
+        self.body.turn_rate = 0.0
+        self.body.speed = math.copysign(self.straight_speed, distance)
+        self.sim.advance(abs(distance) / self.straight_speed * 1000)
+        self.body.speed = 0.0
+
+    def turn(self, angle):
+        """turns in place by the given angle in degrees and stops"""
+        self.sim.spend("drive")
+        self.body.speed = 0.0
+        self.body.turn_rate = math.copysign(self.turn_rate, angle)
+        self.sim.advance(abs(angle) / self.turn_rate * 1000)
+        self.body.turn_rate = 0.0
+
+    def settings(self, straight_speed=None, straight_acceleration=None, turn_rate=None, turn_acceleration=None):
+        """configures the speed and acceleration used by straight and turn, returns the settings without arguments"""
+        if straight_speed is None and straight_acceleration is None and turn_rate is None and turn_acceleration is None:
+            return self.straight_speed, self.straight_acceleration, self.turn_rate, self.turn_acceleration
+        if straight_speed is not None:
+            self.straight_speed = straight_speed
+        if straight_acceleration is not None:
+            self.straight_acceleration = straight_acceleration
+        if turn_rate is not None:
+            self.turn_rate = turn_rate
+        if turn_acceleration is not None:
+            self.turn_acceleration = turn_acceleration
+        return None
+
+    def distance(self):
+        """returns the distance driven in mm"""
+        return int(self.body.travelled)
+
+    def angle(self):
+        """returns the accumulated clockwise angle in degrees"""
+        return int(self.body.turned)
+
+    def state(self):
+        """returns the distance, drive speed, angle and turn rate"""
+        return self.distance(), int(self.body.speed), self.angle(), int(self.body.turn_rate)
+
+    def reset(self):
+        """resets the distance and angle to 0"""
+        self.body.travelled = 0.0
+        self.body.turned = 0.0
+
+
+# stand-in pybricks.hubs
+
+class _Screen:
+    """stand-in for the EV3 screen, keeps the printed lines"""
+    def __init__(self, sim):
+        self.sim = sim
+        self.lines = []
+
+    def print(self, *args, sep=" ", end="\n"):
+        """prints a line on the screen"""
+        # pylint: disable=unused-argument
+        self.sim.spend("screen")
+        self.lines.append(sep.join(str(arg) for arg in args))
+
+    def clear(self):
+        """clears the screen"""
+        self.lines = []
+
+
+class _Buttons:
+    """stand-in for the EV3 buttons, pressed through Simulation.pressed_buttons"""
+    def __init__(self, sim):
+        self.sim = sim
+
+    def pressed(self):
+        """returns the pressed buttons"""
+        self.sim.spend("buttons")
+        return list(self.sim.pressed_buttons)
+
+
+class _Speaker:
+    """stand-in for the EV3 speaker"""
+    def __init__(self, sim):
+        self.sim = sim
+
+    def beep(self, frequency=500, duration=100):
+        """beeps for the given duration"""
+        # pylint: disable=unused-argument
+        self.sim.wait(duration)
+
+
+class EV3Brick:
+    """stand-in for pybricks.hubs.EV3Brick"""
+    def __init__(self, sim=None):
+        self.sim = sim if sim is not None else Simulation.active
+        self.screen = _Screen(self.sim)
+        self.buttons = _Buttons(self.sim)
+        self.speaker = _Speaker(self.sim)
+
+
+def install():
+    """register the stand-in pybricks modules in sys.modules unless the real pybricks is importable"""
+    if "pybricks" in sys.modules:
+        return
+    try:
+        import pybricks  # pylint: disable=import-outside-toplevel,unused-import
+        return
+    except ImportError:
+        pass
+    contents = {
+        "pybricks.parameters": {"Port": Port, "Direction": Direction, "Stop": Stop, "Button": Button, "Color": Color},
+        "pybricks.tools": {"wait": wait, "StopWatch": StopWatch},
+        "pybricks.ev3devices": {"Motor": Motor, "TouchSensor": TouchSensor, "ColorSensor": ColorSensor, "UltrasonicSensor": UltrasonicSensor},
+        "pybricks.robotics": {"DriveBase": DriveBase},
+        "pybricks.hubs": {"EV3Brick": EV3Brick},
+    }
+    package = types.ModuleType("pybricks")
+    package.__path__ = []
+    sys.modules["pybricks"] = package
+    for name, attributes in contents.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+        setattr(package, name.split(".")[1], module)
+
+
+install()
+
+# pylint: disable=wrong-import-position
+from robot import Robot
+
+
+class SimRobot(Robot):
+    """
+    a Robot whose devices are simulated and mounted on a truck chassis in a Simulation
+    """
+    DEVICES = {
+        "touch_sensor": lambda robot: TouchSensor(Port.S1, body=robot.body),
+        "light_sensor": lambda robot: ColorSensor(Port.S3, body=robot.body),
+        "ultrasonic_sensor": lambda robot: UltrasonicSensor(Port.S4, body=robot.body),
+        "lift_motor": lambda robot: Motor(Port.A, positive_direction=Direction.CLOCKWISE, gears=[12, 36], body=robot.body, min_angle=-10, max_angle=120),
+        "left_motor": lambda robot: Motor(Port.C, positive_direction=Direction.COUNTERCLOCKWISE, gears=[12, 20], body=robot.body),
+        "right_motor": lambda robot: Motor(Port.B, positive_direction=Direction.COUNTERCLOCKWISE, gears=[12, 20], body=robot.body),
+        "drivebase": lambda robot: DriveBase(robot.left_motor, robot.right_motor, wheel_diameter=47, axle_track=128, body=robot.body),
+        "brick": lambda robot: EV3Brick(robot.sim),
+    }
+    """factories of the simulated devices, mounted on the robot's body"""
+
+    def __init__(self, sim=None, x=0.0, y=0.0, heading=0.0, echo=False, startup=None):
+        """
+        Paramaters:
+        sim: the Simulation the robot drives in, the active one if None
+        x, y, heading: starting pose in mm and degrees
+        echo: also print text to the terminal
+        startup: startup.StartupTimer that records how long each device takes to initialize
+        """
+        self.sim = sim if sim is not None else Simulation.active
+        self.sim.activate()
+        self.body = self.sim.add_body(x, y, heading)
+        self.echo = echo
+        super().__init__(startup)
+        self.log.echo = echo
+
+    def print(self, text):
+        """
+        print text to the simulated screen and optionally the terminal
+        """
+        if self.echo:
+            print(text)
+        self.brick.screen.print(text)
@@ -0,0 +1,59 @@
+#! pylint: disable=line-too-long
+
+"""Timing of module imports and device initialization at startup."""
+
+from pybricks.tools import StopWatch
+
+class StartupTimer:
+    """
+    records how long each step of starting the robot takes
+    """
+    def __init__(self):
+        self.watch = StopWatch()
+        self.steps = []
+        self.lazy = []
+        """steps recorded after finish, devices first used while the robot was running"""
+        self.finished = None
+        """time startup ended at in ms, None while it has not"""
+
+    def time(self):
+        """returns the time since the timer was created in ms"""
+        return self.watch.time()
+
+    def add(self, label, duration):
+        """record a step that took duration ms, steps recorded after finish count as lazy"""
+        step = (label, duration, self.watch.time())
+        if self.finished is None:
+            self.steps.append(step)
+        else:
+            self.lazy.append(step)
+
+    def mark(self, label):
+        """record a step that lasted from the previous step until now"""
+        previous = self.steps[-1][2] if self.steps else 0
+        now = self.watch.time()
+        self.steps.append((label, now - previous, now))
+
+    def finish(self, label):
+        """record the last step of startup, the total of the report ends here"""
+        self.mark(label)
+        self.finished = self.steps[-1][2]
+
+    def timed_import(self, name):
+        """import a module and record how long it took"""
+        start = self.watch.time()
+        module = __import__(name)
+        self.add("import " + name, self.watch.time() - start)
+        return module
+
+    def report(self):
+        """returns the recorded steps, slowest first, as text, followed by the lazy steps"""
+        total = self.finished if self.finished is not None else self.watch.time()
+        output = "startup: " + str(total) + " ms\n"
+        for label, duration, _ in sorted(self.steps, key=lambda step: -step[1]):
+            output += "{:>6} ms {}\n".format(duration, label)
+        if self.lazy:
+            output += "initialized while running:\n"
+            for label, duration, _ in sorted(self.lazy, key=lambda step: -step[1]):
+                output += "{:>6} ms {}\n".format(duration, label)
+        return output
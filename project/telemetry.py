@@ -0,0 +1,175 @@
+#! pylint: disable=line-too-long
+
+"""
+Compact binary telemetry of control loops.
+
+The Recorder runs on the robot and keeps one preallocated array per field as a ring buffer, so recording allocates nothing.
+The file it saves is read on a desktop with load(), which copies every column straight into an array without parsing text.
+
+File layout (little endian):
+    magic b"EVTL", uint16 version, uint16 number of command names, uint32 number of records
+    per command name: uint8 length, utf-8 bytes
+    per field in FIELDS: the field's column, oldest record first
+"""
+
+from array import array
+
+try:
+    import struct
+except ImportError:
+    import ustruct as struct
+
+from pybricks.tools import StopWatch
+
+MAGIC = b"EVTL"
+VERSION = 1
+
+FIELDS = (
+    ("time", "I"),
+    ("command", "B"),
+    ("reflection", "b"),
+    ("red", "b"),
+    ("green", "b"),
+    ("blue", "b"),
+    ("distance", "h"),
+    ("speed", "h"),
+    ("turn_rate", "h"),
+)
+"""name and array typecode of every recorded field"""
+
+MISSING = -1
+"""value of a sensor that was not read during the tick"""
+
+TURN_RATE_SCALE = 10
+"""turn rates are stored in tenths of deg/s"""
+
+class Recorder:
+    """
+    records one row of sensor readings and drive commands per control tick into preallocated arrays,
+    the oldest rows are overwritten once capacity is reached
+    """
+    def __init__(self, capacity=4096):
+        """
+        Paramaters:
+        capacity: number of rows kept
+        """
+        self.capacity = capacity
+        self.columns = [array(typecode, [0] * capacity) for _, typecode in FIELDS]
+        (self.time, self.command, self.reflection, self.red, self.green, self.blue,
+         self.distance, self.speed, self.turn_rate) = self.columns
+        self.names = []
+        self.ids = {}
+        self.head = 0
+        self.count = 0
+        self.watch = StopWatch()
+
+    def command_id(self, name):
+        """returns the id a command name is stored as, registering it on first use"""
+        command_id = self.ids.get(name)
+        if command_id is None:
+            command_id = len(self.names)
+            self.names.append(name)
+            self.ids[name] = command_id
+        return command_id
+
+    def record(self, command, reflection=MISSING, rgb=None, distance=MISSING, speed=0, turn_rate=0):
+        """
+        record one tick
+        command: name of the active command
+        reflection: reflection in %
+        rgb: rgb readout in %, None if not read
+        distance: ultrasonic distance in mm, None if not read
+        speed: commanded drive speed in mm/s
+        turn_rate: commanded turn rate in deg/s
+        """
+        i = self.head
+        self.time[i] = self.watch.time()
+        self.command[i] = self.command_id(command)
+        # filtered readings may be floats
+        self.reflection[i] = int(reflection)
+        if rgb is None:
+            self.red[i] = self.green[i] = self.blue[i] = MISSING
+        else:
+            self.red[i] = int(rgb[0])
+            self.green[i] = int(rgb[1])
+            self.blue[i] = int(rgb[2])
+        self.distance[i] = MISSING if distance is None else int(min(distance, 32767))
+        self.speed[i] = int(speed)
+        self.turn_rate[i] = int(turn_rate * TURN_RATE_SCALE)
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        """forget every recorded row"""
+        self.head = 0
+        self.count = 0
+
+    def save(self, path):
+        """write the recorded rows to a binary telemetry file"""
+        start = (self.head - self.count) % self.capacity
+        with open(path, "wb") as file:
+            file.write(MAGIC + struct.pack("<HHI", VERSION, len(self.names), self.count))
+            for name in self.names:
+                encoded = name.encode("utf-8")[:255]
+                file.write(struct.pack("<B", len(encoded)) + encoded)
+            for column in self.columns:
+                view = memoryview(column)
+                if start + self.count <= self.capacity:
+                    file.write(view[start:start + self.count])
+                else:
+                    file.write(view[start:])
+                    file.write(view[:self.head])
+
+class Telemetry:
+    """
+    the contents of a telemetry file, every field is an array attribute named as in FIELDS
+    """
+    def __init__(self, names, columns):
+        self.names = names
+        self.columns = columns
+        for (name, _), column in zip(FIELDS, columns):
+            setattr(self, name, column)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def command_name(self, index):
+        """returns the name of the command active in a row"""
+        return self.names[self.command[index]]
+
+    def turn_rates(self):
+        """returns the turn rates in deg/s"""
+        return [value / TURN_RATE_SCALE for value in self.turn_rate]
+
+    def rows(self):
+        """yields every row as a dict, for inspection rather than bulk analysis"""
+        for i in range(len(self)):
+            row = {name: column[i] for (name, _), column in zip(FIELDS, self.columns)}
+            row["command"] = self.names[row["command"]]
+            row["turn_rate"] /= TURN_RATE_SCALE
+            yield row
+
+def load(path):
+    """reads a telemetry file saved by Recorder.save"""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:4] != MAGIC:
+        raise ValueError("not a telemetry file: " + str(path))
+    version, name_count, count = struct.unpack_from("<HHI", data, 4)
+    if version != VERSION:
+        raise ValueError("unsupported telemetry version " + str(version))
+    offset = 12
+    names = []
+    for _ in range(name_count):
+        length = data[offset]
+        names.append(bytes(data[offset + 1:offset + 1 + length]).decode("utf-8"))
+        offset += 1 + length
+    columns = []
+    for _, typecode in FIELDS:
+        column = array(typecode)
+        size = count * column.itemsize
+        column.frombytes(data[offset:offset + size])
+        columns.append(column)
+        offset += size
+    return Telemetry(names, columns)
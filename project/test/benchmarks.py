@@ -0,0 +1,306 @@
+#! pylint: disable=line-too-long
+
+"""
+Benchmarks of the control loop hot paths, run on the simulated pybricks backend.
+
+Micro benchmarks time pure Python code on the host: the color matching helpers, the body of the FollowLine loop
+driving a stub robot, Queue.run and Queue.tree_str. Their wall time per call is divided by the time of a reference
+loop measured in the same process, so a result is a machine independent "reference calls" and a baseline recorded
+on one machine holds on another.
+Simulated benchmarks run whole commands in a Simulation and measure virtual time, which only depends on the code:
+the virtual ms every control tick costs, how fast a lap of the stadium track is driven and how fast a fleet moves.
+
+Baselines are kept in baseline.json next to this file. A benchmark regresses when its cost rises, or its throughput
+falls, more than its tolerance from the baseline. test_benchmarks.py checks every benchmark against its baseline.
+
+Usage (from project/): python -m test.benchmarks [NAME ...] [--update]
+"""
+
+import argparse
+import json
+import os
+import time
+import types
+
+from simulation import Simulation, SimRobot
+import commands as command
+import enviroment as env
+from log import Logger
+from sensorhub import SensorHub
+from fleet import FleetSimulation, stadium_pose, lap_mission
+from tuning import stadium, LAP
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+"""path of the stored baseline results"""
+
+LOWER = "lower"
+"""a cost, the benchmark regresses when it rises"""
+HIGHER = "higher"
+"""a throughput, the benchmark regresses when it falls"""
+
+WALL_TOLERANCE = 0.5
+"""allowed relative change of timed benchmarks, host timing is noisy even when normalized"""
+VIRTUAL_TOLERANCE = 0.05
+"""allowed relative change of simulated benchmarks, virtual time is deterministic"""
+
+REPEATS = 7
+"""times every timed benchmark is repeated, the fastest repeat counts"""
+
+_SAMPLES = [((i * 37) % 101, (i * 59) % 101, (i * 83) % 101) for i in range(64)]
+"""rgb readouts the color benchmarks cycle through"""
+
+
+class Benchmark:
+    """a measurement of one hot path"""
+    def __init__(self, name, unit, measure, better=LOWER, tolerance=WALL_TOLERANCE):
+        """
+        Paramaters:
+        name: name the baseline is stored under
+        unit: unit of the result
+        measure: function without arguments returning the result
+        better: LOWER or HIGHER
+        tolerance: allowed relative change from the baseline in the worse direction
+        """
+        self.name = name
+        self.unit = unit
+        self.measure = measure
+        self.better = better
+        self.tolerance = tolerance
+
+    def regression(self, value, baseline, scale=1.0):
+        """returns why value regressed from the baseline, None if it did not, scale widens the tolerance"""
+        tolerance = self.tolerance * scale
+        if self.better == LOWER and value > baseline * (1 + tolerance):
+            return "{}: {:.4g} {} is {:.0%} above the baseline {:.4g}, more than {:.0%}".format(self.name, value, self.unit, value / baseline - 1, baseline, tolerance)
+        if self.better == HIGHER and value < baseline * (1 - tolerance):
+            return "{}: {:.4g} {} is {:.0%} below the baseline {:.4g}, more than {:.0%}".format(self.name, value, self.unit, 1 - value / baseline, baseline, tolerance)
+        return None
+
+
+def _reference_work(this, other):
+    """a few tuple lookups and arithmetic operations, the unit the timed benchmarks are given in"""
+    return this[0] - other[0] + this[1] - other[1]
+
+
+def _reference(calls=50000):
+    """runs the reference work calls times"""
+    samples = _SAMPLES
+    other = env.rgb_list[0]
+    for i in range(calls):
+        _reference_work(samples[i & 63], other)
+
+
+def _timed(run, calls):
+    """
+    returns the wall time of one of the calls run() makes relative to a reference call,
+    the reference is timed right before every repeat so both see the same load, the fastest repeats count
+    """
+    best = float("inf")
+    best_reference = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        _reference()
+        middle = time.perf_counter()
+        run()
+        end = time.perf_counter()
+        best_reference = min(best_reference, middle - start)
+        best = min(best, end - middle)
+    return best / calls / (best_reference / 50000)
+
+
+def _rgb_likeness():
+    calls = 100000
+    samples = _SAMPLES
+    other = env.rgb_list[3]
+    rgb_likeness = env.rgb_likeness
+    def run():
+        for i in range(calls):
+            rgb_likeness(samples[i & 63], other)
+    return _timed(run, calls)
+
+
+def _nearest_color():
+    # from_hsv can not run on the rgb references, this is the same linear nearest color search over rgb_likeness
+    calls = 20000
+    samples = _SAMPLES
+    def run():
+        for i in range(calls):
+            env._closest(samples[i & 63], env.rgb_list, env.rgb_likeness)  # pylint: disable=protected-access
+    return _timed(run, calls)
+
+
+def _from_rgb():
+    calls = 100000
+    samples = _SAMPLES
+    from_rgb = env.from_rgb
+    from_rgb(samples[0])
+    def run():
+        for i in range(calls):
+            from_rgb(samples[i & 63])
+    return _timed(run, calls)
+
+
+def _stub_robot(readings):
+    """
+    returns a robot whose sensor hub reads readings on every call and whose drive base does nothing,
+    the reflection channel has no period so every tick pays for a device read through the hub
+    """
+    sensors = SensorHub()
+    sensors.add("reflection", iter(readings).__next__)
+    return types.SimpleNamespace(
+        sensors=sensors,
+        drivebase=types.SimpleNamespace(drive=lambda speed, turn_rate: None),
+        telemetry=None)
+
+
+def _follow_line_tick():
+    ticks = 20000
+    Simulation()
+    readings = [(i * 13) % 90 for i in range(ticks * REPEATS + REPEATS)]
+    robot = _stub_robot(readings)
+    def run():
+        remaining = [ticks]
+        def end_fn():
+            remaining[0] -= 1
+            return remaining[0] < 0
+        command.FollowLine(end_fn).run(robot)
+    return _timed(run, ticks)
+
+
+def _queue_run():
+    size = 2000
+    Simulation()
+    robot = types.SimpleNamespace(log=Logger(lambda text: None))
+    queues = []
+    for _ in range(REPEATS):
+        queue = command.Queue("Benchmark")
+        for i in range(size):
+            queue.append(command.Lambda(lambda robot: None, name="Lambda " + str(i)))
+        queues.append(queue)
+    def run():
+        queues.pop().run(robot)
+    return _timed(run, size)
+
+
+def _tree_str():
+    root = command.Queue("Benchmark")
+    lines = 1
+    for i in range(20):
+        branch = command.Queue("Branch " + str(i))
+        lines += 1
+        for j in range(10):
+            leaf = command.Queue("Leaf " + str(j))
+            lines += 1
+            for k in range(5):
+                leaf.append(command.Wait(k, name="Wait " + str(k)))
+                lines += 1
+            branch.append(leaf)
+        root.append(branch)
+    calls = 20
+    def run():
+        for _ in range(calls):
+            root.tree_str()
+    return _timed(run, calls * lines)
+
+
+def _simulated_lap(command_class):
+    """runs a line follower for one lap of the stadium track and returns the simulation report"""
+    sim = Simulation(floor=stadium())
+    robot = SimRobot(sim, x=200, y=0, heading=0)
+    robot.log.echo = False
+    report = sim.run(command_class(lambda: robot.drivebase.distance() >= LAP, inside=0, outside=79), robot, time_limit=120000)
+    if report.timed_out:
+        raise RuntimeError(command_class.__name__ + " did not finish the lap")
+    return report
+
+
+def _tick_cost(command_class):
+    """returns the virtual ms a control tick of a line follower costs"""
+    def measure():
+        report = _simulated_lap(command_class)
+        return report.virtual_ms / report.ticks
+    return measure
+
+
+def _lap_speed(command_class):
+    """returns the mean speed of a line follower over a lap in mm/s"""
+    def measure():
+        return LAP * 1000 / _simulated_lap(command_class).virtual_ms
+    return measure
+
+
+def _fleet_speed(size=4, duration=120000):
+    """returns the mean speed of the trucks of a fleet running the default mission in mm/s"""
+    sim = FleetSimulation(floor=stadium(), noise=1.0, seed=0)
+    for i in range(size):
+        x, y, heading = stadium_pose(200 + i * LAP / size)
+        truck = sim.add_truck(lap_mission, x, y, heading)
+        truck.robot.log.echo = False
+    report = sim.run_fleet(duration)
+    travelled = sum(truck.robot.body.travelled for truck in sim.trucks)
+    return travelled * 1000 / (report.duration_ms * size)
+
+
+BENCHMARKS = {benchmark.name: benchmark for benchmark in (
+    Benchmark("rgb_likeness", "reference calls per call", _rgb_likeness),
+    Benchmark("nearest_color", "reference calls per call", _nearest_color),
+    Benchmark("from_rgb", "reference calls per call", _from_rgb),
+    Benchmark("follow_line_tick", "reference calls per tick", _follow_line_tick),
+    Benchmark("queue_run", "reference calls per command", _queue_run),
+    Benchmark("tree_str", "reference calls per line", _tree_str),
+    Benchmark("follow_line_tick_cost", "virtual ms per tick", _tick_cost(command.FollowLine), tolerance=VIRTUAL_TOLERANCE),
+    Benchmark("pid_tick_cost", "virtual ms per tick", _tick_cost(command.PIDFollowLine), tolerance=VIRTUAL_TOLERANCE),
+    Benchmark("follow_line_lap_speed", "mm/s", _lap_speed(command.FollowLine), better=HIGHER, tolerance=VIRTUAL_TOLERANCE),
+    Benchmark("pid_lap_speed", "mm/s", _lap_speed(command.PIDFollowLine), better=HIGHER, tolerance=VIRTUAL_TOLERANCE),
+    Benchmark("fleet_speed", "mm/s per truck", _fleet_speed, better=HIGHER, tolerance=VIRTUAL_TOLERANCE),
+)}
+"""the benchmarks by name"""
+
+
+def load_baseline(path=BASELINE_FILE):
+    """returns the stored results by benchmark name, empty if there are none"""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """stores results by benchmark name, keeping the baselines of the other benchmarks"""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=4, sort_keys=True)
+        file.write("\n")
+
+
+def main():
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="run the benchmarks and compare them with the baseline")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all by default")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(unknown))
+    baseline = load_baseline()
+    results = {}
+    regressed = False
+    for name in args.names or BENCHMARKS:
+        benchmark = BENCHMARKS[name]
+        value = benchmark.measure()
+        results[name] = value
+        previous = baseline.get(name)
+        problem = benchmark.regression(value, previous) if previous is not None else None
+        regressed = regressed or problem is not None
+        print("{:<24} {:>10.4g} {:<28} baseline {}{}".format(name, value, benchmark.unit, "none" if previous is None else "{:.4g}".format(previous), ", REGRESSED" if problem else ""))
+    if args.update:
+        save_baseline(results)
+        print("baseline updated")
+        return 0
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
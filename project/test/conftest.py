@@ -0,0 +1,6 @@
+"""
+Shared setup of the tests, importing simulation registers the stand-in pybricks package before any test imports
+robot or commands.
+"""
+
+import simulation  # pylint: disable=unused-import
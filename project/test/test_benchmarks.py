@@ -0,0 +1,44 @@
+"""
+Regression tests of the benchmarks against the stored baseline.
+
+Set BENCHMARK_TOLERANCE to scale every tolerance, e.g. 2 on a busy machine.
+Record a new baseline with python -m test.benchmarks --update after an intended change.
+"""
+
+import os
+
+import pytest
+
+from . import benchmarks
+
+BASELINE = benchmarks.load_baseline()
+SCALE = float(os.environ.get("BENCHMARK_TOLERANCE", "1"))
+
+
+@pytest.mark.parametrize("name", list(benchmarks.BENCHMARKS))
+def test_benchmark(name):
+    baseline = BASELINE.get(name)
+    if baseline is None:
+        pytest.skip("no baseline for " + name + ", record one with python -m test.benchmarks --update")
+    benchmark = benchmarks.BENCHMARKS[name]
+    problem = benchmark.regression(benchmark.measure(), baseline, SCALE)
+    assert problem is None, problem
+
+
+def test_pid_laps_faster_than_follow_line():
+    assert BASELINE["pid_lap_speed"] > BASELINE["follow_line_lap_speed"]
+    pid = benchmarks.BENCHMARKS["pid_lap_speed"].measure()
+    follow_line = benchmarks.BENCHMARKS["follow_line_lap_speed"].measure()
+    assert pid > follow_line, "PIDFollowLine laps at {:.4g} mm/s, not faster than FollowLine at {:.4g} mm/s".format(pid, follow_line)
+
+
+def test_regression():
+    cost = benchmarks.Benchmark("cost", "ms", None, benchmarks.LOWER, 0.1)
+    assert cost.regression(1.05, 1.0) is None
+    assert cost.regression(0.5, 1.0) is None
+    assert cost.regression(1.2, 1.0) is not None
+    assert cost.regression(1.2, 1.0, scale=3) is None
+    throughput = benchmarks.Benchmark("throughput", "mm/s", None, benchmarks.HIGHER, 0.1)
+    assert throughput.regression(95, 100) is None
+    assert throughput.regression(150, 100) is None
+    assert throughput.regression(80, 100) is not None
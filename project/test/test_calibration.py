@@ -0,0 +1,32 @@
+"""Tests of the calibration store."""
+
+from simulation import Simulation, SimRobot
+from calibration import CalibrationStore
+
+
+def _store(tmp_path, now):
+    """returns a store whose clock reads now[0] and a simulated robot"""
+    robot = SimRobot(Simulation())
+    store = CalibrationStore(str(tmp_path / "calibration.json"), max_age=100, clock=lambda: now[0])
+    return store, robot
+
+
+def test_a_result_is_stale_after_max_age_or_when_the_clock_went_back(tmp_path):
+    now = [1000]
+    store, robot = _store(tmp_path, now)
+    store.put(robot, "lift_max_angle", 110)
+    now[0] = 1100
+    assert store.problem(robot, "lift_max_angle") is None
+    now[0] = 1101
+    assert store.problem(robot, "lift_max_angle") == "stale"
+    now[0] = 999
+    assert store.problem(robot, "lift_max_angle") == "stale"
+
+
+def test_a_fresh_ambient_light_is_checked_against_the_sensor(tmp_path):
+    now = [1000]
+    store, robot = _store(tmp_path, now)
+    store.put(robot, "AMBIENT_LIGHT", robot.light_sensor.ambient())
+    assert store.restore(robot, "AMBIENT_LIGHT") is None
+    robot.light_sensor.ambient_light += 20
+    assert store.restore(robot, "AMBIENT_LIGHT") == "sanity check failed"
@@ -0,0 +1,37 @@
+"""Tests of the adaptive color model."""
+
+import math
+
+import pytest
+
+from colormodel import ColorModel, PRIOR_SAMPLES
+
+
+def _model():
+    """returns a one channel model of a dark and a bright color with the initial spread of 4"""
+    return ColorModel([(0,), (50,)], names=("DARK", "BRIGHT"))
+
+
+def test_the_posterior_weighs_the_distances_to_both_colors():
+    model = _model()
+    assert model.classify((25,)) == (0, pytest.approx(0.5))
+    index, confidence = model.classify((20,))
+    assert index == 0
+    # squared normalized distances 400 / 16 and 900 / 16
+    assert confidence == pytest.approx(1 / (1 + math.exp(-0.5 * (900 - 400) / 16)))
+    assert model.name((45,)) == "BRIGHT"
+
+
+def test_update_learns_only_from_confident_samples_near_the_centroid():
+    model = _model()
+    assert model.update((2,)) == (0, pytest.approx(1.0))
+    assert model.centroid(0) == (pytest.approx(2 / (PRIOR_SAMPLES + 1)),)
+    assert model.spread(0)[0] < 4
+    learned = model.to_dict()
+
+    # unsure, midway between the colors
+    model.update((25,))
+    # confident but far outside the spread of DARK
+    index, confidence = model.update((-20,))
+    assert index == 0 and confidence > 0.99
+    assert model.to_dict() == learned
@@ -0,0 +1,236 @@
+"""Tests of the commands on the simulated robot."""
+
+import pytest
+
+from simulation import Simulation, SimRobot, Floor, Obstacle, wait
+import commands as command
+import filters
+import tuning
+from calibration import CalibrationStore
+
+
+def _line_robot(**kwargs):
+    """returns a simulation and a robot on a straight black line"""
+    sim = Simulation(floor=Floor().add_line(0, 0, 5000, 0, "BLACK"), **kwargs)
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    robot.log.echo = False
+    return sim, robot
+
+
+def test_race_stops_the_drive_base_of_the_cancelled_commands():
+    sim, robot = _line_robot()
+    race = command.Race("Race")
+    race.append(command.FollowLine(lambda: False, inside=0, outside=79))
+    race.append(command.Wait(500))
+    race.run(robot)
+    x = robot.body.x
+    wait(1000)
+    assert robot.body.speed == 0
+    assert abs(robot.body.x - x) < 1
+    assert sim.now >= 500
+
+
+def test_race_stops_the_command_running_in_a_cancelled_queue():
+    _, robot = _line_robot()
+    queue = command.Queue("Drive")
+    queue.append(command.FollowLine(lambda: False, inside=0, outside=79))
+    race = command.Race("Race")
+    race.append(queue)
+    race.append(command.Wait(300))
+    race.run(robot)
+    assert robot.body.speed == 0
+
+
+def test_command_without_run_or_steps_raises_not_implemented():
+    _, robot = _line_robot()
+    with pytest.raises(NotImplementedError):
+        command.Base("Empty").run(robot)
+
+
+def test_wait_and_move_lift_finish_when_run_on_their_own():
+    sim, robot = _line_robot(time_limit=5000)
+    command.Wait(300).run(robot)
+    assert 300 <= sim.now < 310
+    command.MoveLift(30, speed=100).run(robot)
+    assert robot.lift_motor.angle() == 30
+
+
+def test_calibrate_rehomes_the_lift_when_restoring_its_angle(tmp_path):
+    sim = Simulation()
+    robot = SimRobot(sim)
+    store = CalibrationStore(str(tmp_path / "calibration.json"))
+    store.put(robot, "lift_max_angle", 110)
+    store.put(robot, "AMBIENT_LIGHT", robot.light_sensor.ambient())
+    robot.lift_motor.run_target(50, 60)
+    assert robot.lift_motor.angle() == 60
+    command.Calibrate(store).run(robot)
+    assert robot.lift_max_angle == 110
+    assert robot.lift_motor.angle() == 0
+
+
+def _used_source(level, channels):
+    """returns a filters.Source smoothing level[0], which already holds the state of an earlier command reading 10"""
+    level[0] = 10
+    read = (lambda: level[0]) if channels == 1 else (lambda: (level[0],) * channels)
+    source = filters.filtered(read, filters.EMA(0.1, channels))
+    for _ in range(20):
+        source()
+    return source
+
+
+@pytest.mark.parametrize("make, channels", [
+    (lambda source: command.FollowLine(lambda: False, source=source), 1),
+    (lambda source: command.FollowLineWhileAvoidingCollision(lambda: False, source=source), 1),
+    (lambda source: command.PIDFollowLine(lambda: False, source=source), 1),
+    (lambda source: command.ExitSpecifiedArea(source=source), 3),
+    (lambda source: command.ExitSpecifiedAreaInASafeManner(source=source), 3),
+])
+def test_commands_reset_their_source_when_they_start(make, channels):
+    _, robot = _line_robot()
+    level = [10]
+    source = _used_source(level, channels)
+    level[0] = 80
+    steps = make(source).steps(robot)
+    next(steps, None)
+    steps.close()
+    assert source() == (80 if channels == 1 else (80, 80, 80))
+
+
+def test_predictive_avoidance_run_slows_down_instead_of_stepping_aside():
+    sim = Simulation(obstacles=[Obstacle(600, 0)])
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    robot.log.echo = False
+    avoidance = command.PredictiveCollisionAvoidance()
+    avoidance.run(robot)
+    assert 0 < avoidance.speed_factor < 1
+    assert avoidance.avoidances == 0
+    assert robot.body.heading == 0
+
+
+def test_pid_follower_reaches_its_top_speed_on_a_straight_line():
+    sim, robot = _line_robot()
+    speeds = []
+    cmd = command.PIDFollowLine(lambda: robot.drivebase.distance() >= 2000, inside=0, outside=79)
+    def probe(_):
+        speeds.append(robot.body.speed)
+        sim.at(sim.time() + 50, probe)
+    sim.at(50, probe)
+    sim.run(cmd, robot, time_limit=30000)
+    assert max(speeds) >= cmd.max_speed * 0.9
+
+
+def test_pid_follower_laps_the_stadium_faster_than_follow_line():
+    follow_line = tuning.lap_scenario(command.FollowLine, {"inside": 0, "outside": 79})
+    pid = tuning.lap_scenario(command.PIDFollowLine, {"inside": 0, "outside": 79})
+    assert follow_line.completed and pid.completed
+    assert pid.time_ms < follow_line.time_ms * 0.7
+
+
+def _avoid(avoider, obstacle, until_x=1500, until_ms=None):
+    """follows a line towards an obstacle with the avoider, returns the wait times it stepped aside with"""
+    sim = Simulation(floor=Floor().add_line(0, 0, 3000, 0, "BLACK"), obstacles=[obstacle])
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    asides = []
+    step_aside = avoider.step_aside
+    def record(robot, wait_time):
+        asides.append(wait_time)
+        step_aside(robot, wait_time)
+    avoider.step_aside = record
+    done = (lambda: robot.body.x > until_x) if until_ms is None else (lambda: sim.time() > until_ms)
+    sim.run(command.FollowLineWhileAvoidingCollision(done, inside=0, outside=79, avoidance_subcommand=avoider), robot, time_limit=60000)
+    return asides
+
+
+def test_predictive_avoidance_steps_aside_of_a_static_obstacle_no_later_than_collision_avoidance():
+    baseline = command.CollisionAvoidance()
+    _avoid(baseline, Obstacle(1000, 0, 60), until_ms=14000)
+    predictive = command.PredictiveCollisionAvoidance()
+    asides = _avoid(predictive, Obstacle(1000, 0, 60), until_ms=14000)
+    assert predictive.avoidances == 1
+    assert asides == [pytest.approx(predictive.wait_time - predictive.stand_time, abs=100)]
+    assert predictive.time_lost <= baseline.time_lost / baseline.avoidances + 100
+
+
+def test_predictive_avoidance_waits_for_a_passing_obstacle_without_stepping_aside():
+    predictive = command.PredictiveCollisionAvoidance()
+    asides = _avoid(predictive, Obstacle(800, -300, 60, vy=60))
+    assert predictive.avoidances == 1
+    assert asides == []
+    assert predictive.time_lost < predictive.stand_time
+
+
+def test_predictive_avoidance_steps_aside_of_an_oncoming_obstacle():
+    predictive = command.PredictiveCollisionAvoidance()
+    asides = _avoid(predictive, Obstacle(2500, 0, 60, vx=-80))
+    assert len(asides) == 1
+
+
+def test_pid_curvature_estimate_follows_the_stadium_track():
+    sim = Simulation(floor=tuning.stadium())
+    robot = SimRobot(sim, x=200, y=0, heading=0)
+    cmd = command.PIDFollowLine(lambda: robot.drivebase.distance() >= tuning.LAP, inside=0, outside=79)
+    early, straight, curve = [], [], []
+    def probe(_):
+        travelled = robot.drivebase.distance()
+        if travelled < cmd.curve_window:
+            early.append(cmd.curvature)
+        elif 300 < robot.body.x < 1800:
+            straight.append(cmd.curvature)
+        elif robot.body.x > 2150 and 100 < robot.body.y < 400:
+            curve.append(cmd.curvature)
+        sim.at(sim.time() + 20, probe)
+    sim.at(20, probe)
+    sim.run(cmd, robot, time_limit=60000)
+    # a circle with a radius of 250 mm turns 180 / (pi * 250) deg/mm
+    assert early and max(early) == 0.0
+    assert sum(straight) / len(straight) < 0.05
+    assert sum(curve) / len(curve) == pytest.approx(180 / (3.14159 * 250), rel=0.25)
+
+
+class _Hog(command.Base):
+    """a command whose every tick blocks for tick_ms, holding back the other commands of its group"""
+    def __init__(self, tick_ms):
+        super().__init__("Hog")
+        self.tick_ms = tick_ms
+
+    def steps(self, robot):
+        while True:
+            wait(self.tick_ms)
+            yield
+
+
+def _lift(lift, hog_ms=None):
+    """runs lift in front of a pallet 35 mm beyond the reach of the touch sensor, next to a _Hog if hog_ms is given"""
+    sim = Simulation(obstacles=[Obstacle(300, 0, 60)])
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    robot.log.echo = False
+    if hog_ms is None:
+        sim.run(lift, robot, time_limit=20000)
+    else:
+        race = command.Race("Lift next to a hog")
+        race.append(lift)
+        race.append(_Hog(hog_ms))
+        sim.run(race, robot, time_limit=20000)
+    return lift
+
+
+def test_continuous_lift_stops_within_stop_distance_of_the_pallet_and_sooner_than_stepped():
+    stepped = _lift(command.Lift(approach=command.STEPPED))
+    continuous = _lift(command.Lift(approach=command.CONTINUOUS))
+    assert stepped.success and continuous.success
+    assert 35 <= continuous.approached <= 35 + continuous.stop_distance
+    assert continuous.approached <= stepped.approached
+    assert continuous.duration < stepped.duration
+
+
+def test_continuous_lift_slows_down_when_the_touch_sensor_is_polled_late():
+    # at full creep speed every 250 ms poll comes 15 mm after the last one and would stop 45 mm in
+    lift = _lift(command.Lift(approach=command.CONTINUOUS), hog_ms=250)
+    assert lift.success
+    assert 35 <= lift.approached <= 35 + lift.stop_distance
+
+
+def test_lift_rejects_a_creep_speed_driving_past_stop_distance_between_polls():
+    with pytest.raises(ValueError):
+        command.Lift(approach=command.CONTINUOUS, creep_speed=300, stop_distance=2, rate=100)
+    command.Lift(approach=command.STEPPED, creep_speed=300, stop_distance=2, rate=100)
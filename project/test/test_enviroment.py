@@ -0,0 +1,40 @@
+"""Tests of the color classification."""
+
+import pytest
+
+import enviroment as env
+
+
+def _nearest(color):
+    """the linear nearest color search the lookup tables stand in for"""
+    return env._closest(color, env.rgb_list, env.rgb_likeness)  # pylint: disable=protected-access
+
+
+def test_rgb_classification_matches_the_nearest_color_over_the_whole_cube():
+    cube = [(red, green, blue) for red in range(101) for green in range(101) for blue in range(101)]
+    indices = env.classify_rgb_batch(cube)
+    mismatches = [color for color, index in zip(cube, indices) if index != _nearest(color)]
+    assert not mismatches, "{} readouts misclassified, e.g. {}".format(len(mismatches), mismatches[:5])
+
+
+def test_single_and_batch_classification_agree():
+    samples = [((i * 37) % 101, (i * 59) % 101, (i * 83) % 101) for i in range(500)]
+    assert env.classify_rgb_batch(samples) == bytearray(env.classify_rgb(sample) for sample in samples)
+
+
+@pytest.mark.parametrize("color, clamped", [
+    ((12.4, 12.6, 43.7), (12, 13, 44)),
+    ((-5, 30, 52), (0, 30, 52)),
+    ((-300, 30, 52), (0, 30, 52)),
+    ((70, 189, 100), (70, 100, 100)),
+    ((70, 89, 1000), (70, 89, 100)),
+    ((53.0, 24.0, 43.0), (53, 24, 43)),
+])
+def test_out_of_range_and_float_channels_are_clamped(color, clamped):
+    assert env.classify_rgb(color) == _nearest(clamped)
+    assert env.classify_rgb_batch([color]) == bytearray([_nearest(clamped)])
+
+
+def test_reference_colors_classify_as_themselves():
+    for name, color in zip(env.color_names, env.rgb_list):
+        assert env.from_rgb(color) == name
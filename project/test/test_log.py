@@ -0,0 +1,47 @@
+"""Tests of the rate-limited logger."""
+
+from simulation import Simulation, wait
+from log import Logger
+
+
+def _logger():
+    Simulation()
+    written = []
+    return Logger(written.append), written
+
+
+def test_records_within_the_refresh_interval_wait_for_the_next_write():
+    log, written = _logger()
+    log.info("a")
+    log.info("b")
+    log.info("c")
+    assert len(written) == 1
+    assert log.pending == 2
+    log.flush()
+    assert log.pending == 0
+    assert written[-1].endswith("c")
+
+
+def test_poll_writes_pending_records_once_the_interval_passed():
+    log, written = _logger()
+    log.info("a")
+    log.info("b")
+    log.poll()
+    assert log.pending == 1
+    wait(log.refresh_interval)
+    log.poll()
+    assert log.pending == 0
+    assert written[-1].endswith("b")
+
+
+def test_queue_run_writes_the_last_records():
+    import commands as command
+    from simulation import SimRobot
+    sim = Simulation()
+    robot = SimRobot(sim)
+    robot.log.echo = False
+    queue = command.Queue("Log")
+    for name in ("a", "b", "c"):
+        queue.append(command.Lambda(lambda robot, name=name: robot.log.info(name)))
+    queue.run(robot)
+    assert robot.log.pending == 0
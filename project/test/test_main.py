@@ -0,0 +1,31 @@
+"""Tests of the robot's main program on the simulated robot."""
+
+import json
+
+from simulation import Simulation, SimRobot
+
+Simulation()  # main starts its startup timer when it is imported, which needs a clock
+import main  # pylint: disable=wrong-import-position
+
+
+def _run_main(monkeypatch, **settings):
+    """runs main with the settings on a simulated robot and returns the robot"""
+    robots = []
+    def make_robot(startup):
+        robot = SimRobot(Simulation(), startup=startup)
+        robots.append(robot)
+        return robot
+    monkeypatch.setattr(main, "Robot", make_robot)
+    for name, value in settings.items():
+        monkeypatch.setattr(main, name, value)
+    assert main.main() == 0
+    return robots[0]
+
+
+def test_a_mission_replaces_the_built_in_queue_and_its_listing_is_printed(monkeypatch, tmp_path):
+    path = tmp_path / "mission.json"
+    path.write_text(json.dumps({"name": "Short", "commands": [{"type": "Wait", "duration": 50, "name": "Pause"}]}))
+    robot = _run_main(monkeypatch, MISSION_FILE=str(path))
+    screen = "\n".join(robot.brick.screen.lines)
+    assert "Exit specified area" not in screen
+    assert "0: run Pause" in screen
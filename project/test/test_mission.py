@@ -0,0 +1,89 @@
+"""Tests of the mission compiler's validation."""
+
+import pytest
+
+from simulation import Simulation, SimRobot
+import mission
+from mission import MissionError
+
+
+def _compile(*commands):
+    return mission.compile_mission({"commands": list(commands)}, SimRobot(Simulation()))
+
+
+@pytest.mark.parametrize("condition", [
+    {"pressed": "yes"},
+    {"pressed": 1},
+    {"distance_below": "100"},
+    {"distance_below": True},
+    {"time_over": None},
+    {"not": {"time_over": [1000]}},
+])
+def test_condition_values_are_checked_at_load(condition):
+    with pytest.raises(MissionError):
+        _compile({"type": "FollowLine", "until": condition})
+
+
+def test_valid_conditions_compile():
+    _compile({"type": "FollowLine", "until": {"any": [{"pressed": True}, {"distance_below": 150.5}, {"time_over": 2000}]}})
+
+
+@pytest.mark.parametrize("entry", [
+    {"type": "PIDFollowLine", "until": {"pressed": True}, "curve_window": 25.5},
+    {"type": "PIDFollowLine", "until": {"pressed": True}, "curve_window": 0},
+    {"type": "ExitSpecifiedArea", "confirm": 2.0},
+    {"type": "Turn", "angle": "90"},
+])
+def test_parameters_of_the_wrong_type_are_rejected(entry):
+    with pytest.raises(MissionError):
+        _compile(entry)
+
+
+def test_integer_parameters_compile():
+    program = _compile({"type": "PIDFollowLine", "until": {"pressed": True}, "curve_window": 12, "kp": 1.5}, {"type": "ExitSpecifiedArea", "confirm": 3})
+    assert program.instructions[0][1].curve_window == 12
+    assert program.instructions[1][1].confirm == 3
+
+
+@pytest.mark.parametrize("approach", ["stepped", "continuous"])
+def test_lift_approach_takes_its_strings(approach):
+    program = _compile({"type": "Lift", "approach": approach})
+    assert program.instructions[0][1].approach == approach
+
+
+@pytest.mark.parametrize("approach", ["fast", 1])
+def test_lift_approach_rejects_other_values(approach):
+    with pytest.raises(MissionError):
+        _compile({"type": "Lift", "approach": approach})
+
+
+@pytest.mark.parametrize("rate", [0, -5, "fast", True])
+def test_group_rate_is_checked_at_load(rate):
+    with pytest.raises(MissionError):
+        _compile({"type": "Parallel", "rate": rate, "commands": [{"type": "Wait", "duration": 10}]})
+
+
+def test_group_rate_compiles():
+    program = _compile({"type": "Race", "rate": 50, "commands": [{"type": "Wait", "duration": 10}]})
+    assert program.instructions[0][1][2] == 50
+
+
+def test_command_rate_must_be_positive():
+    with pytest.raises(MissionError):
+        _compile({"type": "FollowLine", "until": {"pressed": True}, "rate": 0})
+
+
+@pytest.mark.parametrize("entry", [
+    {"type": "Sequence", "commands": [], "times": 2},
+    {"type": "Repeat", "times": 2, "commands": [], "condition": {"pressed": True}},
+    {"type": "If", "condition": {"pressed": True}, "commands": [], "rate": 10},
+    {"type": "Parallel", "commands": [], "until": {"pressed": True}},
+])
+def test_unknown_keys_of_blocks_and_groups_are_rejected(entry):
+    with pytest.raises(MissionError):
+        _compile(entry)
+
+
+def test_unknown_keys_of_the_mission_are_rejected():
+    with pytest.raises(MissionError):
+        mission.compile_mission({"commands": [], "comands": []}, SimRobot(Simulation()))
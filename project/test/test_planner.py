@@ -0,0 +1,36 @@
+"""Tests of the route planner."""
+
+import pytest
+
+import planner
+from planner import Planner, DISTANCE, TIME
+
+
+def test_warehouse_is_built_on_first_use_and_shared():
+    assert planner.warehouse_planner() is planner.warehouse_planner()
+
+
+@pytest.mark.parametrize("metric", (DISTANCE, TIME))
+def test_astar_finds_routes_as_cheap_as_dijkstra(metric):
+    warehouse = planner.warehouse_planner()
+    for start in warehouse.nodes:
+        for goal in warehouse.nodes:
+            found = warehouse.astar(start, goal, metric)
+            cost = sum(warehouse.cost(edge, metric) for edge in found)
+            assert cost == pytest.approx(warehouse.route_cost(start, goal, metric))
+            assert cost == pytest.approx(sum(warehouse.cost(edge, metric) for edge in warehouse.route(start, goal, metric)))
+
+
+def test_an_unreachable_goal_raises_value_error():
+    graph = Planner()
+    graph.add_node("a", 0, 0)
+    graph.add_node("b", 100, 0)
+    graph.add_node("island", 0, 500)
+    graph.add_edge("a", "b", "BLACK")
+    assert graph.route_cost("a", "b") == 100
+    with pytest.raises(ValueError):
+        graph.route("a", "island")
+    with pytest.raises(ValueError):
+        graph.astar("a", "island")
+    with pytest.raises(ValueError):
+        graph.route_cost("a", "island")
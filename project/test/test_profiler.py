@@ -0,0 +1,50 @@
+"""Tests of the per-command profiler."""
+
+from simulation import Simulation, SimRobot
+import commands as command
+from profiler import Profiler
+
+
+class _Steps(command.Base):
+    """makes a number of steps"""
+    def __init__(self, count, name="Steps"):
+        super().__init__(name=name)
+        self.count = count
+
+    def steps(self, robot):
+        for _ in range(self.count):
+            yield
+
+
+class _Runs(command.Base):
+    """runs a shared command as its own step"""
+    def __init__(self, shared, name):
+        super().__init__(name=name)
+        self.shared = shared
+
+    def steps(self, robot):
+        yield from command.steps_of(self.shared, robot, self)
+
+
+def test_a_command_shared_by_two_parents_is_profiled_under_both():
+    Simulation()
+    shared = _Steps(5)
+    group = command.Parallel("Group")
+    group.append(_Runs(shared, "A"))
+    group.append(_Runs(shared, "B"))
+    profiler = command.add_hook(Profiler())
+    try:
+        group.run(SimRobot())
+    finally:
+        command.remove_hook(profiler)
+    first, second = profiler.root.children[0].children
+    assert [child.steps for child in first.children] == [5]
+    assert [child.steps for child in second.children] == [5]
+    assert not profiler.running and not profiler.latest
+
+
+def test_followers_get_an_avoider_of_their_own():
+    first = command.FollowLineWhileAvoidingCollision(lambda: True)
+    second = command.FollowLineWhileAvoidingCollision(lambda: True)
+    assert isinstance(first.avoidance_subcommand, command.CollisionAvoidance)
+    assert first.avoidance_subcommand is not second.avoidance_subcommand
@@ -0,0 +1,59 @@
+"""Tests of the replay of recorded sensor streams."""
+
+import json
+
+import pytest
+
+from simulation import Simulation, SimRobot, Floor
+import commands as command
+import replay
+import telemetry
+
+
+def _follow_line():
+    """factory of the replayed command"""
+    return command.FollowLine(lambda: False, inside=0, outside=79)
+
+
+def _recording(tmp_path):
+    """records a second of line following and returns the path of the telemetry file"""
+    sim = Simulation(floor=Floor().add_line(0, 0, 3000, 0, "BLACK"))
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    robot.telemetry = telemetry.Recorder()
+    sim.run(_follow_line(), robot, time_limit=1000)
+    path = str(tmp_path / "lap.bin")
+    robot.telemetry.save(path)
+    return path
+
+
+def test_regress_passes_against_its_own_reference_and_fails_on_a_tick_mismatch(tmp_path):
+    path = _recording(tmp_path)
+    assert replay.regress([path], _follow_line, update=True, processes=1) == {path: []}
+    assert replay.regress([path], _follow_line, processes=1) == {path: []}
+
+    reference = path + replay.REFERENCE_SUFFIX
+    with open(reference) as file:
+        stored = json.load(file)
+    ticks = stored[replay.TICKS]
+    stored[replay.TICKS] = ticks + 62
+    with open(reference, "w") as file:
+        json.dump(stored, file)
+    assert replay.regress([path], _follow_line, processes=1) == {path: [(replay.TICKS, ticks + 62, ticks)]}
+
+
+def test_a_bare_list_reference_compares_the_outputs_only(tmp_path):
+    path = _recording(tmp_path)
+    replay.regress([path], _follow_line, update=True, processes=1)
+    reference = path + replay.REFERENCE_SUFFIX
+    outputs, _, _ = replay.load_outputs(reference)
+    with open(reference, "w") as file:
+        json.dump(outputs, file)
+    assert replay.load_outputs(reference)[1:] == (None, None)
+    assert replay.regress([path], _follow_line, processes=1) == {path: []}
+
+
+def test_a_command_reading_an_unrecorded_stream_is_refused(tmp_path):
+    recording = replay.Recording.load(_recording(tmp_path))
+    with pytest.raises(ValueError):
+        replay.replay(recording, command.Lift(approach=command.CONTINUOUS))
+    assert replay.Recording({}, defaults={"pressed": True}).value_at("pressed", 0) is True
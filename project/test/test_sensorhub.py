@@ -0,0 +1,67 @@
+"""Tests of the sensor hub caching and of the commands reading through it."""
+
+from simulation import Simulation, SimRobot, Floor, wait
+from sensorhub import SensorHub
+from robot import SENSOR_PERIODS, CONTROL_TICK
+import commands as command
+
+
+def _counter():
+    """returns a read function counting its calls"""
+    calls = []
+    def read():
+        calls.append(None)
+        return len(calls)
+    return read
+
+
+def test_reads_within_the_period_hit_the_cache():
+    Simulation()
+    hub = SensorHub()
+    hub.add("value", _counter(), 10)
+    assert hub.read("value") == 1
+    wait(5)
+    assert hub.read("value") == 1
+    assert hub.stats()["value"] == (1, 1)
+
+
+def test_a_reading_older_than_the_period_is_read_again():
+    Simulation()
+    hub = SensorHub()
+    hub.add("value", _counter(), 10)
+    hub.read("value")
+    wait(10)
+    assert hub.read("value") == 2
+    assert hub.age("value") == 0
+    hub.invalidate("value")
+    assert hub.read("value") == 3
+    assert hub.stats()["value"] == (3, 0)
+
+
+def test_a_threaded_read_never_touches_the_device():
+    sim = Simulation()
+    hub = SensorHub()
+    read = _counter()
+    hub.add("value", read, 10)
+    hub.threaded = True
+    # stands in for the polling thread, which only runs on the brick
+    sim.at(20, lambda sim: hub.poll())
+    assert hub.read("value") == 1
+    assert sim.time() >= 20
+    wait(50)
+    assert hub.read("value") == 1
+    assert hub.stats()["value"] == (1, 2)
+
+
+def test_the_line_channels_are_cached_for_a_control_tick():
+    for name in ("reflection", "rgb", "pressed"):
+        assert SENSOR_PERIODS[name] >= CONTROL_TICK
+
+
+def test_line_followers_read_through_the_hub():
+    sim = Simulation(floor=Floor().add_line(0, 0, 3000, 0, "BLACK"))
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    sim.run(command.FollowLine(lambda: robot.body.x > 300, inside=0, outside=79), robot, time_limit=10000)
+    reads, _ = robot.sensors.stats()["reflection"]
+    assert reads > 0
+    assert reads == sim.counts["reflection"]
@@ -0,0 +1,30 @@
+"""Tests of the startup report."""
+
+from simulation import Simulation, SimRobot, wait
+from startup import StartupTimer
+
+
+def test_report_ends_at_finish_and_lists_lazy_devices_apart():
+    sim = Simulation()
+    timer = StartupTimer()
+    robot = SimRobot(sim, startup=timer)
+    robot.init_devices("light_sensor")
+    wait(100)
+    timer.finish("build the command queue")
+    wait(5000)
+    robot.init_devices("lift_motor")
+    report = timer.report()
+    head, lazy = report.split("initialized while running:\n")
+    assert head.startswith("startup: " + str(timer.finished) + " ms\n")
+    assert timer.finished < 5000
+    assert "device light_sensor" in head and "build the command queue" in head
+    assert "device lift_motor" in lazy and "device lift_motor" not in head
+
+
+def test_report_without_finish_runs_until_now():
+    Simulation()
+    timer = StartupTimer()
+    timer.mark("import commands")
+    wait(300)
+    assert timer.report().startswith("startup: " + str(timer.time()) + " ms\n")
+    assert "initialized while running" not in timer.report()
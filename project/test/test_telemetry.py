@@ -0,0 +1,23 @@
+"""Tests of the telemetry recorder."""
+
+from simulation import Simulation, SimRobot, Floor
+import commands as command
+from telemetry import Recorder, MISSING
+
+
+def test_avoiding_follower_records_one_row_per_tick_with_the_distance():
+    sim = Simulation(floor=Floor().add_line(0, 0, 3000, 0, "BLACK"))
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    robot.telemetry = Recorder()
+    ticks = []
+    def end_fn():
+        ticks.append(None)
+        return len(ticks) > 200
+    cmd = command.FollowLineWhileAvoidingCollision(end_fn, inside=0, outside=79, avoidance_subcommand=command.CollisionAvoidance())
+    cmd.run(robot)
+    telemetry = robot.telemetry
+    assert telemetry.count == 200
+    assert telemetry.names == [cmd.name]
+    for i in range(telemetry.count):
+        assert telemetry.reflection[i] != MISSING
+        assert telemetry.distance[i] != MISSING
@@ -0,0 +1,25 @@
+"""Tests of the fixed-rate loop timing."""
+
+from simulation import Simulation, wait
+from timing import FixedRateLoop
+
+
+def test_stats_after_the_loop_ended():
+    Simulation()
+    loop = FixedRateLoop(100)
+    loop.start()
+    for _ in range(100):
+        loop.tick()
+    wait(1000)
+    stats = loop.stats()
+    assert stats.ticks == 100
+    assert abs(stats.achieved_hz - 100) < 2
+
+
+def test_stats_of_a_stopped_loop():
+    Simulation()
+    loop = FixedRateLoop(50)
+    for _ in loop.ticks_until(lambda: loop.ticks >= 50):
+        pass
+    wait(500)
+    assert abs(loop.stats().achieved_hz - 50) < 2
@@ -0,0 +1,23 @@
+"""Tests of the parameter tuning entry point."""
+
+import json
+import sys
+
+import commands as command
+import tuning
+
+
+def test_the_fixed_parameters_are_saved_with_the_tuned_ones(tmp_path, monkeypatch):
+    path = str(tmp_path / "parameters.json")
+    best = {"max_speed": 200, "kp": 1.0}
+    monkeypatch.setattr(tuning, "tune", lambda *args, **kwargs: [(best, tuning.Trial(1000, 0, True))])
+    monkeypatch.setattr(sys, "argv", ["tuning.py", "PIDFollowLine", "--output", path])
+    assert tuning.main() == 0
+    with open(path) as file:
+        saved = json.load(file)["PIDFollowLine"]
+    assert saved == dict(best, inside=0, outside=79)
+
+    monkeypatch.setattr(command, "PARAMETERS", {})
+    command.load_parameters(path)
+    pid = command.PIDFollowLine.tuned(lambda: True)
+    assert (pid.inside, pid.outside, pid.max_speed) == (0, 79, 200)
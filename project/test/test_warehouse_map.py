@@ -0,0 +1,29 @@
+"""Tests of the raster map of the warehouse floor."""
+
+import warehouse_map
+from warehouse_map import RasterMap
+from planner import warehouse_planner
+import enviroment as env
+
+
+def _grid(rows):
+    """returns the grid of rows of color names given from the top"""
+    return bytes(env.color_names.index(name) for row in reversed(rows) for name in row)
+
+
+def test_raycast_passes_over_the_zone_markers():
+    floor = RasterMap.from_image()
+    for name in ("red_warehouse", "blue_warehouse", "warehouse", "pickup"):
+        node = warehouse_planner().nodes[name]
+        assert floor.color_at(node.x, node.y) == "BLACK"
+        for heading in (0, 90, 180, 270):
+            assert floor.raycast(node.x, node.y, heading) is warehouse_map.NO_HIT
+    floor.close()
+
+
+def test_raycast_stops_at_colors_marked_solid():
+    rows = [["WHITE"] * 4, ["WHITE", "WHITE", "BLACK", "WHITE"], ["WHITE"] * 4]
+    painted = RasterMap(4, 3, _grid(rows), mm_per_cell=10)
+    assert painted.raycast(5, 15, 0) is warehouse_map.NO_HIT
+    walled = RasterMap(4, 3, _grid(rows), mm_per_cell=10, solid=("BLACK",))
+    assert walled.raycast(5, 15, 0) == 15
@@ -0,0 +1,134 @@
+#! pylint: disable=line-too-long
+
+"""Fixed-rate control loop timing for commands."""
+
+from pybricks.tools import StopWatch, wait
+
+SKIP = "skip"
+"""overrun policy: drop the missed ticks and realign to the next deadline"""
+CATCH_UP = "catch_up"
+"""overrun policy: run the missed ticks back to back until the loop is on schedule again"""
+
+class LoopStats:
+    """
+    timing statistics of a FixedRateLoop
+    """
+    def __init__(self, rate_hz, ticks, elapsed, overruns, skipped, mean_jitter, max_jitter):
+        self.rate_hz = rate_hz
+        self.ticks = ticks
+        self.elapsed = elapsed
+        self.overruns = overruns
+        self.skipped = skipped
+        self.mean_jitter = mean_jitter
+        self.max_jitter = max_jitter
+
+    @property
+    def achieved_hz(self):
+        """returns the average number of ticks per second"""
+        return self.ticks * 1000 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return "{} ticks in {} ms: {:.1f} Hz (target {}), {} overruns, {} skipped, jitter mean {:.2f} ms max {:.2f} ms".format(
+            self.ticks, self.elapsed, self.achieved_hz, self.rate_hz if self.rate_hz else "unlimited",
+            self.overruns, self.skipped, self.mean_jitter, self.max_jitter)
+
+class FixedRateLoop:
+    """
+    paces a control loop to a fixed tick rate against a monotonic deadline
+    call tick() at the top of every iteration, it waits until the next deadline
+    """
+    def __init__(self, rate_hz=None, policy=SKIP, max_catch_up=5, on_overrun=None):
+        """
+        Paramaters:
+        rate_hz: ticks per second, None runs unthrottled and only measures
+        policy: SKIP or CATCH_UP, what to do with ticks missed because an iteration overran
+        max_catch_up: most ticks run back to back under CATCH_UP before the rest are skipped
+        on_overrun: function called with the number of missed ticks when an iteration overruns
+        """
+        self.rate_hz = rate_hz
+        self.period = 1000 / rate_hz if rate_hz else 0
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.on_overrun = on_overrun
+        self.watch = None
+        self.deadline = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_sum = 0
+        self.jitter_max = 0
+        self.last_tick = 0
+        """time of the latest tick in ms since the start"""
+        self.stopped_at = None
+        """time the loop was stopped at in ms since the start, None while it runs"""
+
+    def start(self):
+        """reset the statistics and make the next tick happen immediately"""
+        self.watch = StopWatch()
+        self.deadline = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_sum = 0
+        self.jitter_max = 0
+        self.last_tick = 0
+        self.stopped_at = None
+
+    def stop(self):
+        """end the loop, the statistics stop counting time here"""
+        if self.watch is not None and self.stopped_at is None:
+            self.stopped_at = self.watch.time()
+
+    def tick(self):
+        """wait for the next deadline, starts the loop on the first call"""
+        if self.watch is None:
+            self.start()
+        now = self.watch.time()
+        if self.period:
+            if now < self.deadline:
+                wait(int(self.deadline - now + 0.5))
+                now = self.watch.time()
+            # lateness of this tick relative to its deadline
+            jitter = now - self.deadline
+            missed = int(jitter // self.period)
+            if missed > 0:
+                self.overruns += 1
+                if self.on_overrun is not None:
+                    self.on_overrun(missed)
+                if self.policy == CATCH_UP and missed <= self.max_catch_up:
+                    # keep the schedule, the next ticks do not wait
+                    self.deadline += self.period
+                else:
+                    self.skipped += missed
+                    self.deadline += (missed + 1) * self.period
+            else:
+                self.deadline += self.period
+        else:
+            jitter = 0
+        self.ticks += 1
+        self.last_tick = now
+        self.jitter_sum += jitter
+        if jitter > self.jitter_max:
+            self.jitter_max = jitter
+
+    def ticks_until(self, end_fn):
+        """generator that ticks until end_fn returns True"""
+        while not end_fn():
+            self.tick()
+            yield self.ticks
+        self.stop()
+
+    def stats(self):
+        """
+        returns the LoopStats of the loop so far,
+        a loop that was not stopped counts until the end of the period of its latest tick, so the statistics
+        stay right when they are read after the loop ended
+        """
+        if self.watch is None:
+            elapsed = 0
+        elif self.stopped_at is not None:
+            elapsed = self.stopped_at
+        else:
+            elapsed = int(self.last_tick + self.period)
+        return LoopStats(self.rate_hz, self.ticks, elapsed, self.overruns, self.skipped,
+                         self.jitter_sum / self.ticks if self.ticks else 0.0, self.jitter_max)
@@ -0,0 +1,103 @@
+#! pylint: disable=line-too-long
+
+"""
+Tracking of the obstacle in front of the truck.
+
+The tracker keeps the recent ultrasonic readings with their time in ring buffers allocated up front and fits a line
+through them, whose slope is the closing speed: how fast the gap to the obstacle shrinks, from the truck's own motion
+and the obstacle's together. Dividing the gap by it gives the time to collision, so a command can slow down for an
+obstacle that is coming closer, stop for one that is about to hit and drive on as soon as it moves away.
+Readings at or beyond max_range mean nothing is in front, they end the series.
+
+    tracker = ObstacleTracker()
+    tracker.add(time, distance)
+    ttc = tracker.time_to_collision()
+    if ttc is not None and ttc < 1500: ...
+"""
+
+class ObstacleTracker:
+    """
+    closing speed and time to collision of the obstacle in front, from a short time series of distances
+    """
+    def __init__(self, window=6, max_age=400, max_range=2000, margin=120):
+        """
+        Paramaters:
+        window: number of recent readings the closing speed is fitted to
+        max_age: ms after which a reading no longer counts
+        max_range: distance in mm from which nothing counts as being in front
+        margin: gap in mm that already counts as a collision
+        """
+        self.window = window
+        self.max_age = max_age
+        self.max_range = max_range
+        self.margin = margin
+        self.times = [0] * window
+        self.distances = [0] * window
+        self.index = 0
+        self.count = 0
+
+    def reset(self):
+        """forget the readings"""
+        self.count = 0
+
+    def add(self, time, distance):
+        """records a reading taken at time ms"""
+        if distance >= self.max_range:
+            self.count = 0
+            return
+        self.times[self.index] = time
+        self.distances[self.index] = distance
+        self.index = (self.index + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+
+    def _samples(self):
+        """returns the ring buffer positions of the readings that are recent enough, newest first"""
+        newest = self.times[(self.index - 1) % self.window]
+        positions = []
+        for i in range(self.count):
+            position = (self.index - 1 - i) % self.window
+            if newest - self.times[position] > self.max_age:
+                break
+            positions.append(position)
+        return positions
+
+    def readings(self):
+        """returns the number of recent readings the closing speed is fitted to"""
+        return len(self._samples()) if self.count else 0
+
+    def present(self):
+        """returns True if an obstacle is in front"""
+        return self.count > 0
+
+    def distance(self):
+        """returns the latest distance in mm, None if nothing is in front"""
+        if self.count == 0:
+            return None
+        return self.distances[(self.index - 1) % self.window]
+
+    def closing_speed(self):
+        """returns how fast the gap shrinks in mm/s, negative while it grows, 0 without two recent readings"""
+        positions = self._samples()
+        if len(positions) < 2:
+            return 0.0
+        # least squares slope of the distance over time
+        mean_t = sum(self.times[i] for i in positions) / len(positions)
+        mean_d = sum(self.distances[i] for i in positions) / len(positions)
+        covariance = 0.0
+        variance = 0.0
+        for i in positions:
+            dt = self.times[i] - mean_t
+            covariance += dt * (self.distances[i] - mean_d)
+            variance += dt * dt
+        if variance == 0:
+            return 0.0
+        return -covariance / variance * 1000
+
+    def time_to_collision(self, closing_speed=None):
+        """returns the ms until the gap shrinks to the margin, None if it does not shrink or nothing is in front"""
+        if closing_speed is None:
+            closing_speed = self.closing_speed()
+        if self.count == 0 or closing_speed <= 0:
+            return None
+        return max(0.0, (self.distance() - self.margin) / closing_speed * 1000)
@@ -0,0 +1,365 @@
+#! pylint: disable=line-too-long
+
+"""
+Parameter tuning of the commands in simulated scenarios.
+
+Every target names a command, the parameters to tune with their ranges and a scenario that runs the command with a
+candidate set of parameters on the simulation and measures how long it took to complete and how far the truck strayed
+from the line. Candidates are searched with a coarse grid followed by rounds of adaptive search around the best ones so
+far, evaluated across a process pool, and the winner is written to a parameters file commands.load_parameters reads.
+
+Usage: python tuning.py TARGET [--points N] [--rounds N] [--samples N] [--processes N] [--output parameters.json]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+
+from simulation import Floor, Obstacle, Simulation, SimRobot
+import commands as command
+
+FAILED = 1000.0
+"""score added to candidates that do not complete their scenario, lose the line or collide"""
+
+ERROR_WEIGHT = 0.1
+"""score per mm of mean line error, one mm of error costs as much as 0.1 s of completion time"""
+
+LOST_LINE = 60
+"""distance in mm from the line at which a candidate has lost it"""
+
+PROBE_INTERVAL = 20
+"""virtual ms between measurements of the truck's position"""
+
+
+class Trial:
+    """the outcome of running a scenario with one set of parameters"""
+    def __init__(self, time_ms, error, completed, reason=""):
+        """
+        Paramaters:
+        time_ms: virtual time the command ran for
+        error: mean distance of the truck from the line in mm
+        completed: True if the command reached the goal without losing the line or colliding
+        reason: why the scenario was not completed
+        """
+        self.time_ms = time_ms
+        self.error = error
+        self.completed = completed
+        self.reason = reason
+
+    def score(self, error_weight=ERROR_WEIGHT):
+        """returns the score of the trial, lower is better"""
+        score = self.time_ms / 1000 + error_weight * self.error
+        return score if self.completed else score + FAILED
+
+    def __str__(self):
+        return "{:.0f} ms, line error {:.1f} mm{}".format(self.time_ms, self.error, "" if self.completed else ", failed: " + self.reason)
+
+
+class _Probe:
+    """measures the distance of a truck from the line and from obstacles at a fixed interval"""
+    def __init__(self, sim, body, line_distance, interval=PROBE_INTERVAL):
+        self.sim = sim
+        self.body = body
+        self.line_distance = line_distance
+        self.interval = interval
+        self.error_sum = 0.0
+        self.samples = 0
+        self.worst = 0.0
+        self.collided = False
+        sim.at(interval, self.measure)
+
+    def measure(self, sim):
+        """take one measurement and schedule the next"""
+        body = self.body
+        if self.line_distance is not None:
+            error = self.line_distance(body.x, body.y)
+            self.error_sum += error
+            self.samples += 1
+            self.worst = max(self.worst, error)
+        for obstacle in sim.obstacles:
+            if math.hypot(obstacle.x - body.x, obstacle.y - body.y) < obstacle.radius + body.radius:
+                self.collided = True
+        sim.at(sim.time() + self.interval, self.measure)
+
+    @property
+    def error(self):
+        """returns the mean distance from the line in mm"""
+        return self.error_sum / self.samples if self.samples else 0.0
+
+
+def _trial(sim, robot, cmd, probe, done, time_limit):
+    """runs a command and returns its Trial"""
+    report = sim.run(cmd, robot, time_limit=time_limit)
+    if probe.collided:
+        return Trial(report.virtual_ms, probe.error, False, "collided")
+    if probe.worst > LOST_LINE:
+        return Trial(report.virtual_ms, probe.error, False, "lost the line")
+    if report.timed_out or not done():
+        return Trial(report.virtual_ms, probe.error, False, "did not finish")
+    return Trial(report.virtual_ms, probe.error, True)
+
+
+# a stadium shaped track: two 2 m straights joined by half circles with a radius of 250 mm
+_STRAIGHT = 2000
+_RADIUS = 250
+LAP = 2 * _STRAIGHT + 2 * math.pi * _RADIUS
+"""length of the stadium track in mm"""
+
+
+def stadium():
+    """returns the floor of the stadium track"""
+    floor = Floor()
+    floor.add_ring(0, _RADIUS, _RADIUS, "BLACK").add_ring(_STRAIGHT, _RADIUS, _RADIUS, "BLACK")
+    floor.add_rect(0, 12, _STRAIGHT, 2 * _RADIUS - 12, "WHITE")
+    floor.add_line(0, 0, _STRAIGHT, 0, "BLACK").add_line(0, 2 * _RADIUS, _STRAIGHT, 2 * _RADIUS, "BLACK")
+    return floor
+
+
+def stadium_distance(x, y):
+    """returns the distance of a point from the center of the stadium track"""
+    if 0 <= x <= _STRAIGHT:
+        return min(abs(y), abs(y - 2 * _RADIUS))
+    cx = 0 if x < 0 else _STRAIGHT
+    return abs(math.hypot(x - cx, y - _RADIUS) - _RADIUS)
+
+
+def lap_scenario(command_class, parameters, time_limit=90000):
+    """follows the stadium track for one lap"""
+    sim = Simulation(floor=stadium())
+    robot = SimRobot(sim, x=200, y=0, heading=0)
+    probe = _Probe(sim, robot.body, stadium_distance)
+    done = lambda: robot.drivebase.distance() >= LAP
+    return _trial(sim, robot, command_class(done, **parameters), probe, done, time_limit)
+
+
+def crossing_scenario(parameters, time_limit=90000, avoider=command.CollisionAvoidance):
+    """follows a straight line while another truck crosses it, avoiding it with an avoider made from the parameters"""
+    length = 3000
+    sim = Simulation(floor=Floor().add_line(0, 0, length, 0, "BLACK"), obstacles=[Obstacle(1200, -900, 90, vy=60)])
+    robot = SimRobot(sim, x=100, y=0, heading=0)
+    probe = _Probe(sim, robot.body, lambda x, y: abs(y))
+    done = lambda: robot.body.x >= length - 200
+    avoidance = avoider(**parameters)
+    cmd = command.FollowLineWhileAvoidingCollision(done, inside=0, outside=79, avoidance_subcommand=avoidance)
+    return _trial(sim, robot, cmd, probe, done, time_limit)
+
+
+def exit_area_scenario(parameters, time_limit=30000):
+    """leaves a blue zone with a pallet in the way"""
+    if parameters["min_dist"] > parameters["max_dist"]:
+        return Trial(0, 0, False, "min_dist above max_dist")
+    sim = Simulation(floor=Floor().add_rect(-300, -300, 600, 300, "BLUE"), obstacles=[Obstacle(900, 0, 60)])
+    robot = SimRobot(sim, x=0, y=0, heading=0)
+    probe = _Probe(sim, robot.body, None)
+    done = lambda: sim.floor.color_at(*robot.body.point(robot.light_sensor.offset)) != "BLUE"
+    cmd = command.ExitSpecifiedAreaInASafeManner(**parameters)
+    return _trial(sim, robot, cmd, probe, done, time_limit)
+
+
+def _follow_line_lap(parameters):
+    return lap_scenario(command.FollowLine, parameters)
+
+
+def _pid_lap(parameters):
+    return lap_scenario(command.PIDFollowLine, parameters)
+
+
+def _predictive_crossing(parameters):
+    if parameters["slow_distance"] <= parameters["avoidance_distance"] or parameters["slow_ttc"] <= parameters["stop_ttc"]:
+        return Trial(0, 0, False, "slows down below the stopping thresholds")
+    return crossing_scenario(parameters, avoider=command.PredictiveCollisionAvoidance)
+
+
+class Target:
+    """a command to tune"""
+    def __init__(self, command_name, space, scenario, fixed=None):
+        """
+        Paramaters:
+        command_name: name of the command class the parameters are stored under
+        space: dict of parameter name to (low, high, integer)
+        scenario: function of the parameters returning a Trial, must be picklable
+        fixed: parameters passed to the scenario that are not tuned
+        """
+        self.command_name = command_name
+        self.space = space
+        self.scenario = scenario
+        self.fixed = fixed if fixed is not None else {}
+
+    def arguments(self, parameters):
+        """returns the arguments the scenario runs the command with: the fixed parameters updated with the tuned ones"""
+        arguments = dict(self.fixed)
+        arguments.update(parameters)
+        return arguments
+
+
+TARGETS = {
+    "FollowLine": Target("FollowLine", {
+        "speed": (60, 250, False),
+        "gain": (0.3, 2.5, False),
+        "inside": (0, 30, True),
+        "outside": (60, 90, True),
+    }, _follow_line_lap),
+    "PIDFollowLine": Target("PIDFollowLine", {
+        "max_speed": (120, 350, False),
+        "kp": (0.5, 3.0, False),
+        "kd": (0.0, 0.3, False),
+        "curve_gain": (1, 12, False),
+    }, _pid_lap, fixed={"inside": 0, "outside": 79}),
+    "CollisionAvoidance": Target("CollisionAvoidance", {
+        "avoidance_distance": (150, 600, True),
+        "wait_time": (1000, 10000, True),
+    }, crossing_scenario),
+    "PredictiveCollisionAvoidance": Target("PredictiveCollisionAvoidance", {
+        "avoidance_distance": (150, 400, True),
+        "slow_distance": (300, 900, True),
+        "stop_ttc": (500, 3000, True),
+        "slow_ttc": (1500, 6000, True),
+    }, _predictive_crossing),
+    "ExitSpecifiedAreaInASafeManner": Target("ExitSpecifiedAreaInASafeManner", {
+        "max_dist": (200, 800, True),
+        "min_dist": (100, 500, True),
+        "turn_dist": (100, 600, True),
+    }, exit_area_scenario),
+}
+"""tunable commands by name"""
+
+
+def _clip(space, parameters):
+    """returns the parameters limited to their ranges and rounded where they are integers"""
+    clipped = {}
+    for name, value in parameters.items():
+        low, high, integer = space[name]
+        value = max(low, min(high, value))
+        clipped[name] = int(round(value)) if integer else round(value, 4)
+    return clipped
+
+
+def grid(space, points):
+    """returns the candidates of a grid with points values per parameter, spread evenly over the ranges"""
+    names = sorted(space)
+    axes = []
+    for name in names:
+        low, high, _ = space[name]
+        axes.append([low + (high - low) * i / (points - 1) for i in range(points)] if points > 1 else [(low + high) / 2])
+    candidates = []
+    for values in itertools.product(*axes):
+        candidate = _clip(space, dict(zip(names, values)))
+        if candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def neighbours(space, parents, count, scale, rng):
+    """returns count candidates scattered around the parents, scale is the spread as a fraction of every range"""
+    candidates = []
+    for i in range(count):
+        parent = parents[i % len(parents)]
+        candidate = {}
+        for name, value in parent.items():
+            low, high, _ = space[name]
+            candidate[name] = value + rng.gauss(0, scale * (high - low))
+        candidates.append(_clip(space, candidate))
+    return candidates
+
+
+def _evaluate_job(job):
+    """process pool entry point"""
+    name, parameters = job
+    trial = TARGETS[name].scenario(TARGETS[name].arguments(parameters))
+    return parameters, trial.time_ms, trial.error, trial.completed, trial.reason
+
+
+def evaluate(name, candidates, processes=None, pool=None):
+    """runs the scenario of a target for every candidate, returns a list of (parameters, Trial)"""
+    jobs = [(name, candidate) for candidate in candidates]
+    if pool is None or processes == 1:
+        results = [_evaluate_job(job) for job in jobs]
+    else:
+        results = pool.map(_evaluate_job, jobs, chunksize=1)
+    return [(parameters, Trial(time_ms, error, completed, reason)) for parameters, time_ms, error, completed, reason in results]
+
+
+def tune(name, points=3, rounds=4, samples=None, survivors=3, processes=None, seed=0, error_weight=ERROR_WEIGHT, progress=None):
+    """
+    searches the parameters of a target
+    points: grid values per parameter
+    rounds: rounds of adaptive search after the grid, the spread halves every round
+    samples: candidates per round, defaults to twice the number of processes
+    survivors: number of best candidates the next round is scattered around
+    progress: function called with the round number and the best (parameters, Trial) after every round
+    returns every evaluated (parameters, Trial), best first
+    """
+    target = TARGETS[name]
+    processes = processes or multiprocessing.cpu_count()
+    samples = samples or 2 * processes
+    rng = random.Random(seed)
+    key = lambda result: result[1].score(error_weight)
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        results = evaluate(name, grid(target.space, points), processes, pool)
+        results.sort(key=key)
+        if progress is not None:
+            progress(0, results[0])
+        scale = 0.15
+        for i in range(rounds):
+            seen = [parameters for parameters, _ in results]
+            parents = [parameters for parameters, _ in results[:survivors]]
+            candidates = [candidate for candidate in neighbours(target.space, parents, samples, scale, rng) if candidate not in seen]
+            results.extend(evaluate(name, candidates, processes, pool))
+            results.sort(key=key)
+            scale /= 2
+            if progress is not None:
+                progress(i + 1, results[0])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+
+def save_parameters(path, command_name, parameters):
+    """stores the parameters of a command in a parameters file, keeping the other commands' entries"""
+    stored = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            stored = json.load(file)
+    stored[command_name] = parameters
+    with open(path, "w") as file:
+        json.dump(stored, file, indent=4, sort_keys=True)
+
+
+def main():
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="tune the parameters of a command in simulated scenarios")
+    parser.add_argument("target", choices=sorted(TARGETS), help="command to tune")
+    parser.add_argument("--points", type=int, default=3, help="grid values per parameter")
+    parser.add_argument("--rounds", type=int, default=4, help="rounds of adaptive search after the grid")
+    parser.add_argument("--samples", type=int, default=None, help="candidates per round, defaults to twice the number of processes")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, defaults to the number of cores")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the adaptive search")
+    parser.add_argument("--output", default="parameters.json", help="parameters file the winner is written to")
+    args = parser.parse_args()
+
+    def progress(round_number, best):
+        print("round {}: {} -> {}".format(round_number, best[0], best[1]))
+
+    results = tune(args.target, args.points, args.rounds, args.samples, processes=args.processes, seed=args.seed, progress=progress)
+    parameters, trial = results[0]
+    print("{} candidates evaluated".format(len(results)))
+    if not trial.completed:
+        print("no candidate completed the scenario, nothing written")
+        return 1
+    # the fixed parameters are saved too, the tuned ones only hold with the values the scenario ran with
+    target = TARGETS[args.target]
+    arguments = target.arguments(parameters)
+    save_parameters(args.output, target.command_name, arguments)
+    print("wrote {} to {}".format(arguments, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
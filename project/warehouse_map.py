@@ -0,0 +1,302 @@
+#! pylint: disable=line-too-long
+
+"""
+Rasterized warehouse map with fast point and ray queries.
+
+resources/environment.png is converted once into a grid with one byte per cell holding the index in
+enviroment.color_names of the floor color, and the grid is cached next to the image. Later loads memory-map the cache,
+so opening the map costs next to nothing and only the cells that are queried are read from disk.
+Coordinates are in mm with the origin in the bottom left corner of the image and the y axis pointing up.
+"""
+
+import math
+import mmap
+import os
+import struct
+import zlib
+
+import enviroment as env
+
+MM_PER_PX = 2.0
+"""scale of resources/environment.png, the same as planner.MM_PER_PX"""
+
+IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "resources", "environment.png")
+"""path of the warehouse image"""
+
+IMAGE_PALETTE = {
+    "WHITE": (255, 255, 255),
+    "BLACK": (0, 0, 0),
+    "PINK": (102, 0, 0),
+    "BLUE": (0, 0, 102),
+    "GREEN": (0, 102, 0),
+    "BROWN": (102, 51, 0),
+    "PURLE": (102, 102, 0),
+}
+"""screen color of every floor color in the image, pixels take the floor color of the closest one"""
+_PURPLE_ZONE = (102, 0, 102)
+"""the purple zone, classified as PURLE too"""
+
+CACHE_SUFFIX = ".grid"
+_MAGIC = b"EVMAP1"
+_HEADER = struct.Struct("<6sIIfI")
+"""magic, width and height in cells, mm per cell, crc32 of the source image"""
+
+NO_HIT = None
+"""returned by raycast when no solid cell is within range"""
+
+
+def read_png(path):
+    """returns the width, height and rows of rgb bytes of an 8 bit non-interlaced rgb or rgba png"""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("not a png file: " + path)
+    pos = 8
+    header = None
+    compressed = []
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"IDAT":
+            compressed.append(body)
+        elif kind == b"IEND":
+            break
+        pos += 12 + length
+    width, height, depth, color_type, _, _, interlace = header
+    if depth != 8 or color_type not in (2, 6) or interlace:
+        raise ValueError("only 8 bit non-interlaced rgb and rgba png files are supported")
+    channels = 3 if color_type == 2 else 4
+    raw = zlib.decompress(b"".join(compressed))
+    stride = width * channels
+    previous = bytearray(stride)
+    rows = []
+    for y in range(height):
+        start = y * (stride + 1)
+        kind = raw[start]
+        row = bytearray(raw[start + 1:start + 1 + stride])
+        if kind == 1:
+            for i in range(channels, stride):
+                row[i] = (row[i] + row[i - channels]) & 0xFF
+        elif kind == 2:
+            row = bytearray((a + b) & 0xFF for a, b in zip(row, previous))
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                up_left = previous[i - channels] if i >= channels else 0
+                up = previous[i]
+                estimate = left + up - up_left
+                distance_left = abs(estimate - left)
+                distance_up = abs(estimate - up)
+                distance_up_left = abs(estimate - up_left)
+                if distance_left <= distance_up and distance_left <= distance_up_left:
+                    row[i] = (row[i] + left) & 0xFF
+                elif distance_up <= distance_up_left:
+                    row[i] = (row[i] + up) & 0xFF
+                else:
+                    row[i] = (row[i] + up_left) & 0xFF
+        previous = row
+        rows.append(bytes(row) if channels == 3 else bytes(row[i] for i in range(stride) if i % 4 != 3))
+    return width, height, rows
+
+
+def _palette_index(rgb, palette):
+    """returns the color index of the palette entry closest to a screen color"""
+    best = None
+    best_distance = None
+    for index, color in palette:
+        distance = (rgb[0] - color[0]) ** 2 + (rgb[1] - color[1]) ** 2 + (rgb[2] - color[2]) ** 2
+        if best_distance is None or distance < best_distance:
+            best = index
+            best_distance = distance
+    return best
+
+
+def rasterize(path=IMAGE, cell_px=1):
+    """
+    returns the width, height and bytes of the color index grid of an image, with cell_px pixels per cell side
+    the bottom row of the image is the first row of the grid
+    """
+    width, height, rows = read_png(path)
+    palette = [(env.color_names.index(name), color) for name, color in IMAGE_PALETTE.items()]
+    palette.append((env.color_names.index("PURLE"), _PURPLE_ZONE))
+    lookup = {}
+    cells_x = width // cell_px
+    cells_y = height // cell_px
+    grid = bytearray(cells_x * cells_y)
+    for cell_y in range(cells_y):
+        # sample the center pixel of every cell
+        row = rows[height - 1 - (cell_y * cell_px + cell_px // 2)]
+        offset = cell_y * cells_x
+        for cell_x in range(cells_x):
+            i = (cell_x * cell_px + cell_px // 2) * 3
+            rgb = row[i:i + 3]
+            index = lookup.get(rgb)
+            if index is None:
+                index = lookup[rgb] = _palette_index(rgb, palette)
+            grid[offset + cell_x] = index
+    return cells_x, cells_y, bytes(grid)
+
+
+class RasterMap:
+    """
+    a grid of floor color indices with point sampling and raycasts,
+    implements color_at so it can be used as the floor of a simulation.Simulation
+    no color is solid unless solid names it, so by default every raycast returns NO_HIT:
+    a map used as the walls of a simulation.Simulation needs solid, e.g. RasterMap.from_image(solid=("BLACK",))
+    """
+    def __init__(self, width, height, grid, mm_per_cell=MM_PER_PX, solid=()):
+        """
+        Paramaters:
+        width, height: size of the grid in cells
+        grid: bytes-like with a color index per cell, row by row from the bottom
+        mm_per_cell: size of a cell side in mm
+        solid: colors that stop rays, none by default because every color of the warehouse image is paint on the floor,
+               the black zone markers included
+        """
+        self.width = width
+        self.height = height
+        self.grid = grid
+        self.mm_per_cell = mm_per_cell
+        self.solid = None
+        self.set_solid(solid)
+        self._mmap = None
+
+    @classmethod
+    def from_image(cls, path=IMAGE, cell_px=1, cache=True, **kwargs):
+        """
+        loads the map of an image, memory-mapping the cached grid and building the cache when it is missing or stale
+        """
+        with open(path, "rb") as file:
+            checksum = zlib.crc32(file.read())
+        cache_path = path + CACHE_SUFFIX if cell_px == 1 else path + "." + str(cell_px) + CACHE_SUFFIX
+        if cache:
+            loaded = cls.load(cache_path, checksum, **kwargs)
+            if loaded is not None:
+                return loaded
+        width, height, grid = rasterize(path, cell_px)
+        if cache:
+            with open(cache_path, "wb") as file:
+                file.write(_HEADER.pack(_MAGIC, width, height, MM_PER_PX * cell_px, checksum))
+                file.write(grid)
+        return cls(width, height, grid, MM_PER_PX * cell_px, **kwargs)
+
+    @classmethod
+    def load(cls, path, checksum=None, **kwargs):
+        """memory-maps a cached grid, returns None if it is missing or was built from a different image"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < _HEADER.size:
+            mapped.close()
+            return None
+        magic, width, height, mm_per_cell, source_checksum = _HEADER.unpack_from(mapped, 0)
+        if magic != _MAGIC or (checksum is not None and checksum != source_checksum) or len(mapped) != _HEADER.size + width * height:
+            mapped.close()
+            return None
+        loaded = cls(width, height, memoryview(mapped)[_HEADER.size:], mm_per_cell, **kwargs)
+        loaded._mmap = mapped  # pylint: disable=protected-access
+        return loaded
+
+    def close(self):
+        """releases the memory-mapped cache"""
+        if self._mmap is not None:
+            self.grid.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def set_solid(self, colors):
+        """change the colors that stop rays"""
+        solid = bytearray(256)
+        for name in colors:
+            solid[env.color_names.index(name)] = 1
+        self.solid = bytes(solid)
+
+    @property
+    def size(self):
+        """returns the width and height of the map in mm"""
+        return self.width * self.mm_per_cell, self.height * self.mm_per_cell
+
+    def index_at(self, x, y, outside=None):
+        """returns the color index under a point, outside (WHITE if None) for points off the map"""
+        cell_x = int(x // self.mm_per_cell)
+        cell_y = int(y // self.mm_per_cell)
+        if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+            return self.grid[cell_y * self.width + cell_x]
+        return env.color_names.index("WHITE") if outside is None else outside
+
+    def color_at(self, x, y):
+        """returns the name of the floor color under a point"""
+        return env.color_names[self.index_at(x, y)]
+
+    def reflection_at(self, x, y):
+        """returns the reflection in % of the floor under a point"""
+        return env.reflection_list[self.index_at(x, y)]
+
+    def sample(self, points):
+        """returns a bytearray with the color index under every (x, y) point"""
+        grid = self.grid
+        width = self.width
+        height = self.height
+        scale = 1 / self.mm_per_cell
+        white = env.color_names.index("WHITE")
+        out = bytearray(len(points))
+        for i, (x, y) in enumerate(points):
+            cell_x = int(x * scale)
+            cell_y = int(y * scale)
+            out[i] = grid[cell_y * width + cell_x] if 0 <= cell_x < width and 0 <= cell_y < height and x >= 0 and y >= 0 else white
+        return out
+
+    def sample_reflection(self, points):
+        """returns a list with the reflection in % under every (x, y) point"""
+        reflections = env.reflection_list
+        return [reflections[index] for index in self.sample(points)]
+
+    def raycast(self, x, y, heading, max_distance=2550):
+        """
+        returns the distance in mm from a point to the first solid cell along a heading in degrees,
+        NO_HIT if there is none within max_distance or the ray leaves the map, always NO_HIT without solid colors
+        """
+        scale = self.mm_per_cell
+        rad = math.radians(heading)
+        dx = math.cos(rad)
+        dy = math.sin(rad)
+        cell_x = int(x // scale)
+        cell_y = int(y // scale)
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # distance along the ray between vertical and horizontal cell borders, and to the first of each
+        delta_x = abs(scale / dx) if dx else float("inf")
+        delta_y = abs(scale / dy) if dy else float("inf")
+        next_x = ((cell_x + (step_x > 0)) * scale - x) / dx if dx else float("inf")
+        next_y = ((cell_y + (step_y > 0)) * scale - y) / dy if dy else float("inf")
+        grid = self.grid
+        solid = self.solid
+        width = self.width
+        height = self.height
+        travelled = 0.0
+        while travelled <= max_distance:
+            if not (0 <= cell_x < width and 0 <= cell_y < height):
+                return NO_HIT
+            if solid[grid[cell_y * width + cell_x]]:
+                return travelled
+            if next_x < next_y:
+                travelled = next_x
+                next_x += delta_x
+                cell_x += step_x
+            else:
+                travelled = next_y
+                next_y += delta_y
+                cell_y += step_y
+        return NO_HIT
+
+    def raycast_many(self, rays, max_distance=2550):
+        """returns the raycast distance of every (x, y, heading) ray"""
+        raycast = self.raycast
+        return [raycast(x, y, heading, max_distance) for x, y, heading in rays]